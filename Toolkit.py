@@ -3,7 +3,189 @@ import pandas as pd
 from datetime import timedelta, datetime
 import numpy as np
 
-from constants import total_rows_from_source,COLUMNS_TO_DROP_FROM_GOLDEN_SOURCE,OUTPUT_FILE_PATH_TEMPLATE,LOCATION_MAPPING
+from run_context import RunContext
+from dtype_policy import is_categorical, apply_dtype_policy, map_categories
+from dimension_lookup import DimensionIndex
+from group_index import GroupIndex
+from stage_metrics import instrumented_stage
+from job_dimension import job_attributes, JOB_ATTRIBUTES
+from constants import COLUMNS_TO_DROP_FROM_GOLDEN_SOURCE,\
+    ID_KEY_COLS,UNIQUE_ID_KEY_COLS,OUTPUT_ORDER_COLS,ENTRANCE_ACTIVITIES,DISQUALIFIED_ACTIVITIES,TERMINAL_STEPS
+
+def encode_composite_key(input_df: pd.DataFrame, cols: list) -> pd.Series:
+    """
+    Encode a composite key made of several columns into dense int64 codes.
+
+    The codes are sorted like the key tuples and are only unique within input_df : frames encoded
+    separately must be encoded again once concatenated.
+
+    Args:
+        input_df: A pandas DataFrame containing the key columns.
+        cols: The list of column names composing the key.
+
+    Returns:
+        A pandas Series of int64 codes aligned on input_df.
+    """
+
+    keys = []
+    for col in cols:
+        values = input_df[col]
+        if is_categorical(values) and values.cat.categories.is_monotonic_increasing:
+            # Group categorical columns on their codes (sorted like the values), missing values last like dropna=False
+            codes = values.cat.codes.to_numpy()
+            values = pd.Series(np.where(codes == -1, len(values.cat.categories), codes), index=input_df.index)
+        keys.append(values)
+
+    return input_df.groupby(keys, sort=True, dropna=False, observed=True).ngroup().astype('int64')
+
+def composite_key_labels(input_df: pd.DataFrame, key: str, cols: list) -> pd.Series:
+    """
+    Materialize the human-readable label ('<col1>_<col2>_...') of an encoded composite key.
+
+    The labels are built once per distinct code, then mapped back to the rows.
+
+    Args:
+        input_df: A pandas DataFrame containing the encoded key and the columns composing it.
+        key: The column name holding the int64 codes.
+        cols: The list of column names composing the key.
+
+    Returns:
+        A pandas Series of string labels aligned on input_df.
+    """
+
+    distinct_keys = input_df.drop_duplicates(subset=key)
+    labels = distinct_keys[cols[0]].astype(str)
+    for col in cols[1:]:
+        labels = labels + '_' + distinct_keys[col].astype(str)
+
+    return input_df[key].map(pd.Series(labels.values, index=distinct_keys[key].values))
+
+def key_order_labels(input_df: pd.DataFrame, key: str) -> pd.Series:
+    """
+    Get the labels shared_cleaning numbers the rows of a sub dataframe by : the '<Candidate>_<Job>' label of the
+    'ID' key, the values of the other keys.
+
+    Args:
+        input_df: A pandas DataFrame containing the key column (and the columns composing the 'ID' key).
+        key: The column name used as the key.
+
+    Returns:
+        A pandas Series of string labels aligned on input_df.
+    """
+
+    if key == 'ID':
+        return composite_key_labels(input_df, 'ID', ID_KEY_COLS)
+    return input_df[key].astype(str)
+
+def apply_activity_rewrite_rules(input_df: pd.DataFrame, rules: list, group_col: str = 'Candidate',
+                                 activity_col: str = 'New_Activity') -> pd.Series:
+    """
+    Rewrite activities based on the activity of the previous or next row of the same group.
+
+    All the rules are evaluated in a single pass against the original activities, using shifted masks
+    that never cross a group boundary. When several rules match a row, the first one in the list wins.
+
+    Args:
+        input_df: A pandas DataFrame sorted by group and time.
+        rules: A list of dicts with the keys 'activities', 'neighbour' ('previous' or 'next'),
+            'neighbour_activities' and 'new_activity'.
+        group_col: The column name the neighbour rows must share with the current row.
+        activity_col: The column name holding the activities to rewrite.
+
+    Returns:
+        A pandas Series aligned on input_df with the rewritten activities.
+
+    Raises:
+        ValueError: If a rule has a neighbour other than 'previous' or 'next'.
+    """
+
+    activities = input_df[activity_col]
+    groups = input_df[group_col]
+
+    # Neighbour activities, masked out when the neighbour row belongs to another group
+    neighbours = {
+        'previous': activities.shift(1).where(groups.eq(groups.shift(1))),
+        'next': activities.shift(-1).where(groups.eq(groups.shift(-1))),
+    }
+
+    conditions = []
+    choices = []
+    for rule in rules:
+        if rule['neighbour'] not in neighbours:
+            raise ValueError(f"Unknown neighbour {rule['neighbour']} in activity rewrite rule.")
+        conditions.append(activities.isin(rule['activities']).to_numpy() &
+                          neighbours[rule['neighbour']].isin(rule['neighbour_activities']).to_numpy())
+        choices.append(rule['new_activity'])
+
+    if not conditions:
+        return activities.copy()
+
+    rewritten = pd.Series(np.select(conditions, choices, default=activities.to_numpy()),
+                          index=input_df.index, name=activity_col)
+
+    return rewritten.astype('category') if is_categorical(activities) else rewritten
+
+def keep_last_of_runs(input_df: pd.DataFrame, key: str, value_col: str,
+                      time_col: str = 'new_creation_time') -> tuple:
+    """
+    Compact each run of consecutive rows sharing the same value (within a key) to its latest row.
+
+    The frame is sorted by key and time, a run starts whenever the value or the key changes, and the rows
+    holding the maximum time of their run are kept (rows tied on that time are all kept).
+
+    Args:
+        input_df: A pandas DataFrame containing the key, value and time columns.
+        key: The column name identifying a group (an application); runs never span two keys.
+        value_col: The column name whose consecutive repeated values are rolled up.
+        time_col: The column name holding the timestamps.
+
+    Returns:
+        A tuple of the compacted pandas DataFrame (sorted by key and time), the number of rows dropped and the
+        GroupIndex of the key over the compacted rows.
+    """
+
+    sorted_df, groups = GroupIndex(input_df[key], sort_by=input_df[time_col]).sort(input_df)
+
+    # Run boundaries : the value differs from the previous row, or the key changes
+    values = sorted_df[value_col]
+    run_id = ((values != values.shift()).to_numpy() | (groups.cumcount() == 0)).cumsum()
+
+    runs = GroupIndex.from_sorted(run_id)
+    is_run_last = runs.transform(sorted_df[time_col], 'max') == sorted_df[time_col].to_numpy()
+    compacted_df = sorted_df.loc[is_run_last]
+
+    return compacted_df, len(sorted_df) - len(compacted_df), groups.filter(is_run_last)
+
+def application_segmentation(input_df: pd.DataFrame, key: str, activity_col: str = 'New_Activity') -> pd.DataFrame:
+    """
+    Count the applications of each key, from the activities opening and closing an application.
+
+    Both counters come from a single grouped cumulative sum over the integer flags :
+    - Nb_of_appl_entrance : number of entrance activities (applied, sourced, uploaded to job) up to the current row.
+    - Nb_of_appl_disq : 1 + number of disqualifications before the current row.
+
+    Args:
+        input_df: A pandas DataFrame sorted by time within each key.
+        key: The column name used as the key for grouping.
+        activity_col: The column name holding the activities.
+
+    Returns:
+        A pandas DataFrame aligned on input_df with the columns 'Disqualified', 'entrance',
+        'Nb_of_appl_entrance' and 'Nb_of_appl_disq'.
+    """
+
+    segments_df = pd.DataFrame({
+        'Disqualified': input_df[activity_col].isin(DISQUALIFIED_ACTIVITIES).astype(int),
+        'entrance': input_df[activity_col].isin(ENTRANCE_ACTIVITIES).astype(int),
+    }, index=input_df.index)
+
+    cumulative_sum = segments_df.groupby(input_df[key], sort=False).cumsum()
+
+    segments_df['Nb_of_appl_entrance'] = cumulative_sum['entrance']
+    # The disqualifications before the current row are the cumulative sum shifted by 1 within the key
+    segments_df['Nb_of_appl_disq'] = 1 + (cumulative_sum['Disqualified'] - segments_df['Disqualified']).astype(float)
+
+    return segments_df
 
 def shared_cleaning(initial_input_df: pd.DataFrame, key: str) -> pd.DataFrame:
     # Check input types
@@ -11,50 +193,25 @@ def shared_cleaning(initial_input_df: pd.DataFrame, key: str) -> pd.DataFrame:
     assert isinstance(key, str), "key should be a string"
 
     # Find rows with the same activity done at the same time by the same candidate
-    same_activity_df_serie = initial_input_df.groupby(key).apply(lambda x: x.duplicated(subset=['Creation time'], keep=False))
-    same_activity_df = same_activity_df_serie.to_frame()
-    same_activity_df.reset_index(inplace=True)
-    same_activity_df.rename(columns={0: 'Activity_done_same_time_ID'}, inplace=True)
-
-    # Merge the result in the main DataFrame
-    input_df = pd.merge(initial_input_df, same_activity_df, left_index=True, right_on='level_1')
-    input_df = input_df.rename(columns={key+'_x': key}).drop(columns=key+'_y')
-    input_df['new_creation_time'] = input_df ['Creation time']
-
-
-
-    # Create a new column called 'Disqualified' that value 1 when the activity is either disqualified or auto-disqualified
-    def ID_is_disqualified(row):
-        if row['New_Activity'] == "auto-disqualified" or row['New_Activity'] == 'disqualified':
-            return 1
-        return 0
-
-    input_df['Disqualified'] = input_df.apply(lambda row: ID_is_disqualified(row), axis=1)
-
-    # ---- Methodology to count the number of applications a candidate has done ---
-    # create new column entrance = 1 when activity is apply or sourced or upload to job
-    input_df['entrance'] = input_df['New_Activity'].apply(
-        lambda x: 1 if x in ['applied', 'sourced', 'uploaded to job'] else 0)
-    # group the dataframe by ID
-    cumulative_sum = input_df.groupby(key)['entrance'].apply(lambda x: (x == 1).cumsum())
-    # use the 'shift' method to shift the values of 'cumulative_sum' by 1
-    shifted_cumsum = cumulative_sum.groupby(input_df[key])
-    # use the 'fillna' method to replace the NaN values with 0s
-    shifted_cumsum = shifted_cumsum.fillna(0)
-    # assign the values of 'shifted_cumsum' to the 'nb of application' column
-    input_df['Nb_of_appl_entrance'] = shifted_cumsum
-
-    # ---- Methodology to count the number of applications a candidate has done ---
-    # group the dataframe by key
-    cumulative_sum = input_df.groupby(key)['Disqualified'].apply(lambda x: (x == 1).cumsum())
-    # use the 'shift' method to shift the values of 'cumulative_sum' by 1
-    shifted_cumsum = cumulative_sum.groupby(input_df[key]).shift(1)
-    # use the 'fillna' method to replace the NaN values with 0s
-    shifted_cumsum = shifted_cumsum.fillna(0)
-    # assign the values of 'shifted_cumsum' to the 'nb of application' column
-    input_df['Nb_of_appl_disq'] = 1 + shifted_cumsum
+    input_df = initial_input_df.copy()
+    # Index of each row in the input dataframe, kept in the IDs for HR review output
+    input_df['level_1'] = input_df.index
+    input_df['Activity_done_same_time_ID'] = input_df.duplicated(subset=[key, 'Creation time'], keep=False)
+    input_df['new_creation_time'] = input_df['Creation time']
+
+
+
+    # Create the 'Disqualified' and 'entrance' flags and count the number of applications a candidate has done
+    input_df[['Disqualified', 'entrance', 'Nb_of_appl_entrance', 'Nb_of_appl_disq']] = application_segmentation(input_df, key)
     input_df['nb_of_app_difference'] = input_df['Nb_of_appl_entrance'] - input_df['Nb_of_appl_disq']
 
+    # Number the rows in the order of their key label, the rows of a key keeping their order (the level_0 of the
+    # IDs for HR review)
+    row_order = np.argsort(key_order_labels(input_df, key).to_numpy(), kind='stable')
+    row_numbers = np.empty(len(row_order), dtype=np.int64)
+    row_numbers[row_order] = np.arange(len(row_order))
+    input_df.index = row_numbers
+
     return input_df
 
 def shared_processing(input_df: pd.DataFrame, key: str) -> pd.DataFrame:
@@ -85,38 +242,35 @@ def shared_processing(input_df: pd.DataFrame, key: str) -> pd.DataFrame:
     if key not in input_df.columns:
         raise ValueError(f"Key column {key} does not exist in input dataframe.")
 
-    # Add a new column to the DataFrame to indicate whether the sum of
-    # nb_of_app_difference values in each group is evenly divisible by the number of values in the group
+    # Compute all the per-key statistics from a single sort of the key, then broadcast them to the rows of each key
+    groups = GroupIndex(input_df[key])
 
-    def check_disqualification(x):
-        if sum(x['nb_of_app_difference']) != 0:
-            if sum(x['Nb_of_appl_disq']) % sum(x['nb_of_app_difference']) == 0:
-                return 'OK'
-            else:
-                return 'KO'
-        else:
-            return 'OK'
-
-    # Apply the function to each group and then using the results to set the 'ID_disqualified_OK' value for all rows in each group
-    grouped_results = input_df.groupby(key).apply(check_disqualification)
-    input_df['ID_disqualified_OK'] = input_df[key].map(grouped_results)
+    # Indicate whether the sum of Nb_of_appl_disq values in each group is evenly divisible by the sum of nb_of_app_difference
+    sum_app_difference = groups.sum(input_df['nb_of_app_difference'])
+    disqualification_ok = (sum_app_difference == 0) | (
+            groups.sum(input_df['Nb_of_appl_disq']) % np.where(sum_app_difference != 0, sum_app_difference, 1) == 0)
+    input_df['ID_disqualified_OK'] = groups.broadcast(np.where(disqualification_ok, 'OK', 'KO'))
 
     # Calculate number of activities performed by each candidate (grouped by the specified key column)
-    input_df['ID_Nb_Act'] = input_df.groupby([key])['New_Activity'].transform('count')
+    input_df['ID_Nb_Act'] = groups.transform(input_df['New_Activity'], 'count')
 
     # Calculate number of distinct activities performed by each candidate (grouped by the specified key column)
-    input_df['ID_Nb_Act_Distinct'] = input_df.groupby([key])['New_Activity'].transform('nunique')
+    input_df['ID_Nb_Act_Distinct'] = groups.transform(input_df['New_Activity'], 'nunique')
 
     # Calculate number of times each candidate has performed each activity (grouped by both the specified key column and the 'New_Activity' column)
-    input_df['ID_Nb_Replicate_Act'] = input_df.groupby([key, 'New_Activity'])['New_Activity'].transform('count')
+    # (the rows without activity get no count, like the groupby they are left out of)
+    activities = input_df['New_Activity']
+    replicates = GroupIndex([input_df[key], pd.Series(pd.factorize(activities)[0], index=input_df.index)])
+    input_df['ID_Nb_Replicate_Act'] = pd.Series(replicates.broadcast(replicates.count()),
+                                                index=input_df.index).mask(activities.isna())
 
     # Create a new column called 'ID_last_activity' that indicates whether each row represents the last activity performed by each candidate (based on the maximum 'new_creation_time' value for each candidate)
     input_df['ID_last_activity'] = np.where(
-        input_df.groupby(key)['new_creation_time'].transform('max').eq(input_df['new_creation_time']), 1, 0)
+        groups.transform(input_df['new_creation_time'], 'max') == input_df['new_creation_time'].to_numpy(), 1, 0)
 
     # Create a new column called 'ID_first_activity' that indicates whether each row represents the first activity performed by each candidate (based on the minimum 'new_creation_time' value for each candidate)
     input_df['ID_first_activity'] = np.where(
-        input_df.groupby(key)['new_creation_time'].transform('min').eq(input_df['new_creation_time']), 1, 0)
+        groups.transform(input_df['new_creation_time'], 'min') == input_df['new_creation_time'].to_numpy(), 1, 0)
 
     return input_df
 
@@ -124,13 +278,15 @@ def shared_processing(input_df: pd.DataFrame, key: str) -> pd.DataFrame:
 
     ######---------------------- Data Cleaning and preliminary processing  -----------------------------------------#####
 
-def final_processing(concatenated_df: pd.DataFrame) -> pd.DataFrame:
+@instrumented_stage('final')
+def final_processing(concatenated_df: pd.DataFrame, run_context: RunContext) -> pd.DataFrame:
     """
     This function takes a concatenated pandas DataFrame as input and performs several processing steps to generate a modified DataFrame.
     The modified DataFrame includes additional columns generated by the function.
 
     Args:
         concatenated_df: A pandas DataFrame containing the concatenated data.
+        run_context: The context of the current run, collecting the funnel statistics.
 
     Returns:
         A pandas DataFrame with additional columns generated by the function.
@@ -149,63 +305,142 @@ def final_processing(concatenated_df: pd.DataFrame) -> pd.DataFrame:
         raise ValueError("Input dataframe is empty.")
 
     total_rows_without_reffered_a_candidate = len(concatenated_df)
-    # Split the 'new_Job' column by '-'
-    concatenated_df[['Department', 'Job Position', 'Location', 'Specificities']] = concatenated_df['new_Job'].str.split('-', n=3, expand=True)
-
-    # Remove leading/trailing whitespace from the 'Department', 'Job Position', 'Location', and 'Specificities' columns
-    concatenated_df['Department'] = concatenated_df['Department'].str.strip()
-    concatenated_df['Job Position'] = concatenated_df['Job Position'].str.strip()
-    concatenated_df['Location'] = concatenated_df['Location'].str.strip()
-    concatenated_df['Specificities'] = concatenated_df['Specificities'].str.strip()
 
-    # Apply the mapping to create the 'country' column
-    concatenated_df['country'] = concatenated_df['Location'].map(LOCATION_MAPPING)
+    # unique_ID codes are only unique within each processed sub dataframe, encode them again on the concatenated one
+    concatenated_df['unique_ID'] = encode_composite_key(concatenated_df, UNIQUE_ID_KEY_COLS)
 
-    # Replace all departments linked to service team to 'Service Team'
-    concatenated_df['Department_ST'] = concatenated_df['Department'].replace(
-        dict.fromkeys(['IT', 'Marketing', 'Finance', 'Office Management'], 'Service Team'))
+    # Split the 'new_Job' column into 'Department', 'Job Position', 'Location' and 'Specificities', and add the
+    # 'country' of the location and the 'Department_ST' (service team departments grouped), each distinct job
+    # title being parsed once
+    job_attributes_df = job_attributes(concatenated_df['new_Job'])
+    concatenated_df[JOB_ATTRIBUTES] = job_attributes_df
+    concatenated_df = apply_dtype_policy(concatenated_df)
 
 
     # Keep the latest of rollup activity
-    concatenated_df = concatenated_df.sort_values(by=['unique_ID', 'new_creation_time'])
-    concatenated_df['Keep_last_Activity'] = concatenated_df.groupby(
-        ['unique_ID', (concatenated_df['New_Activity'] != concatenated_df['New_Activity'].shift()).cumsum()])[
-        'new_creation_time'].apply(lambda x: (x == x.max()).astype(int))
-    concatenated_df = concatenated_df.loc[concatenated_df['Keep_last_Activity'] == 1]
+    concatenated_df, total_rows_dropped, _ = keep_last_of_runs(concatenated_df, 'unique_ID', 'New_Activity')
+    # Flag of the rows kept by the roll up (all of them), kept in the IDs for HR review output
+    concatenated_df['Keep_last_Activity'] = 1
 
     total_rows_after_keep_roll_up = len(concatenated_df)
-    print(
-        f"Total rows with keep last roll up  : {total_rows_after_keep_roll_up} ({total_rows_after_keep_roll_up/ total_rows_from_source * 100:.2f}%)")
+    run_context.report_rows("Total rows with keep last roll up  :", total_rows_after_keep_roll_up)
 
-    print(
-        f"Total rows dropped in this step: { total_rows_without_reffered_a_candidate - total_rows_after_keep_roll_up }")
+    run_context.report_count("Total rows dropped in this step:", total_rows_dropped)
 
     return concatenated_df
 
-def process_step_stage(unified_df: pd.DataFrame, process_step_df: pd.DataFrame , targets_df: pd.DataFrame ) -> pd.DataFrame:
+def ids_ko_for_hr_review(unified_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Select the rows of the applications whose disqualifications do not add up, to be reviewed manually by HR.
+
+    Args:
+        unified_df: A pandas DataFrame returned by final_processing.
+
+    Returns:
+        A pandas DataFrame of the KO rows, with the human-readable ID ('<Candidate>_<Job>') and unique_ID labels.
+    """
+
+    IDs_KO_for_hr_review_df = unified_df.loc[unified_df['ID_disqualified_OK'] != 'OK'].copy()
+    # The int64 codes are internal to a run, HR reviews the labels
+    IDs_KO_for_hr_review_df['ID'] = composite_key_labels(IDs_KO_for_hr_review_df, 'ID', ID_KEY_COLS)
+    IDs_KO_for_hr_review_df['unique_ID'] = composite_key_labels(IDs_KO_for_hr_review_df, 'unique_ID', UNIQUE_ID_KEY_COLS)
+    # The codes sort like the key columns, the output is sorted by label
+    IDs_KO_for_hr_review_df = IDs_KO_for_hr_review_df.sort_values(by=OUTPUT_ORDER_COLS, kind='stable')
+
+    return IDs_KO_for_hr_review_df
+
+def time_since_anchor_step(input_df: pd.DataFrame, anchor_step: str, groups: GroupIndex,
+                           step_col: str = 'Process_Step', time_col: str = 'cummulative_time_diff_in_days',
+                           eligible: pd.Series = None) -> pd.Series:
+    """
+    Compute, for every row, the time elapsed since the first occurrence of an anchor step within its key group.
+
+    The first anchor row of each group is located once, its `time_col` value is broadcast back to the group
+    and subtracted from every row. Rows before the anchor are clipped to 0, and groups without an anchor get 0.
+
+    Args:
+        input_df: A pandas DataFrame sorted by key and time.
+        anchor_step: The step value used as anchor (e.g. 'Automated test', 'HR Interview', 'Offer').
+        groups: The GroupIndex of the key identifying a group (an application) over the rows of input_df.
+        step_col: The column holding the step values.
+        time_col: The cumulative time column the offset is computed on.
+        eligible: Optional boolean Series restricting which rows may be used as anchor.
+
+    Returns:
+        A pandas Series aligned on input_df with the time since the anchor step.
+    """
+
+    is_anchor = input_df[step_col].eq(anchor_step)
+    if eligible is not None:
+        is_anchor &= eligible
+
+    # First anchor value per key, broadcast back to every row of the key
+    if not is_anchor.any():
+        # No group has an anchor : 0 for every row, as integers
+        return pd.Series(0, index=input_df.index)
+
+    anchor_time_per_row = groups.broadcast(groups.first_where(input_df[time_col], is_anchor))
+
+    return (input_df[time_col] - anchor_time_per_row).clip(lower=0).fillna(0)
+
+def terminal_state_features(input_df: pd.DataFrame, groups: GroupIndex, terminal_steps: dict = TERMINAL_STEPS,
+                            step_col: str = 'Process_Step', time_col: str = 'new_creation_time') -> pd.DataFrame:
+    """
+    Derive the terminal state of every application from its last step, taken once per application.
+
+    Adding a terminal step (e.g. 'Offer declined') to terminal_steps adds its columns, without another pass.
+
+    Args:
+        input_df: A pandas DataFrame sorted by key and time.
+        groups: The GroupIndex of the applications over the rows of input_df.
+        terminal_steps: The flag column and date column (or None) of each terminal step, like TERMINAL_STEPS.
+        step_col: The column holding the step values.
+        time_col: The column holding the timestamps.
+
+    Returns:
+        A pandas DataFrame aligned on input_df with the columns :
+        - 'ID_in_pipeline' : 1 if the last step of the application is not a terminal step, else 0.
+        - the flag column of each terminal step : 1 if the last step of the application is that step, else 0.
+        - the date column of each terminal step : the time the application first reached that step, NaT if never.
+    """
+
+    last_steps = pd.Series(groups.last(input_df[step_col]))
+    steps = input_df[step_col]
+
+    # One value per application, broadcast to its rows at the end
+    group_features = {'ID_in_pipeline': (~last_steps.isin(list(terminal_steps))).to_numpy(dtype=int)}
+    for step, (flag_col, date_col) in terminal_steps.items():
+        group_features[flag_col] = last_steps.eq(step).to_numpy(dtype=int)
+        if date_col is not None:
+            group_features[date_col] = groups.first_where(input_df[time_col], steps.eq(step))
+
+    return pd.DataFrame({col: groups.broadcast(values) for col, values in group_features.items()}, index=input_df.index)
+
+@instrumented_stage('process_step')
+def process_step_stage(unified_df: pd.DataFrame, process_step_df: pd.DataFrame , targets_df: pd.DataFrame,
+                       run_context: RunContext) -> pd.DataFrame:
     """
     Process step stage of data processing pipeline.
 
     :param unified_df: DataFrame containing data to be processed.
     :param process_step_df: DataFrame containing process step data.
+    :param run_context: The context of the current run, collecting the funnel statistics and the IDs for HR review.
     :return: Processed DataFrame.
     """
 
     # format the New_activity Column for further processing
-    process_step_df['New_Activity'] = process_step_df['New_Activity'].str.lower().str.strip()
-    total_rows_before_process_step = len(unified_df)
-    # Create a dictionary mapping New_Activity values to Process_Step values
-    total_rows_after_keep_roll_up = len(unified_df)
+    process_step_df['New_Activity'] = map_categories(process_step_df['New_Activity'],
+                                                     lambda activities: activities.str.lower().str.strip())
+    # The rows enter the stage as final_processing left them, none is dropped before it
     total_rows_before_process_step = len(unified_df)
-    print(f"Total rows before Process Step stage: {total_rows_before_process_step} "
-          f"({total_rows_before_process_step / total_rows_from_source * 100:.2f}%)")
-    print(f"Total rows dropped in this step: {total_rows_after_keep_roll_up - total_rows_before_process_step}")
+    run_context.report_rows("Total rows before Process Step stage:", total_rows_before_process_step)
+    run_context.report_count("Total rows dropped in this step:", 0)
 
     # Merge the two DataFrames on the New_Department and New_Activity columns
     # Create DataFrames for manual review based on the "ID_disqualified_OK" column
 
-    # Drop rows where 'ID_disqualified_OK' is not 'OK'
-    golden_source_df = unified_df.loc[unified_df['ID_disqualified_OK'] == 'OK']
+    # Drop rows where 'ID_disqualified_OK' is not 'OK', a copy as the reference sheet columns are added to it in place
+    golden_source_df = unified_df.loc[unified_df['ID_disqualified_OK'] == 'OK'].copy()
 
     # Get the number of unique values in the 'unique_ID' column of dropped rows
     total_applications_dropped = len(
@@ -215,76 +450,64 @@ def process_step_stage(unified_df: pd.DataFrame, process_step_df: pd.DataFrame ,
     total_rows_without_Kos = len(golden_source_df)
 
     # Calculate total rows dropped in this step
-    total_rows_before_process_step = len(unified_df)
     total_rows_dropped = total_rows_before_process_step - total_rows_without_Kos
 
     # Report the results
-    print(
-        f"Total rows without KOs: {total_rows_without_Kos} ({total_rows_without_Kos / total_rows_from_source * 100:.2f}%)")
-    print(f"Total rows dropped in this step: {total_rows_dropped}")
-    print(f"Total applications dropped at this step : {total_applications_dropped}")
+    run_context.report_rows("Total rows without KOs:", total_rows_without_Kos)
+    run_context.report_count("Total rows dropped in this step:", total_rows_dropped)
+    run_context.report_count("Total applications dropped at this step :", total_applications_dropped)
 
-    IDs_KO_for_hr_review_df = unified_df.loc[unified_df['ID_disqualified_OK'] != 'OK']
+    IDs_KO_for_hr_review_df = ids_ko_for_hr_review(unified_df)
     total_rows_for_HR_review = len(IDs_KO_for_hr_review_df)
-    print(
-        f"Total rows for HR Manual review: {total_rows_for_HR_review} ({total_rows_for_HR_review / total_rows_from_source * 100:.2f}%)")
+    run_context.report_rows("Total rows for HR Manual review:", total_rows_for_HR_review)
 
-    golden_source_df = pd.merge(golden_source_df, process_step_df, on=['Department_ST', 'New_Activity'], how='left')
+    DimensionIndex(process_step_df, ['Department_ST', 'New_Activity'],
+                   name='process step dictionary').add_columns(golden_source_df)
+    golden_source_df.reset_index(drop=True, inplace=True)
 
     # Fill any null values in the "Process Step" column with an empty string
-    golden_source_df['Process_Step'].fillna('', inplace=True)
+    golden_source_df['Process_Step'] = map_categories(golden_source_df['Process_Step'], lambda steps: steps.fillna(''))
 
     total_rows_with_process_step = len(golden_source_df)
-    print(
-        f"Total rows with Process Step: {total_rows_with_process_step} ({total_rows_with_process_step / total_rows_from_source * 100:.2f}%)")
-    print(f"Total rows dropped in this step: {total_rows_without_Kos - total_rows_with_process_step}")
+    run_context.report_rows("Total rows with Process Step:", total_rows_with_process_step)
+    run_context.report_count("Total rows dropped in this step:", total_rows_without_Kos - total_rows_with_process_step)
 
-    # Create two DataFrames based on the "Process Step" column
+    # Drop the rows without Process Step
     golden_source_df = golden_source_df[golden_source_df["Process_Step"] != ""]
-    golden_source_df_without_process = golden_source_df[golden_source_df["Process_Step"] == ""]
-
 
     total_rows_with_process_step_not_blank = len(golden_source_df)
-    print(
-        f"Total rows with Process Step not blank: {total_rows_with_process_step_not_blank} ({total_rows_with_process_step_not_blank / total_rows_from_source * 100:.2f}%)")
-    print(f"Total rows dropped in this step: {total_rows_with_process_step - total_rows_with_process_step_not_blank}")
+    run_context.report_rows("Total rows with Process Step not blank:", total_rows_with_process_step_not_blank)
+    run_context.report_count("Total rows dropped in this step:",
+                             total_rows_with_process_step - total_rows_with_process_step_not_blank)
     # Keep the latest of rollup process
-    golden_source_df = golden_source_df.sort_values(by=['unique_ID', 'new_creation_time'])
-    golden_source_df['Keep_last_Process'] = golden_source_df.groupby(
-        ['unique_ID', (golden_source_df['Process_Step'] != golden_source_df['Process_Step'].shift()).cumsum()])[
-        'new_creation_time'].apply(lambda x: (x == x.max()).astype(int))
-    golden_source_df = golden_source_df.loc[golden_source_df['Keep_last_Process'] == 1]
+    golden_source_df, total_rows_dropped, groups = keep_last_of_runs(golden_source_df, 'unique_ID', 'Process_Step')
+    # Flag of the rows kept by the roll up (all of them), dropped from the golden source with the other work columns
+    golden_source_df['Keep_last_Process'] = 1
 
     total_rows_after_keep_roll_up = len(golden_source_df)
-    print(
-        f"Total rows with keep last roll up: {total_rows_after_keep_roll_up} ({total_rows_after_keep_roll_up / total_rows_from_source * 100:.2f}%)")
-    print(f"Total rows dropped in this step: {total_rows_with_process_step_not_blank - total_rows_after_keep_roll_up}")
+    run_context.report_rows("Total rows with keep last roll up:", total_rows_after_keep_roll_up)
+    run_context.report_count("Total rows dropped in this step:", total_rows_dropped)
+    # All the per-application features below come from the group index of this single sort by unique_ID and time
     # Create a new column called 'ID_last_Process' that indicates whether each row represents the last Process by ID
     golden_source_df['ID_last_Process'] = np.where(
-        golden_source_df.groupby('unique_ID')['new_creation_time'].transform('max').eq(
-            golden_source_df['new_creation_time']), 1, 0)
+        groups.transform(golden_source_df['new_creation_time'], 'max') == golden_source_df['new_creation_time'].to_numpy(), 1, 0)
 
-    IDs_KO_for_hr_review_df.to_excel('IDs_KO_for_hr_review.xlsx', index=False)
-    # Add the time Diffrence between consecutive Process Steps, sort by Time
-    # Sort the DataFrame by 'Candidate' and 'Creation time'
-    golden_source_df = golden_source_df.sort_values(by=['unique_ID', 'new_creation_time'])
+    # The IDs for HR review are an output of the run, written by main.py with the golden source
+    run_context.outputs['ids_ko'] = IDs_KO_for_hr_review_df
+    # Add the time Diffrence between consecutive Process Steps, the rows are already sorted by unique_ID and time
     # Reset the index
     golden_source_df = golden_source_df.reset_index(drop=True)
     # Create a new column to store the time difference in hours
-    golden_source_df['time_diff_in_hours'] = (golden_source_df['new_creation_time'] -
-                                              golden_source_df.groupby('unique_ID')[
-                                                  'new_creation_time'].shift()).dt.total_seconds() // 3600
+    time_since_previous_step = golden_source_df['new_creation_time'] - groups.shift(golden_source_df['new_creation_time'])
+    golden_source_df['time_diff_in_hours'] = time_since_previous_step.dt.total_seconds() // 3600
     golden_source_df['time_diff_in_hours'] = golden_source_df['time_diff_in_hours'].fillna(0).astype(int)
 
     # Create a new column to store the time difference in days as an integer
-    golden_source_df['time_diff_in_days'] = (golden_source_df['new_creation_time'] -
-                                             golden_source_df.groupby('unique_ID')[
-                                                 'new_creation_time'].shift()).dt.total_seconds() / (24 * 3600)
+    golden_source_df['time_diff_in_days'] = time_since_previous_step.dt.total_seconds() / (24 * 3600)
     golden_source_df['time_diff_in_days'] = golden_source_df['time_diff_in_days'].fillna(0).round(2)
 
     # Calculate the cumulative time difference in days for each unique_ID
-    golden_source_df['cummulative_time_diff_in_days'] = golden_source_df.groupby('unique_ID')[
-        'time_diff_in_days'].cumsum()
+    golden_source_df['cummulative_time_diff_in_days'] = groups.cumsum(golden_source_df['time_diff_in_days'])
 
     # Fill missing values in the 'Specificities' column with 'Core'
     golden_source_df['Specificities'] = golden_source_df['Specificities'].fillna('Core')
@@ -299,41 +522,18 @@ def process_step_stage(unified_df: pd.DataFrame, process_step_df: pd.DataFrame ,
     id_is_vanilla_mask = conditions
     id_hr_interview_mask = ~conditions
 
-    golden_source_df['id_is_vanilla'] = golden_source_df['unique_ID'].isin(
-        golden_source_df.loc[id_is_vanilla_mask, 'unique_ID']).astype(int)
-
-    golden_source_df['id_not_vanilla'] = golden_source_df['unique_ID'].isin(
-        golden_source_df.loc[id_hr_interview_mask, 'unique_ID']).astype(int)
-
-
+    golden_source_df['id_is_vanilla'] = groups.transform(id_is_vanilla_mask, 'max').astype(int)
 
-    # Subtract 'auto_test_times' from 'time_diff_in_days' where 'id_is_vanilla' is 1, else 0. Set to 0 if the difference is negative.
-    # Assuming your DataFrame is named 'golden_source_df'
-    def subtract_auto_test(row):
-        auto_test_rows = golden_source_df[(golden_source_df['unique_ID'] == row['unique_ID']) & (
-                    golden_source_df['Process_Step'] == 'Automated test')
-                    & (golden_source_df['id_is_vanilla']  == 1)]
-        if len(auto_test_rows) > 0:
-            result = row['cummulative_time_diff_in_days'] - auto_test_rows['cummulative_time_diff_in_days'].iloc[0]
-            return max(result, 0)  # Replace negative values with 0
-        else:
-            return 0
+    golden_source_df['id_not_vanilla'] = groups.transform(id_hr_interview_mask, 'max').astype(int)
 
-    golden_source_df['Cum_Time_diff_from_autotest'] = golden_source_df.apply(subtract_auto_test, axis=1)
 
-    def subtract_hr_interview(row):
-        auto_test_rows = golden_source_df[(golden_source_df['unique_ID'] == row['unique_ID']) & (
-                golden_source_df['Process_Step'] == 'HR Interview')
 
-                & (golden_source_df['id_is_vanilla']  == 0 )]
+    # Cumulative time since the first 'Automated test' of vanilla applications, and since the first 'HR Interview' of the others
+    golden_source_df['Cum_Time_diff_from_autotest'] = time_since_anchor_step(
+        golden_source_df, 'Automated test', groups, eligible=golden_source_df['id_is_vanilla'] == 1)
 
-        if len(auto_test_rows) > 0:
-            result = row['cummulative_time_diff_in_days'] - auto_test_rows['cummulative_time_diff_in_days'].iloc[0]
-            return max(result, 0)  # Replace negative values with 0
-        else:
-            return 0
-
-    golden_source_df['Cum_Time_diff_from_HR_Interview'] = golden_source_df.apply(subtract_hr_interview, axis=1)
+    golden_source_df['Cum_Time_diff_from_HR_Interview'] = time_since_anchor_step(
+        golden_source_df, 'HR Interview', groups, eligible=golden_source_df['id_is_vanilla'] == 0)
 
     # Initialize the 'autotest_subset_vanilla' column with 0
     golden_source_df['autotest_subset_vanilla'] = 0
@@ -353,35 +553,27 @@ def process_step_stage(unified_df: pd.DataFrame, process_step_df: pd.DataFrame ,
 
 
     # Add a new column to show the previous process step for each application
-    golden_source_df['previous_process_step'] = golden_source_df.groupby('unique_ID')['Process_Step'].shift(1)
-
-    # Add a new column to show whether each application is still in pipeline
-    golden_source_df['ID_in_pipeline'] = golden_source_df.groupby('unique_ID')['Process_Step'].transform(
-        lambda x: int(x.iloc[-1] not in ['Out of Process', 'Hired']))
-
-    # Add a new column to show whether each application has been hired
-    golden_source_df['ID_is_hired'] = golden_source_df.groupby('unique_ID')['Process_Step'].transform(
-        lambda x: int(x.iloc[-1] == 'Hired'))
-
-    # Create a dictionary mapping 'unique_ID' to 'new_creation_time' for rows where 'Process_Step' is 'Hired'
-    hiring_dates_mapping = golden_source_df.loc[golden_source_df['Process_Step'] == 'Hired'].groupby('unique_ID')[
-        'new_creation_time'].first().to_dict()
+    golden_source_df['previous_process_step'] = groups.shift(golden_source_df['Process_Step'])
 
-    # Add the 'id_hiring_date' column to 'golden_source_df' using the mapping
-    golden_source_df['id_hiring_date'] = golden_source_df['unique_ID'].map(hiring_dates_mapping)
-
-    # Add a new column to show whether each application is out of process
-    golden_source_df['ID_is_out_of_process'] = golden_source_df.groupby('unique_ID')['Process_Step'].transform(
-        lambda x: int(x.iloc[-1] == 'Out of Process'))
+    # Add the columns showing whether each application is still in pipeline, hired or out of process, and its hiring date
+    terminal_state_df = terminal_state_features(golden_source_df, groups)
+    golden_source_df[terminal_state_df.columns] = terminal_state_df
 
     # Create a new column named "Stage_advancement" in the DataFrame that concatenates the "Process_Step" column with the "previous_process_step" column
-    golden_source_df['Stage_advancement'] = golden_source_df['previous_process_step'].fillna('') + ' ==> ' + \
-                                            golden_source_df['Process_Step']
+    golden_source_df['Stage_advancement'] = golden_source_df['previous_process_step'].astype(object).fillna('') + ' ==> ' + \
+                                            golden_source_df['Process_Step'].astype(object)
+
+    targets_df['Stage_advancement'] = map_categories(targets_df['Stage_advancement'],
+                                                     lambda advancements: advancements.str.lower().str.strip())
+    golden_source_df['Stage_advancement']=golden_source_df['Stage_advancement'].str.lower().str.strip().astype('category')
+    DimensionIndex(targets_df, ['Department_ST', 'Stage_advancement'], name='targets').add_columns(golden_source_df)
+    golden_source_df.reset_index(drop=True, inplace=True)
 
-    targets_df['Stage_advancement'] = targets_df['Stage_advancement'].str.lower().str.strip()
-    golden_source_df['Stage_advancement']=golden_source_df['Stage_advancement'].str.lower().str.strip()
-    golden_source_df = pd.merge(golden_source_df, targets_df, on=['Department_ST', 'Stage_advancement'], how='left')
 
+    # Replace the unique_ID codes with their human-readable label before dropping the columns composing it
+    golden_source_df['unique_ID'] = composite_key_labels(golden_source_df, 'unique_ID', UNIQUE_ID_KEY_COLS)
+    # The codes sort like the key columns, the output is sorted by label
+    golden_source_df = golden_source_df.sort_values(by=OUTPUT_ORDER_COLS, kind='stable').reset_index(drop=True)
 
     # Drop specified columns from the DataFrame
     try:
@@ -395,15 +587,6 @@ def process_step_stage(unified_df: pd.DataFrame, process_step_df: pd.DataFrame ,
         # Handle any other exceptions that might occur
         print(f"Error: {e} occurred.")
 
-    finally:
-        # Write the updated DataFrame to excel
-        # Create a timestamp using the current date
-        now = datetime.now()
-        timestamp = now.strftime("%d-%m")
-        file_name = OUTPUT_FILE_PATH_TEMPLATE.format(timestamp)
-        # Save the unified DataFrame to an Excel file
-        golden_source_df.to_excel(file_name, index=False)
-
     return golden_source_df
 
 
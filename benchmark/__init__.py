@@ -0,0 +1,6 @@
+"""
+Scaling benchmark of the pipeline on synthetic activity reports, as the real export cannot be shared.
+
+    python -m benchmark.generator --rows 100000 --output activity_report.csv
+    python -m benchmark.harness --sizes 100000 1000000 10000000
+"""
@@ -0,0 +1,236 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+from helper_functions import read_file
+from constants import ACTIVITY_REPORT_COLS, ACTIVITY_REPORT_TIME_FORMAT, ACTIVITY_DICT_PATH, HR_NAMES_PATH, \
+    PROCESS_STEP_PATH, ENTRANCE_ACTIVITIES, DISQUALIFIED_ACTIVITIES, SERVICE_TEAM_DEPARTMENTS
+
+MOVED_TO_JOB_PREFIX = 'Moved to job '
+REVERTED_ACTIVITY = 'Reverted'
+# Name of the activities done by the candidate himself (e.g. 'Applied')
+CANDIDATE_ACTOR = '-'
+
+FIRST_NAMES = ['Ahmed', 'Amina', 'Carlos', 'Fatima', 'Hassan', 'Ines', 'Jorge', 'Karim', 'Laila', 'Lucia', 'Mariam',
+               'Mohamed', 'Nour', 'Omar', 'Pablo', 'Rania', 'Salma', 'Sofia', 'Youssef', 'Zineb']
+LAST_NAMES = ['Alaoui', 'Benali', 'El Amrani', 'Fernandez', 'Garcia', 'Hassan', 'Ibrahim', 'Lopez', 'Mansour', 'Martinez',
+              'Mostafa', 'Rahmani', 'Ramirez', 'Saleh', 'Tazi']
+
+# Tails of an application cycle, after its entrance and the process steps it went through
+TAIL_NONE, TAIL_DISQUALIFIED, TAIL_REVERTED, TAIL_MOVED_TO_JOB = range(4)
+TAIL_LENGTHS = np.array([0, 1, 2, 1])
+
+
+class ReportVocabulary:
+    """
+    The jobs, activities and names a synthetic activity report is drawn from, taken from the reference workbooks.
+
+    The jobs are the 'Department - Position - Location' titles of the 'Moved to job' activities of the dictionary,
+    and each job goes through the process steps of its department, in the order of the process step workbook.
+    """
+
+    def __init__(self, activity_dict_df: pd.DataFrame, hr_names_df: pd.DataFrame, process_step_df: pd.DataFrame,
+                 nb_other_employees: int = 20):
+        activities = activity_dict_df['Activity'].dropna().astype(str).drop_duplicates()
+        is_step = activity_dict_df.loc[activities.index, 'Act_Is_Step'] == 1
+        lowered = activities.str.lower()
+
+        moved_to_job = activities[activities.str.startswith(MOVED_TO_JOB_PREFIX)]
+        self.jobs = sorted(job for job in moved_to_job.str[len(MOVED_TO_JOB_PREFIX):] if job.count(' - ') >= 2)
+        # In the order of the constants, the first one being the most frequent
+        self.entrance_activities = [activities[lowered == activity].iloc[0] for activity in ENTRANCE_ACTIVITIES
+                                    if (lowered == activity).any()]
+        self.disqualified_activities = [activities[lowered == activity].iloc[0] for activity in DISQUALIFIED_ACTIVITIES
+                                        if (lowered == activity).any()]
+        self.noise_activities = activities[~is_step & ~activities.str.startswith(MOVED_TO_JOB_PREFIX)].tolist()
+
+        # Process steps of each department, as the raw activities mapped to their 'New_Activity'
+        activity_by_new_activity = dict(zip(activity_dict_df['New_Activity'], activity_dict_df['Activity']))
+        excluded = set(self.entrance_activities + self.disqualified_activities)
+        steps_df = process_step_df.dropna(subset=['New_Activity'])
+        self.department_steps = {}
+        for department, department_steps_df in steps_df.groupby('Department_ST', sort=False):
+            steps = [activity_by_new_activity.get(new_activity) for new_activity in department_steps_df['New_Activity']]
+            self.department_steps[department] = [step for step in steps if step is not None and step not in excluded]
+
+        self.hr_names = hr_names_df.loc[hr_names_df['Name_Is_HRTeam'] == 1, 'Name'].tolist()
+        self.other_employees = [f"Employee {number}" for number in range(1, nb_other_employees + 1)]
+
+    @classmethod
+    def from_reference_files(cls) -> 'ReportVocabulary':
+        return cls(read_file(ACTIVITY_DICT_PATH), read_file(HR_NAMES_PATH), read_file(PROCESS_STEP_PATH))
+
+    def job_steps(self, job: str) -> list:
+        department = job.split(' - ')[0].strip()
+        if department in SERVICE_TEAM_DEPARTMENTS:
+            department = 'Service Team'
+        return self.department_steps.get(department, [])
+
+
+def generate_activity_report(vocabulary: ReportVocabulary, nb_candidates: int, cycles_per_candidate: float = 1.2,
+                             progress_rate: float = 0.35, disqualified_rate: float = 0.85, reverted_rate: float = 0.01,
+                             moved_to_job_rate: float = 0.03, same_time_rate: float = 0.02,
+                             duplicate_rate: float = 0.01, noise_rate: float = 0.15,
+                             start: str = '2022-01-01', end: str = '2022-12-31', seed: int = 0) -> pd.DataFrame:
+    """
+    Generate a synthetic activity report with the ACTIVITY_REPORT_COLS columns.
+
+    Every candidate goes through one or more application cycles : an entrance activity, the process steps of the job
+    up to a random depth, then optionally a disqualification (followed by a revert or not) or a move to another job.
+    Non step activities (comments, messages, ...) are scattered over the cycles.
+
+    Args:
+        vocabulary: The jobs, activities and names to draw from.
+        nb_candidates: The number of candidates.
+        cycles_per_candidate: The mean number of application cycles of a candidate (at least 1).
+        progress_rate: The probability to go through each next process step.
+        disqualified_rate: The probability a cycle not hired ends disqualified.
+        reverted_rate: The probability a cycle not hired ends disqualified then reverted.
+        moved_to_job_rate: The probability a cycle not hired ends with a move to another job.
+        same_time_rate: The probability a process step has the same timestamp as the previous activity.
+        duplicate_rate: The share of activities duplicated, with equal timestamps.
+        noise_rate: The number of non step activities, relative to the number of cycle activities.
+        start: The first day of the report.
+        end: The last day of the report.
+        seed: The seed of the random generator, the same parameters and seed give the same report.
+
+    Returns:
+        The activity report DataFrame, latest activity first.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Labels of the activities, a cycle activity is drawn as a code into it
+    step_labels = sorted({step for job in vocabulary.jobs for step in vocabulary.job_steps(job)})
+    moved_to_job_labels = [MOVED_TO_JOB_PREFIX + job for job in vocabulary.jobs]
+    labels = pd.Index(list(dict.fromkeys(vocabulary.entrance_activities + vocabulary.disqualified_activities +
+                                         [REVERTED_ACTIVITY] + step_labels + moved_to_job_labels +
+                                         vocabulary.noise_activities)))
+    entrance_codes = labels.get_indexer(vocabulary.entrance_activities)
+    disqualified_codes = labels.get_indexer(vocabulary.disqualified_activities)
+    noise_codes = labels.get_indexer(vocabulary.noise_activities)
+    reverted_code = labels.get_loc(REVERTED_ACTIVITY)
+    moved_to_job_codes = labels.get_indexer(moved_to_job_labels)
+
+    # Process steps of each job, padded into a (job, step) table of codes
+    job_steps = [vocabulary.job_steps(job) for job in vocabulary.jobs]
+    nb_job_steps = np.array([len(steps) for steps in job_steps])
+    steps_table = np.zeros((len(job_steps), max(nb_job_steps.max(), 1)), dtype=np.int64)
+    for job, steps in enumerate(job_steps):
+        steps_table[job, :len(steps)] = labels.get_indexer(steps)
+
+    # Application cycles : a few jobs get most of the applications
+    nb_cycles_by_candidate = rng.geometric(1 / cycles_per_candidate, size=nb_candidates)
+    cycle_candidate = np.repeat(np.arange(nb_candidates), nb_cycles_by_candidate)
+    nb_cycles = len(cycle_candidate)
+    job_weights = 1 / (rng.permutation(len(vocabulary.jobs)) + 1)
+    cycle_job = rng.choice(len(vocabulary.jobs), size=nb_cycles, p=job_weights / job_weights.sum())
+    cycle_depth = np.minimum(rng.geometric(1 - progress_rate, size=nb_cycles) - 1, nb_job_steps[cycle_job])
+    hired = cycle_depth == nb_job_steps[cycle_job]
+    tail_probabilities = [1 - disqualified_rate - reverted_rate - moved_to_job_rate, disqualified_rate,
+                          reverted_rate, moved_to_job_rate]
+    cycle_tail = np.where(hired, TAIL_NONE, rng.choice(4, size=nb_cycles, p=tail_probabilities))
+    cycle_moved_to_job = rng.integers(len(vocabulary.jobs), size=nb_cycles)
+
+    # Activities of the cycles : position 0 is the entrance, then the process steps, then the tail
+    cycle_lengths = 1 + cycle_depth + TAIL_LENGTHS[cycle_tail]
+    cycle_starts = np.cumsum(cycle_lengths) - cycle_lengths
+    event_cycle = np.repeat(np.arange(nb_cycles), cycle_lengths)
+    position = np.arange(len(event_cycle)) - cycle_starts[event_cycle]
+    depth, tail, job = cycle_depth[event_cycle], cycle_tail[event_cycle], cycle_job[event_cycle]
+
+    entrance_probabilities = np.where(np.arange(len(entrance_codes)) == 0, 0.9, 0.1 / max(len(entrance_codes) - 1, 1))
+    codes = rng.choice(entrance_codes, size=len(event_cycle), p=entrance_probabilities / entrance_probabilities.sum())
+    in_steps = (position >= 1) & (position <= depth)
+    codes[in_steps] = steps_table[job[in_steps], position[in_steps] - 1]
+    tail_position = position - depth - 1
+    disqualified = (tail_position == 0) & ((tail == TAIL_DISQUALIFIED) | (tail == TAIL_REVERTED))
+    codes[disqualified] = rng.choice(disqualified_codes, size=disqualified.sum(),
+                                     p=[0.9] + [0.1 / (len(disqualified_codes) - 1)] * (len(disqualified_codes) - 1)
+                                     if len(disqualified_codes) > 1 else None)
+    codes[(tail_position == 1) & (tail == TAIL_REVERTED)] = reverted_code
+    moved = (tail_position == 0) & (tail == TAIL_MOVED_TO_JOB)
+    codes[moved] = moved_to_job_codes[cycle_moved_to_job[event_cycle[moved]]]
+
+    # Timestamps : cycles start over the period, their activities follow each other by hours to days
+    start_time, end_time = pd.Timestamp(start), pd.Timestamp(end) + pd.Timedelta(days=1)
+    period_s = max((end_time - start_time).total_seconds() - 30 * 24 * 3600, 1)
+    cycle_start_s = rng.integers(0, int(period_s), size=nb_cycles)
+    gaps_s = np.where(position == 0, 0, rng.exponential(3 * 24 * 3600, size=len(event_cycle)).astype(np.int64))
+    gaps_s[(position > 0) & (rng.random(len(event_cycle)) < same_time_rate)] = 0
+    elapsed_s = np.cumsum(gaps_s)
+    event_s = cycle_start_s[event_cycle] + elapsed_s - elapsed_s[cycle_starts][event_cycle]
+    event_s = np.minimum(event_s, int((end_time - start_time).total_seconds()) - 1)
+
+    # Actors : the candidate for the applications, the HR team (mostly) or other employees for the rest
+    staff = vocabulary.hr_names + vocabulary.other_employees
+    staff_weights = np.array([0.8 / len(vocabulary.hr_names)] * len(vocabulary.hr_names) +
+                             [0.2 / len(vocabulary.other_employees)] * len(vocabulary.other_employees))
+    name_codes = rng.choice(len(staff), size=len(event_cycle), p=staff_weights / staff_weights.sum())
+    name_labels = staff + [CANDIDATE_ACTOR]
+    applied_code = labels.get_loc(vocabulary.entrance_activities[0])
+    name_codes[(position == 0) & (codes == applied_code)] = len(staff)
+
+    candidate = cycle_candidate[event_cycle]
+
+    # Non step activities, after a cycle activity of the same candidate and job
+    nb_noise = int(noise_rate * len(event_cycle))
+    noise_of = rng.integers(len(event_cycle), size=nb_noise)
+    # Duplicated activities, with equal timestamps
+    duplicate_of = rng.choice(len(event_cycle), size=int(duplicate_rate * len(event_cycle)), replace=False)
+
+    candidate = np.concatenate([candidate, candidate[noise_of], candidate[duplicate_of]])
+    job = np.concatenate([job, job[noise_of], job[duplicate_of]])
+    codes = np.concatenate([codes, rng.choice(noise_codes, size=nb_noise), codes[duplicate_of]])
+    name_codes = np.concatenate([name_codes, rng.choice(len(staff), size=nb_noise), name_codes[duplicate_of]])
+    event_s = np.concatenate([event_s, event_s[noise_of] + rng.integers(1, 3600, size=nb_noise), event_s[duplicate_of]])
+
+    candidate_labels = np.array([f"{FIRST_NAMES[number % len(FIRST_NAMES)]} "
+                                 f"{LAST_NAMES[number // len(FIRST_NAMES) % len(LAST_NAMES)]} {number + 1}"
+                                 for number in range(nb_candidates)], dtype=object)
+    activity_report_df = pd.DataFrame({
+        'Name': pd.Categorical.from_codes(name_codes, categories=name_labels),
+        'Activity': pd.Categorical.from_codes(codes, categories=labels),
+        'Candidate': candidate_labels[candidate],
+        'Job': pd.Categorical.from_codes(job, categories=vocabulary.jobs),
+        'Creation time': start_time + pd.to_timedelta(event_s, unit='s'),
+    }, columns=ACTIVITY_REPORT_COLS)
+
+    return activity_report_df.sort_values('Creation time', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def candidates_for_rows(vocabulary: ReportVocabulary, nb_rows: int, **generator_kwargs) -> int:
+    """
+    Estimate the number of candidates giving an activity report of about nb_rows rows, from a small sample report.
+    """
+    nb_sample_candidates = 10_000
+    sample_df = generate_activity_report(vocabulary, nb_sample_candidates, **generator_kwargs)
+    return max(int(round(nb_rows * nb_sample_candidates / len(sample_df))), 1)
+
+
+def write_activity_report(activity_report_df: pd.DataFrame, file_path: str) -> None:
+    activity_report_df.to_csv(file_path, index=False, date_format=ACTIVITY_REPORT_TIME_FORMAT)
+
+
+def generate_activity_report_file(nb_rows: int, file_path: str, seed: int = 0) -> int:
+    """
+    Generate an activity report of about nb_rows rows from the reference workbooks, and write it as CSV.
+
+    Returns:
+        The number of rows written.
+    """
+    vocabulary = ReportVocabulary.from_reference_files()
+    activity_report_df = generate_activity_report(vocabulary, candidates_for_rows(vocabulary, nb_rows, seed=seed),
+                                                  seed=seed)
+    write_activity_report(activity_report_df, file_path)
+    return len(activity_report_df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic activity report from the reference workbooks.")
+    parser.add_argument('--rows', type=int, required=True, help="Approximate number of rows of the report.")
+    parser.add_argument('--output', required=True, help="Path of the CSV file to write.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random generator.")
+    args = parser.parse_args()
+
+    nb_rows = generate_activity_report_file(args.rows, args.output, seed=args.seed)
+    print(f"{nb_rows} rows written to {args.output}")
@@ -0,0 +1,163 @@
+import argparse
+import json
+import multiprocessing
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import pandas as pd
+
+from benchmark.generator import generate_activity_report_file
+from processing_toolkit import preliminary_processing, not_moved_to_job_data_processor, moved_to_job_data_processor
+from Toolkit import final_processing, process_step_stage
+from ranking_processor import ranking_proc_phase
+from run_context import RunContext
+from parallel_runner import run_candidate_shards
+from dtype_policy import apply_dtype_policy, concat_aligned
+from helper_functions import read_file, read_activity_report
+from stage_metrics import STAGE_METRICS, peak_memory_usage_mb
+from constants import ACTIVITY_DICT_PATH, HR_NAMES_PATH, PROCESS_STEP_PATH, TARGETS_STEP_PATH, RANKING_DICT_PATH, \
+    BENCHMARK_DATA_DIR, BENCHMARK_RESULTS_PATH, BENCHMARK_SIZES
+
+# Slowdown of a stage over the baseline reported as a regression
+REGRESSION_TOLERANCE = 1.2
+
+
+def run_pipeline(activity_report_path: str, workers: int = 1) -> dict:
+    """
+    Run the stages of main.py on an activity report, without writing any output.
+
+    Returns:
+        A dict with the rows of the report, the peak memory of the run and of its workers, and the metrics of
+        the stages summarized by STAGE_METRICS.
+    """
+    warnings.filterwarnings('ignore')
+    STAGE_METRICS.start_run()
+
+    activity_report_df = read_activity_report(activity_report_path)
+    activity_dict_df = apply_dtype_policy(read_file(ACTIVITY_DICT_PATH))
+    hr_names_df = apply_dtype_policy(read_file(HR_NAMES_PATH))
+    process_step_df = apply_dtype_policy(read_file(PROCESS_STEP_PATH))
+    targets_df = apply_dtype_policy(read_file(TARGETS_STEP_PATH))
+    ranking_dict_df = apply_dtype_policy(read_file(RANKING_DICT_PATH))
+    run_context = RunContext(len(activity_report_df), verbose=False)
+
+    moved_to_job_df, not_moved_to_job_df = preliminary_processing(activity_report_df, activity_dict_df, hr_names_df,
+                                                                  run_context)
+    del activity_report_df
+    if workers > 1:
+        run_candidate_shards(moved_to_job_df, not_moved_to_job_df, process_step_df, targets_df, ranking_dict_df,
+                             run_context, workers)
+    else:
+        not_moved_to_job_df = not_moved_to_job_data_processor(not_moved_to_job_df, run_context)
+        moved_to_job_first_only_df, moved_to_job_time_df = moved_to_job_data_processor(moved_to_job_df, run_context)
+        golden_source_df = concat_aligned([not_moved_to_job_df, moved_to_job_first_only_df, moved_to_job_time_df])
+        golden_source_df.drop('level_0', axis=1, inplace=True, errors='ignore')
+        golden_source_df.reset_index(inplace=True)
+        unified_df = final_processing(golden_source_df, run_context)
+        golden_source_df = process_step_stage(unified_df, process_step_df, targets_df, run_context)
+        ranking_proc_phase(golden_source_df, ranking_dict_df)
+
+    stages_df = STAGE_METRICS.summary().reset_index()
+    return {
+        'rows': run_context.total_rows_from_source,
+        'peak_rss_mb': peak_memory_usage_mb(),
+        'peak_worker_rss_mb': peak_memory_usage_mb(children=True) if workers > 1 else None,
+        'stages': stages_df.astype(object).where(stages_df.notna(), None).to_dict('records'),
+    }
+
+
+def in_fresh_process(function, *args):
+    """
+    Run a function in a new (spawned) process, so the peak memory measured is the one of this run alone.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(function, *args).result()
+
+
+def benchmark_size(nb_rows: int, workers: int, data_dir: str, seed: int = 0) -> list:
+    """
+    Benchmark the pipeline on a synthetic activity report of about nb_rows rows, generated once per size and seed.
+
+    Returns:
+        The records of the stages, one per stage, with the size and the peak memory of the run.
+    """
+    activity_report_path = os.path.join(data_dir, f"activity_report_{nb_rows}_{seed}.csv")
+    if not os.path.exists(activity_report_path):
+        print(f"Generating {activity_report_path}")
+        in_fresh_process(generate_activity_report_file, nb_rows, activity_report_path, seed)
+
+    print(f"Running the pipeline on {activity_report_path} with {workers} worker(s)")
+    result = in_fresh_process(run_pipeline, activity_report_path, workers)
+    benchmark_id = datetime.now().isoformat(timespec='seconds')
+
+    return [{'benchmark_id': benchmark_id, 'size': nb_rows, 'rows': result['rows'], 'workers': workers,
+             'run_peak_rss_mb': result['peak_rss_mb'], 'run_peak_worker_rss_mb': result['peak_worker_rss_mb'],
+             **stage} for stage in result['stages']]
+
+
+def read_results(results_path: str) -> pd.DataFrame:
+    with open(results_path, encoding='utf-8') as results_file:
+        return pd.DataFrame([json.loads(line) for line in results_file if line.strip()])
+
+
+def compare_to_baseline(results_df: pd.DataFrame, baseline_df: pd.DataFrame,
+                        tolerance: float = REGRESSION_TOLERANCE) -> pd.DataFrame:
+    """
+    Compare the wall time and peak memory of each stage to the latest baseline run of the same size and workers.
+
+    Returns:
+        The ratios to the baseline by size, workers and stage, with a 'regression' column flagging the stages
+        slower or larger than tolerance times the baseline.
+    """
+    keys = ['size', 'workers', 'stage']
+    metrics = ['wall_time_s', 'peak_rss_mb']
+    baseline_df = baseline_df.drop_duplicates(subset=keys, keep='last')
+    compared_df = results_df[keys + metrics].merge(baseline_df[keys + metrics], on=keys, suffixes=('', '_baseline'))
+    for metric in metrics:
+        compared_df[f'{metric}_ratio'] = (compared_df[metric] / compared_df[f'{metric}_baseline']).round(2)
+    compared_df['regression'] = (compared_df[[f'{metric}_ratio' for metric in metrics]] > tolerance).any(axis=1)
+
+    return compared_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the time and memory of the pipeline stages on synthetic "
+                                                 "activity reports of increasing sizes.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCHMARK_SIZES,
+                        help="Approximate numbers of rows of the activity reports.")
+    parser.add_argument('--workers', type=int, default=1, help="Number of processes of the per-candidate stages.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic activity reports.")
+    parser.add_argument('--data-dir', default=BENCHMARK_DATA_DIR, help="Directory of the synthetic activity reports.")
+    parser.add_argument('--output', default=BENCHMARK_RESULTS_PATH,
+                        help="JSON lines file the results are appended to.")
+    parser.add_argument('--baseline', help="JSON lines results of a previous benchmark to compare to.")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help="Ratio to the baseline above which a stage is reported as a regression.")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    records = []
+    for nb_rows in args.sizes:
+        size_records = benchmark_size(nb_rows, args.workers, args.data_dir, seed=args.seed)
+        # Append after every size, a larger size running out of memory keeps the results of the smaller ones
+        with open(args.output, 'a', encoding='utf-8') as output_file:
+            for record in size_records:
+                output_file.write(json.dumps(record, default=str) + '\n')
+        records.extend(size_records)
+
+    results_df = pd.DataFrame(records)
+    print("Wall time (s) by stage :")
+    print(results_df.pivot(index='stage', columns='rows', values='wall_time_s').reindex(results_df['stage'].unique())
+          .to_string())
+    print("Peak memory (RSS, MB) by stage :")
+    print(results_df.pivot(index='stage', columns='rows', values='peak_rss_mb').reindex(results_df['stage'].unique())
+          .to_string())
+
+    if args.baseline:
+        compared_df = compare_to_baseline(results_df, read_results(args.baseline), tolerance=args.tolerance)
+        print("Comparison to the baseline :")
+        print(compared_df.to_string(index=False))
+        if compared_df['regression'].any():
+            print("Regressions over the baseline found")
+            exit(1)
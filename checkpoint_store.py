@@ -0,0 +1,79 @@
+import os
+import json
+import importlib.util
+import pandas as pd
+
+# Checkpoint modes : no checkpoint, fast columnar files (Parquet) or the legacy Excel dumps
+CHECKPOINT_MODES = ('off', 'columnar', 'excel')
+
+CHECKPOINT_EXTENSIONS = {
+    'columnar': '.parquet',
+    'excel': '.xlsx',
+}
+
+
+class CheckpointStore:
+    """
+    Persists the results of a stage of the StageGraph, named by result and keyed by the fingerprint of the stage.
+
+    The results are stored in '<directory>/<fingerprint>/<result><extension>', so a later run with the same
+    fingerprint can load them instead of running the stage again.
+    """
+
+    def __init__(self, directory: str, mode: str = 'columnar', fingerprint: str = 'default'):
+        # Validate input
+        if mode not in CHECKPOINT_MODES:
+            raise ValueError(f"mode must be one of {CHECKPOINT_MODES}, got {mode}")
+        # Parquet needs pyarrow or fastparquet, fall back to the legacy Excel dumps without them
+        if mode == 'columnar' and not any(importlib.util.find_spec(engine) for engine in ('pyarrow', 'fastparquet')):
+            print("Warning: no parquet engine (pyarrow or fastparquet) installed, checkpoints are saved to Excel.")
+            mode = 'excel'
+        self.mode = mode
+        self.directory = os.path.join(directory, fingerprint)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name + CHECKPOINT_EXTENSIONS[self.mode])
+
+    def save(self, name: str, df: pd.DataFrame) -> None:
+        """
+        Save a DataFrame result, does nothing when checkpoints are off.
+        """
+        if self.mode == 'off':
+            return
+        os.makedirs(self.directory, exist_ok=True)
+
+        if self.mode == 'columnar':
+            df.to_parquet(self._path(name))
+        else:
+            df.to_excel(self._path(name))
+
+    def exists(self, name: str) -> bool:
+        return self.mode != 'off' and os.path.exists(self._path(name))
+
+    def load(self, name: str) -> pd.DataFrame:
+        """
+        Load a saved DataFrame result.
+
+        Raises:
+            FileNotFoundError: If there is no checkpoint of the result.
+        """
+        if not self.exists(name):
+            raise FileNotFoundError(f"Error: no checkpoint of {name} found in {self.directory}")
+
+        if self.mode == 'columnar':
+            return pd.read_parquet(self._path(name))
+        return pd.read_excel(self._path(name), index_col=0)
+
+    def save_metadata(self, metadata: dict) -> None:
+        """
+        Save the metadata of the stage (its manifest) next to its results.
+        """
+        if self.mode == 'off':
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'metadata.json'), 'w') as file:
+            json.dump(metadata, file)
+
+    def load_metadata(self) -> dict:
+        with open(os.path.join(self.directory, 'metadata.json'), 'r') as file:
+            return json.load(file)
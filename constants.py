@@ -1,7 +1,3 @@
-import pandas as pd
-import os
-from helper_functions import read_file
-
 # constants.py
 LOCATION_MAPPING = {
     'Barcelona': 'Spain',
@@ -10,13 +6,49 @@ LOCATION_MAPPING = {
     'Cairo': 'Egypt'
 }
 
+# Rewrite rules applied on 'New_Activity' based on the previous/next activity of the same candidate
+# a row whose activity is in 'activities' becomes 'new_activity' when its 'neighbour' row activity is in 'neighbour_activities'
+ACTIVITY_REWRITE_RULES = [
+    # disqualified then reverted is not a new application : the candidate went out of process and came back
+    {'activities': ['disqualified', 'auto-disqualified'], 'neighbour': 'next',
+     'neighbour_activities': ['reverted'], 'new_activity': 'out of process and back'},
+]
+
+# Departments whose jobs follow the 'Service Team' process steps
+SERVICE_TEAM_DEPARTMENTS = ['IT', 'Marketing', 'Finance', 'Office Management']
+
+# Activities opening (entrance) and closing (disqualified) an application, used to count the applications of a candidate
+ENTRANCE_ACTIVITIES = ['applied', 'sourced', 'uploaded to job']
+DISQUALIFIED_ACTIVITIES = ['disqualified', 'auto-disqualified']
+
+# Process steps ending an application : the column flagging the applications whose last step it is, and the column
+# holding the date the application first reached it (None for no date). An application whose last step is none of
+# them is still in pipeline ('ID_in_pipeline')
+TERMINAL_STEPS = {
+    'Hired': ('ID_is_hired', 'id_hiring_date'),
+    'Out of Process': ('ID_is_out_of_process', None),
+}
 
 # Column names for activity_report
 ACTIVITY_REPORT_COLS = ['Name', 'Activity', 'Candidate', 'Job', 'Creation time']
+# Schema of the activity_report : low cardinality columns are loaded as category, 'Creation time' with a fixed format
+ACTIVITY_REPORT_DTYPES = {'Name': 'category', 'Activity': 'category', 'Candidate': 'object', 'Job': 'category'}
+ACTIVITY_REPORT_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Low cardinality string columns stored as category through the whole pipeline, from the load of the inputs
+CATEGORICAL_COLUMNS = ['Name', 'Activity', 'New_Activity', 'Explanation', 'Job', 'new_Job', 'Department', 'Department_ST',
+                       'Location', 'country', 'Process_Step', 'Stage_advancement']
 ACTIVITY_DICTIONARY_COLS = ['Activity', 'New_Activity', 'Act_Is_Step', 'Explanation']
 HR_NAMES_COLS = ['Name','Name_Is_HRTeam']
 PROCESS_STEP_COLS =['Process_Step','Department_ST','New_Activity']
 TARGETS_COLS =['Department_ST','Stage_advancement','Target Name','Target Value']
+# Columns identifying an entry of the ranking dictionary
+RANKING_DICT_KEY_COLS = ['Department_ST', 'Process_Step', 'updated']
+
+# Columns composing the application keys , encoded as int64 codes during processing
+ID_KEY_COLS = ['Candidate', 'Job']
+UNIQUE_ID_KEY_COLS = ['Candidate', 'new_Job', 'Nb_of_appl_disq']
+# Order of the rows of the outputs : by unique_ID label, then by time
+OUTPUT_ORDER_COLS = ['unique_ID', 'new_creation_time']
 
 
 # File paths for input data and output file
@@ -28,6 +60,30 @@ RANKING_DICT_PATH = r".\input_data\new_ranking_dict.xlsx"
 TARGETS_STEP_PATH = r".\input_data\Targets.xlsx"
 # Outout file
 OUTPUT_FILE_PATH_TEMPLATE = ".\\output_data\\golden_source_df_{}.xlsx"
+RANKED_OUTPUT_FILE_PATH_TEMPLATE = ".\\output_data\\Golden_source_with_ranking_processor-{}.xlsx"
+IDS_KO_FILE_PATH = "IDs_KO_for_hr_review.xlsx"
+# Format of the output files : 'xlsx' (streamed Excel workbooks), 'parquet', 'csv' or 'csv.gz'
+OUTPUT_FORMAT = 'xlsx'
+# Results of the stages of main.py, reused by the next runs while their inputs and code are unchanged,
+# saved as 'columnar' (Parquet) or 'excel' files, or 'off' to run all the stages every time
+CHECKPOINT_MODE = 'columnar'
+STAGE_CHECKPOINT_DIR = r".\temp\stages"
+# Number of independent stages running at the same time (e.g. the loads of the inputs)
+STAGE_THREADS = 4
+# State of the previous run used by the incremental mode
+INCREMENTAL_STATE_DIR = r".\state"
+# Cache of the parsed Excel reference inputs (Parquet copies), evicted above READ_CACHE_MAX_BYTES
+READ_CACHE_DIR = r".\cache"
+READ_CACHE_MAX_BYTES = 200 * 1024 * 1024
+CACHED_EXTENSIONS = ['.xlsx', '.xls']
+# Parsed job titles (department, location, country, ...), kept from one run to the next
+JOB_DIMENSION_CACHE_DIR = r".\cache\job_dimension"
+# Metrics of the pipeline stages, appended as one JSON line per stage call
+STAGE_METRICS_FILE_PATH = '.\\output_data\\stage_metrics.jsonl'
+# Synthetic activity reports and results of the scaling benchmark (python -m benchmark.harness)
+BENCHMARK_DATA_DIR = r".\benchmark_data"
+BENCHMARK_RESULTS_PATH = r".\benchmark_data\benchmark_results.jsonl"
+BENCHMARK_SIZES = [100_000, 1_000_000, 10_000_000]
 # LOG FILES for Console LOG
 LOG_FILE_PATH = '.\\output_data\\console_log.txt'  # Path to your log file
 OUTPUT_LOG_FILE_PATH = '.\\output_data\\console_log.docx'  # Output Word document path
@@ -43,22 +99,14 @@ ERROR_TARGETS_FILE_NOT_FOUND = "Error: targets file not found"
 # Error messages for various processing failures
 ERROR_PRELIMINARY_PROCESSING_FAILED = "Error: preliminary_processing failed with message: {}"
 ERROR_SUB_DATAFRAME_CREATION_FAILED = "Error: sub dataframe creation failed with message: {}"
+ERROR_PROCESS_STEP_FAILED = "Error: process step stage failed with message: {}"
 ERROR_RANKING_PROCESSOR_FAILED = "Error: ranking processor failed with message: {}"
+ERROR_OUTPUT_WRITE_FAILED = "Error: writing the output files failed with message: {}"
 
 # Messages for comments in the output file
 ACTIONS_NOT_IN_RIGHT_ORDER = "Actions not in the right order"
 OK_MESSAGE = "OK"
 
-#Total rows from source
-
-
-
-# File path
-file_path = ACTIVITY_REPORT_PATH
-activity_report_df = read_file(file_path)
-# Calculate the total number of rows
-total_rows_from_source = len(activity_report_df)
-
 COLUMNS_TO_DROP_FROM_GOLDEN_SOURCE = ['level_0','level_1','index','Activity','Job','Creation time','Act_Is_Step','Explanation','act_is_referred','ID','Activity_done_same_time_ID'
         ,'Disqualified','entrance','Nb_of_appl_entrance','Nb_of_appl_disq','nb_of_app_difference','ID_disqualified_OK','ID_Nb_Act'
                        ,'ID_Nb_Act_Distinct','ID_Nb_Replicate_Act','ID_first_activity','Keep_last_Activity','Keep_last_Process']
\ No newline at end of file
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+from dtype_policy import is_categorical
+
+
+def key_codes(values: pd.Series, key_values: pd.Index) -> np.ndarray:
+    """
+    Get the position of every value in key_values, -1 for the values not in it (or missing).
+
+    A categorical column is looked up by its categories only, then its codes are translated.
+    """
+    if is_categorical(values):
+        category_positions = np.append(key_values.get_indexer(values.cat.categories), -1)
+        codes = values.cat.codes.to_numpy()
+        return category_positions[np.where(codes == -1, len(category_positions) - 1, codes)]
+    return key_values.get_indexer(values)
+
+
+class DimensionIndex:
+    """
+    A reference sheet (activity dictionary, process steps, targets, ...) compiled into a unique-key index, to add
+    its columns to a fact table by a vectorized lookup of the codes of the keys instead of a pd.merge.
+
+    The fact table is not copied and keeps its rows : its keys not in the dictionary get missing values, like a
+    left merge. The entries with a missing key value never match any row and are left out of the index.
+    """
+
+    def __init__(self, dimension_df: pd.DataFrame, keys: list, name: str = 'dimension', duplicates: str = 'raise'):
+        """
+        Args:
+            dimension_df: The reference sheet.
+            keys: The column name(s) identifying an entry of the reference sheet.
+            name: The name of the reference sheet, used in the error and warning messages.
+            duplicates: What to do with the entries sharing the same key : 'raise', or 'first' to keep the first
+                of them (in the order of the sheet) and print a warning listing the others.
+
+        Raises:
+            ValueError: If a key column is missing, or if entries share the same key and duplicates is 'raise'
+                (all of them are reported).
+        """
+        keys = [keys] if isinstance(keys, str) else list(keys)
+        # Validate input
+        missing_keys = [key for key in keys if key not in dimension_df.columns]
+        if missing_keys:
+            raise ValueError(f"The {name} has no {missing_keys} column(s)")
+        dimension_df = dimension_df.loc[dimension_df[keys].notna().all(axis=1)]
+        duplicated = dimension_df.duplicated(subset=keys, keep=False)
+        if duplicated.any():
+            if duplicates != 'first':
+                raise ValueError(f"The {name} has several entries for the same {keys} key, fix or remove them :\n"
+                                 f"{dimension_df.loc[duplicated].sort_values(keys).to_string()}")
+            ignored = dimension_df.duplicated(subset=keys, keep='first')
+            print(f"Warning: the {name} has several entries for the same {keys} key, only the first one is used, "
+                  f"these are ignored :\n{dimension_df.loc[ignored].to_string()}")
+            dimension_df = dimension_df.loc[~ignored]
+
+        self.name = name
+        self.keys = keys
+        self.columns = [col for col in dimension_df.columns if col not in keys]
+        self.dimension_df = dimension_df.reset_index(drop=True)
+        # Distinct values of each key, and the entries identified by the combination of their positions
+        self.key_values = [pd.Index(self.dimension_df[key].to_numpy()).unique() for key in keys]
+        self.entries = pd.Index(self.combined_codes(self.dimension_df))
+
+    def combined_codes(self, input_df: pd.DataFrame) -> np.ndarray:
+        """
+        Encode the keys of every row into a single int64 code, -1 when one of its key values is not in the index.
+        """
+        combined = np.zeros(len(input_df), dtype='int64')
+        not_found = np.zeros(len(input_df), dtype=bool)
+        for key, key_values in zip(self.keys, self.key_values):
+            codes = key_codes(input_df[key], key_values)
+            not_found |= codes == -1
+            combined = combined * len(key_values) + codes
+
+        return np.where(not_found, -1, combined)
+
+    def positions(self, fact_df: pd.DataFrame) -> np.ndarray:
+        """
+        Get the position in the reference sheet of the entry of every row of fact_df, -1 when there is none.
+        """
+        missing_keys = [key for key in self.keys if key not in fact_df.columns]
+        if missing_keys:
+            raise ValueError(f"The rows looked up in the {self.name} have no {missing_keys} column(s)")
+        codes = self.combined_codes(fact_df)
+        positions = self.entries.get_indexer(codes)
+
+        return np.where(codes == -1, -1, positions)
+
+    def lookup(self, fact_df: pd.DataFrame, columns: list = None) -> pd.DataFrame:
+        """
+        Get the columns of the entry of every row of fact_df, keeping the dtypes of the reference sheet
+        (categorical columns stay categorical, the rows without entry get missing values).
+
+        Args:
+            fact_df: A pandas DataFrame holding the key columns.
+            columns: The columns of the reference sheet to get, by default all but the keys.
+
+        Returns:
+            A pandas DataFrame of the columns aligned on fact_df.
+        """
+        columns = self.columns if columns is None else columns
+        positions = self.positions(fact_df)
+
+        return pd.DataFrame({col: self.take(col, positions) for col in columns}, index=fact_df.index)
+
+    def take(self, col: str, positions: np.ndarray):
+        """
+        Get the values of a column of the reference sheet at positions, missing where the position is -1.
+        """
+        return pd.api.extensions.take(self.dimension_df[col].values, positions, allow_fill=True)
+
+    def add_columns(self, fact_df: pd.DataFrame, columns: list = None) -> pd.DataFrame:
+        """
+        Add the columns of the entry of every row to fact_df, in place.
+
+        Args:
+            fact_df: A pandas DataFrame holding the key columns, without any of the columns added.
+            columns: The columns of the reference sheet to add, by default all but the keys.
+
+        Returns:
+            fact_df, with the columns added at the end.
+        """
+        columns = self.columns if columns is None else columns
+        existing = [col for col in columns if col in fact_df.columns]
+        if existing:
+            raise ValueError(f"The {self.name} columns {existing} are already in the rows looked up")
+        positions = self.positions(fact_df)
+        for col in columns:
+            fact_df[col] = self.take(col, positions)
+
+        return fact_df
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from constants import CATEGORICAL_COLUMNS
+
+
+def is_categorical(series: pd.Series) -> bool:
+    return isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def apply_dtype_policy(input_df: pd.DataFrame, columns: list = CATEGORICAL_COLUMNS) -> pd.DataFrame:
+    """
+    Convert the low cardinality string columns of a DataFrame to category, with sorted categories.
+
+    The columns missing from the DataFrame, and those already categorical, are left as is.
+
+    Args:
+        input_df: A pandas DataFrame.
+        columns: The column names to store as category.
+
+    Returns:
+        The DataFrame with the columns converted.
+    """
+    to_convert = [col for col in columns if col in input_df.columns and not is_categorical(input_df[col])]
+    if not to_convert:
+        return input_df
+
+    return input_df.astype({col: 'category' for col in to_convert})
+
+
+def map_categories(series: pd.Series, func, as_category: bool = True) -> pd.Series:
+    """
+    Apply an element-wise function (e.g. lambda values: values.str.lower()) to a Series, once per category when
+    the Series is categorical instead of once per row.
+
+    The function sees the missing values too, so the result is the same as applying it to the whole Series.
+    Categories that become equal are merged, and the categories of the result are sorted.
+
+    Args:
+        series: The pandas Series to transform.
+        func: A function taking and returning a pandas Series of the same length.
+        as_category: Return a categorical Series (for string results) or the plain values (e.g. for dates).
+
+    Returns:
+        The transformed pandas Series, aligned on series.
+    """
+    if not is_categorical(series):
+        return func(series)
+
+    # Transform the categories and the missing value (appended last, codes -1 point to it)
+    values = pd.Series(list(series.cat.categories) + [np.nan], dtype=object)
+    mapped = func(values).reset_index(drop=True)
+    codes = series.cat.codes.to_numpy()
+    positions = np.where(codes == -1, len(values) - 1, codes)
+
+    if not as_category:
+        return pd.Series(mapped.take(positions).to_numpy(), index=series.index, name=series.name)
+
+    new_categories = pd.Index(mapped.dropna().unique()).sort_values()
+    new_codes = new_categories.get_indexer(mapped)[positions]
+
+    return pd.Series(pd.Categorical.from_codes(new_codes, categories=new_categories),
+                     index=series.index, name=series.name)
+
+
+def align_categories(input_dfs: list, columns: list = None) -> list:
+    """
+    Give the categorical columns shared by several DataFrames the same (sorted) categories, so that concatenating
+    or joining them keeps the columns categorical.
+
+    Args:
+        input_dfs: A list of pandas DataFrames.
+        columns: The column names to align, by default all the columns categorical in at least one DataFrame.
+
+    Returns:
+        The list of DataFrames with aligned categories.
+    """
+    if columns is None:
+        columns = {col for input_df in input_dfs for col in input_df.columns if is_categorical(input_df[col])}
+
+    aligned_dfs = [input_df.copy(deep=False) for input_df in input_dfs]
+    for col in columns:
+        frames_with_col = [input_df for input_df in aligned_dfs if col in input_df.columns]
+        # Columns stored as strings in one of the frames are converted too
+        for input_df in frames_with_col:
+            if not is_categorical(input_df[col]):
+                input_df[col] = input_df[col].astype('category')
+        # Columns without any value have categories of another dtype, they take the categories of the others
+        with_values = [input_df[col] for input_df in frames_with_col if len(input_df[col].cat.categories)]
+        if not with_values:
+            continue
+        categories = union_categoricals(with_values, sort_categories=True, ignore_order=True).categories
+        for input_df in frames_with_col:
+            if not input_df[col].cat.categories.equals(categories):
+                input_df[col] = input_df[col].cat.set_categories(categories)
+
+    return aligned_dfs
+
+
+def concat_aligned(input_dfs: list, **concat_kwargs) -> pd.DataFrame:
+    """
+    pd.concat keeping the categorical columns categorical, whatever the categories of each DataFrame.
+    """
+    return pd.concat(align_categories(input_dfs), **concat_kwargs)
+
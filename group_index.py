@@ -0,0 +1,258 @@
+import numpy as np
+import pandas as pd
+
+
+def _array(values):
+    """
+    Get the values of a Series as an array keeping their dtype (categorical, ...), or of any sequence as numpy array.
+    """
+    if isinstance(values, pd.Series) and pd.api.types.is_extension_array_dtype(values):
+        return values.array
+    return np.asarray(values)
+
+
+class GroupIndex:
+    """
+    The groups of a key (an application, a candidate, ...) compiled once from a stable sort, to compute the
+    per-group features by reductions over contiguous segments instead of hashing the key again for every groupby.
+
+    The rows keep the order of the frame : `order` holds the positions of the rows sorted by group (groups in the
+    order of their key values, rows by sort_by then by position), group g being the segment
+    order[starts[g]:starts[g] + lengths[g]]. The group-level results hold one value per group, the row-level
+    results are arrays aligned on the rows of the frame.
+    """
+
+    def __init__(self, keys, sort_by: pd.Series = None):
+        """
+        Args:
+            keys: The key column, or a list of key columns, identifying the group of every row.
+            sort_by: The column ordering the rows within a group (e.g. the creation time), by default their position.
+
+        Raises:
+            ValueError: If a key has missing values.
+        """
+        keys = [keys] if isinstance(keys, pd.Series) else list(keys)
+        codes = np.zeros(len(keys[0]), dtype='int64')
+        for key in keys:
+            key_codes, key_values = pd.factorize(key, sort=True)
+            if (key_codes == -1).any():
+                raise ValueError(f"The {key.name} key has missing values, their rows would belong to no group")
+            codes = codes * len(key_values) + key_codes
+
+        if sort_by is None:
+            order = np.argsort(codes, kind='stable')
+        else:
+            order = np.lexsort((np.asarray(sort_by), codes))
+        self._compile(order, codes[order])
+
+    def _compile(self, order: np.ndarray, sorted_keys: np.ndarray) -> None:
+        """
+        Build the segments from the rows sorted by group and their group key (any value identifying the group).
+        """
+        is_start = np.ones(len(order), dtype=bool)
+        is_start[1:] = sorted_keys[1:] != sorted_keys[:-1]
+
+        self.order = order
+        self.size = len(order)
+        self.starts = np.flatnonzero(is_start)
+        self.lengths = np.diff(np.append(self.starts, self.size))
+        self.nb_groups = len(self.starts)
+        # Group of every row, in the sorted order and in the order of the frame
+        self.sorted_groups = np.cumsum(is_start) - 1
+        self.row_groups = self._unsort(self.sorted_groups)
+
+    @classmethod
+    def from_sorted(cls, sorted_keys) -> 'GroupIndex':
+        """
+        Get the index of rows already sorted by group (the rows of each group contiguous), without sorting nor
+        hashing : a group starts wherever the key changes.
+        """
+        sorted_keys = np.asarray(sorted_keys)
+        return cls._from_layout(np.arange(len(sorted_keys)), sorted_keys)
+
+    @classmethod
+    def _from_layout(cls, order: np.ndarray, sorted_groups: np.ndarray) -> 'GroupIndex':
+        groups = cls.__new__(cls)
+        groups._compile(order, sorted_groups)
+        return groups
+
+    def filter(self, mask) -> 'GroupIndex':
+        """
+        Get the index of the rows kept by a boolean mask, without sorting again : the kept rows stay sorted.
+        The groups left without row are removed.
+
+        Args:
+            mask: A boolean array or Series aligned on the rows, True for the rows kept (in their order).
+        """
+        mask = np.asarray(mask, dtype=bool)
+        kept = mask[self.order]
+        new_positions = np.cumsum(mask) - 1
+
+        return self._from_layout(new_positions[self.order[kept]], self.sorted_groups[kept])
+
+    def sort(self, input_df: pd.DataFrame) -> tuple:
+        """
+        Sort the rows of a frame by group, then by sort_by within each group (stable, like sort_values).
+
+        Returns:
+            A tuple of the sorted pandas DataFrame (with its index) and the GroupIndex of its rows.
+        """
+        return input_df.iloc[self.order], self._from_layout(np.arange(self.size), self.sorted_groups)
+
+    # ---- Group-level reductions : one value per group ----
+
+    def _sorted(self, values) -> np.ndarray:
+        return np.asarray(values)[self.order]
+
+    def _unsort(self, sorted_values: np.ndarray) -> np.ndarray:
+        values = np.empty_like(sorted_values)
+        values[self.order] = sorted_values
+        return values
+
+    def _reduce(self, ufunc, values) -> np.ndarray:
+        sorted_values = self._sorted(values)
+        if self.nb_groups == 0:
+            return sorted_values[:0]
+        return ufunc.reduceat(sorted_values, self.starts)
+
+    def sum(self, values) -> np.ndarray:
+        """
+        Sum of the values of each group, the missing values being skipped.
+        """
+        if np.asarray(values).dtype.kind != 'f':
+            return self._reduce(np.add, values)
+        # Floats are summed like groupby().sum(), the sum being the cumulative sum of the last row
+        return self._compensated_cumsum(self._sorted(values))[self.starts + self.lengths - 1]
+
+    def max(self, values) -> np.ndarray:
+        """
+        Maximum of the values (numbers, datetimes or booleans) of each group, the missing values being skipped.
+        """
+        return self._reduce(np.fmax, values)
+
+    def min(self, values) -> np.ndarray:
+        """
+        Minimum of the values (numbers, datetimes or booleans) of each group, the missing values being skipped.
+        """
+        return self._reduce(np.fmin, values)
+
+    def count(self, values=None) -> np.ndarray:
+        """
+        Number of rows of each group, or of non-missing values when values are given.
+        """
+        if values is None:
+            return self.lengths
+        return self._reduce(np.add, pd.notna(values).astype('int64'))
+
+    def nunique(self, values: pd.Series) -> np.ndarray:
+        """
+        Number of distinct non-missing values of each group.
+        """
+        codes = self._sorted(pd.factorize(values)[0])
+        # Rows sorted by (group, value) : a distinct value of a group starts wherever the pair changes
+        pair_order = np.lexsort((codes, self.sorted_groups))
+        groups, codes = self.sorted_groups[pair_order], codes[pair_order]
+        is_distinct = np.ones(self.size, dtype=bool)
+        is_distinct[1:] = (groups[1:] != groups[:-1]) | (codes[1:] != codes[:-1])
+
+        return np.bincount(groups[is_distinct & (codes != -1)], minlength=self.nb_groups)
+
+    def first(self, values):
+        """
+        Value of the first row of each group (missing or not, like nth(0)), keeping the dtype of values.
+        """
+        return pd.api.extensions.take(_array(values), self.order[self.starts])
+
+    def last(self, values):
+        """
+        Value of the last row of each group (missing or not, like nth(-1)), keeping the dtype of values.
+        """
+        return pd.api.extensions.take(_array(values), self.order[self.starts + self.lengths - 1])
+
+    def first_where(self, values, mask):
+        """
+        Value of the first row of each group where mask is True, missing for the groups without such row.
+        """
+        row_positions = np.where(self._sorted(mask), np.arange(self.size), self.size)
+        first_positions = self._reduce(np.minimum, self._unsort(row_positions))
+        found = first_positions < self.size
+        positions = np.where(found, self.order[np.where(found, first_positions, 0)], -1)
+
+        return pd.api.extensions.take(_array(values), positions, allow_fill=True)
+
+    # ---- Row-level results : one value per row, aligned on the frame ----
+
+    def broadcast(self, group_values):
+        """
+        Give every row the value of its group.
+        """
+        return pd.api.extensions.take(group_values, self.row_groups)
+
+    def transform(self, values, how: str):
+        """
+        Give every row the reduction of its group, how being the name of a reduction ('max', 'sum', 'first', ...).
+        """
+        return self.broadcast(getattr(self, how)(values))
+
+    def cumcount(self) -> np.ndarray:
+        """
+        Position of every row within its group, starting at 0.
+        """
+        return self._unsort(np.arange(self.size) - self.starts[self.sorted_groups])
+
+    def shift(self, values, periods: int = 1):
+        """
+        Value of the row `periods` rows before within the group, missing when there is none (the dtype is upcast
+        to hold the missing values like Series.shift, categoricals stay categorical).
+        """
+        source = np.arange(self.size) - periods
+        segment_starts = self.starts[self.sorted_groups]
+        in_group = (source >= segment_starts) & (source < segment_starts + self.lengths[self.sorted_groups])
+        positions = self._unsort(np.where(in_group, self.order[np.where(in_group, source, 0)], -1))
+
+        return pd.api.extensions.take(_array(values), positions, allow_fill=True)
+
+    def diff(self, values, periods: int = 1) -> np.ndarray:
+        """
+        Difference with the value of the row `periods` rows before within the group, missing when there is none.
+        """
+        return np.asarray(values) - self.shift(values, periods)
+
+    def cumsum(self, values) -> np.ndarray:
+        """
+        Cumulative sum of the values within each group, the missing values being skipped (and left missing).
+
+        Floats are summed row after row with the compensated summation of groupby().cumsum(), which gives the very
+        same results : the k-th rows of all the groups are added at once.
+        """
+        sorted_values = self._sorted(values)
+        if sorted_values.dtype.kind in 'biu':
+            totals = np.cumsum(sorted_values.astype('int64'))
+            before_group = (totals - sorted_values)[self.starts]
+            return self._unsort(totals - before_group[self.sorted_groups])
+
+        sums = self._compensated_cumsum(sorted_values)
+        sums[np.isnan(sorted_values)] = np.nan
+
+        return self._unsort(sums)
+
+    def _compensated_cumsum(self, sorted_values: np.ndarray) -> np.ndarray:
+        """
+        Cumulative sum within each group of the sorted float values, a missing value keeping the previous sum.
+        """
+        is_missing = np.isnan(sorted_values)
+        sums = np.where(is_missing, 0, sorted_values).astype(float)
+        # Groups by decreasing length : the groups having a k-th row come first
+        by_length = np.argsort(-self.lengths, kind='stable')
+        decreasing_lengths = -self.lengths[by_length]
+        compensation = np.zeros(self.nb_groups)
+        for k in range(1, self.lengths.max(initial=0)):
+            nb_active = np.searchsorted(decreasing_lengths, -k, side='left')
+            positions = self.starts[by_length[:nb_active]] + k
+            previous, skipped = sums[positions - 1], is_missing[positions]
+            value = sums[positions] - compensation[:nb_active]
+            total = previous + value
+            compensation[:nb_active] = np.where(skipped, compensation[:nb_active], (total - previous) - value)
+            sums[positions] = np.where(skipped, previous, total)
+
+        return sums
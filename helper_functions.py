@@ -1,9 +1,15 @@
 import docx
 from docx import Document
 import sys,os , logging
+import hashlib
+import json
+import importlib.util
 from colorama import init, Fore, Style
 import pandas as pd
 from pprint import pprint
+from constants import READ_CACHE_DIR, READ_CACHE_MAX_BYTES, CACHED_EXTENSIONS, ACTIVITY_REPORT_COLS, \
+    ACTIVITY_REPORT_DTYPES, ACTIVITY_REPORT_TIME_FORMAT
+from stage_metrics import instrumented_stage
 
 
 # Initialize colorama
@@ -70,7 +76,7 @@ def export_to_word(log_file, output_file):
     # Save the document
     doc.save(output_file)
 
-def read_file(file_path: str) -> pd.DataFrame:
+def read_file(file_path: str, cache_dir: str = READ_CACHE_DIR) -> pd.DataFrame:
     # Derive the file extension using os module
 
     SUPPORTED_EXTENSIONS = {
@@ -106,14 +112,123 @@ def read_file(file_path: str) -> pd.DataFrame:
     # Retrieve the appropriate read function based on the file extension
     read_function = READ_FUNCTIONS[file_extension]
 
-    # Read the file using the read function
+    # Read the file using the read function, Excel workbooks are served from the cache when unchanged
+    if cache_dir and file_extension in CACHED_EXTENSIONS:
+        df = cached_read(file_path, read_function, cache_dir)
+    else:
+        df = read_function(file_path)
+
+    return df
+
+def cached_read(file_path: str, read_function, cache_dir: str, max_cache_bytes: int = READ_CACHE_MAX_BYTES) -> pd.DataFrame:
+    """
+    Reads a file through a cache storing a Parquet copy of the parsed DataFrame.
+
+    The copy is keyed by the content hash of the file, and the (path, mtime, size) of the last read is kept
+    so an unchanged file is served without being hashed again. A changed file gets a new hash, hence a new copy.
+    The least recently used copies are evicted once the cache directory exceeds max_cache_bytes.
+    """
+    # Parquet needs pyarrow or fastparquet, read the file directly without them
+    if not any(importlib.util.find_spec(engine) for engine in ('pyarrow', 'fastparquet')):
+        return read_function(file_path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    file_stat = os.stat(file_path)
+    path_key = hashlib.sha256(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+    entry_path = os.path.join(cache_dir, path_key + '.json')
+
+    # Reuse the content hash of the last read when the file has not been modified since
+    entry = {}
+    if os.path.exists(entry_path):
+        with open(entry_path, 'r') as file:
+            entry = json.load(file)
+    if entry.get('mtime_ns') == file_stat.st_mtime_ns and entry.get('size') == file_stat.st_size:
+        content_hash = entry['content_hash']
+    else:
+        content_hash = file_fingerprint(file_path)
+        with open(entry_path, 'w') as file:
+            json.dump({'path': os.path.abspath(file_path), 'mtime_ns': file_stat.st_mtime_ns,
+                       'size': file_stat.st_size, 'content_hash': content_hash}, file)
+
+    cached_path = os.path.join(cache_dir, content_hash + '.parquet')
+    if os.path.exists(cached_path):
+        # Mark the copy as recently used for the eviction
+        os.utime(cached_path)
+        return pd.read_parquet(cached_path)
+
     df = read_function(file_path)
+    try:
+        df.to_parquet(cached_path)
+    except Exception as e:
+        # Some sheets cannot be stored as Parquet (e.g. columns mixing numbers and text), they are not cached
+        print(f"Warning: {file_path} could not be cached : {e}")
+        if os.path.exists(cached_path):
+            os.remove(cached_path)
+    evict_cache(cache_dir, max_cache_bytes)
+
+    return df
+
+def evict_cache(cache_dir: str, max_cache_bytes: int) -> None:
+    """
+    Removes the least recently used Parquet copies until the cache directory fits in max_cache_bytes.
+    """
+    cached_files = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith('.parquet')]
+    cached_files.sort(key=os.path.getmtime)
+
+    total_bytes = sum(os.path.getsize(path) for path in cached_files)
+    for path in cached_files:
+        if total_bytes <= max_cache_bytes:
+            break
+        total_bytes -= os.path.getsize(path)
+        os.remove(path)
+
+def file_fingerprint(*file_paths: str) -> str:
+    """
+    Returns a short hash of the content of the given files, used to key the data derived from them.
+    """
+    digest = hashlib.sha256()
+    for file_path in file_paths:
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+    return digest.hexdigest()[:16]
+
+def read_csv_header(file_path: str) -> pd.DataFrame:
+    """
+    Reads only the header of a CSV file, as an empty DataFrame with its columns.
+    """
+    return pd.read_csv(file_path, nrows=0)
+
+@instrumented_stage('load')
+def read_activity_report(file_path: str) -> pd.DataFrame:
+    """
+    Reads the activity report CSV with its declared schema : only the ACTIVITY_REPORT_COLS columns are loaded,
+    with the ACTIVITY_REPORT_DTYPES dtypes, and 'Creation time' is parsed with ACTIVITY_REPORT_TIME_FORMAT.
+    The multithreaded pyarrow parser is used when it is installed.
+    """
+    # Match the schema columns to the header columns the same way validate_dataframe does
+    schema_cols = {col.strip().lower(): col for col in ACTIVITY_REPORT_COLS}
+    header_cols = [col for col in read_csv_header(file_path).columns if col.strip().lower() in schema_cols]
+    dtypes = {col: ACTIVITY_REPORT_DTYPES[schema_cols[col.strip().lower()]] for col in header_cols
+              if schema_cols[col.strip().lower()] in ACTIVITY_REPORT_DTYPES}
+
+    engine = 'pyarrow' if importlib.util.find_spec('pyarrow') else 'c'
+    df = pd.read_csv(file_path, usecols=header_cols, dtype={col: 'object' for col in dtypes}, engine=engine)
+    df = df.astype(dtypes)
+
+    try:
+        df['Creation time'] = pd.to_datetime(df['Creation time'], format=ACTIVITY_REPORT_TIME_FORMAT)
+    except ValueError:
+        print(f"Warning: 'Creation time' does not match the format {ACTIVITY_REPORT_TIME_FORMAT}, parsing it without format.")
+        df['Creation time'] = pd.to_datetime(df['Creation time'])
 
     return df
 
-def validate_dataframe(df, required_cols):
+def validate_dataframe(df, required_cols, check_empty: bool = True):
     """
     Validates the dataframe for required columns and emptiness.
+    Use check_empty=False to validate the columns of a header only dataframe.
     """
     assert isinstance(df, pd.DataFrame), "Input must be a pandas DataFrame"
 
@@ -127,7 +242,7 @@ def validate_dataframe(df, required_cols):
         return False
 
     # Check if the dataframe is empty
-    if df.empty:
+    if check_empty and df.empty:
         print("Dataframe is empty.")
         return False
 
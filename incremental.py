@@ -0,0 +1,90 @@
+import os
+import pandas as pd
+from constants import ACTIVITY_REPORT_COLS, OUTPUT_ORDER_COLS
+from dtype_policy import concat_aligned
+
+
+class IncrementalState:
+    """
+    Stores the state of the previous run needed to re-process only the candidates that changed since :
+    the golden source (before the ranking phase), the IDs for HR review and the fingerprint of the activity rows of
+    each candidate.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.golden_source_path = os.path.join(directory, 'golden_source.pickle')
+        self.ids_ko_path = os.path.join(directory, 'ids_ko.pickle')
+        self.fingerprints_path = os.path.join(directory, 'candidate_fingerprints.pickle')
+
+    def exists(self) -> bool:
+        return all(os.path.exists(path) for path in (self.golden_source_path, self.ids_ko_path, self.fingerprints_path))
+
+    def load(self) -> tuple:
+        """
+        Returns a tuple of the previous golden source, IDs for HR review and candidate fingerprints DataFrames.
+        """
+        return pd.read_pickle(self.golden_source_path), pd.read_pickle(self.ids_ko_path), \
+            pd.read_pickle(self.fingerprints_path)
+
+    def save(self, golden_source_df: pd.DataFrame, ids_ko_df: pd.DataFrame, fingerprints_df: pd.DataFrame) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        golden_source_df.to_pickle(self.golden_source_path)
+        ids_ko_df.to_pickle(self.ids_ko_path)
+        fingerprints_df.to_pickle(self.fingerprints_path)
+
+
+def candidate_fingerprints(activity_report_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Computes a fingerprint of the activity rows of each candidate : the number of rows and the sum of the row hashes,
+    which does not depend on the order of the rows in the report.
+
+    Args:
+        activity_report_df: The activity report DataFrame.
+
+    Returns:
+        A DataFrame indexed by Candidate with the columns 'nb_rows' and 'rows_hash'.
+    """
+    row_hashes = pd.util.hash_pandas_object(activity_report_df[ACTIVITY_REPORT_COLS], index=False)
+
+    # Sum the hashes as int64, overflows wrap around which keeps the sum usable as a fingerprint
+    fingerprints_df = pd.DataFrame({
+        'Candidate': activity_report_df['Candidate'].to_numpy(),
+        'nb_rows': 1,
+        'rows_hash': row_hashes.to_numpy().view('int64'),
+    })
+    return fingerprints_df.groupby('Candidate', dropna=False).sum()
+
+
+def changed_candidates(previous_fingerprints_df: pd.DataFrame, fingerprints_df: pd.DataFrame) -> pd.Index:
+    """
+    Returns the candidates that are new, changed or removed between the previous and the current fingerprints.
+    """
+    aligned_df = previous_fingerprints_df.join(fingerprints_df, how='outer', lsuffix='_previous')
+    changed = (aligned_df['nb_rows_previous'] != aligned_df['nb_rows']) | \
+              (aligned_df['rows_hash_previous'] != aligned_df['rows_hash'])
+
+    return aligned_df.index[changed.to_numpy()]
+
+
+def splice_candidates(previous_df: pd.DataFrame, delta_df: pd.DataFrame, candidates: pd.Index) -> pd.DataFrame:
+    """
+    Replaces the rows of the given candidates in the previous DataFrame by the rows of the re-processed DataFrame.
+
+    Args:
+        previous_df: The DataFrame of the previous run.
+        delta_df: The DataFrame computed for the changed candidates only, None when nothing was re-processed.
+        candidates: The changed candidates, their previous rows are dropped.
+
+    Returns:
+        The spliced DataFrame, in the order of a full run.
+    """
+    kept_df = previous_df.loc[~previous_df['Candidate'].isin(candidates)]
+    if delta_df is None or delta_df.empty:
+        return kept_df
+
+    # Columns empty in one of the frames (e.g. a hiring date) fall back to object in the concat, infer them back
+    spliced_df = concat_aligned([kept_df, delta_df], ignore_index=True).infer_objects()
+    # A full run orders the rows by unique_ID label and time : the rows of an application all come from one of the
+    # frames, in that order already, a stable sort on the same columns restores it
+    return spliced_df.sort_values(by=OUTPUT_ORDER_COLS, kind='stable').reset_index(drop=True)
@@ -0,0 +1,139 @@
+import os
+import json
+import hashlib
+import importlib.util
+import numpy as np
+import pandas as pd
+from dtype_policy import is_categorical
+from constants import LOCATION_MAPPING, SERVICE_TEAM_DEPARTMENTS, JOB_DIMENSION_CACHE_DIR
+
+# Parts of a 'Department - Job Position - Location - Specificities' job title
+JOB_TITLE_PARTS = ['Department', 'Job Position', 'Location', 'Specificities']
+# Attributes of a job title, in the order they are added to the rows
+JOB_ATTRIBUTES = JOB_TITLE_PARTS + ['country', 'Department_ST']
+# Attributes stored as category on the rows, the others (free text) as object
+CATEGORICAL_JOB_ATTRIBUTES = ['Department', 'Location', 'country', 'Department_ST']
+# Bump when parse_job_titles changes, to invalidate the persisted dimensions
+JOB_DIMENSION_VERSION = 1
+
+# Dimensions already loaded or built by this process, by fingerprint
+_job_dimensions = {}
+
+
+def parse_job_titles(job_titles: list) -> pd.DataFrame:
+    """
+    Parse job titles into their attributes : the parts split by '-' and stripped, the country of the location
+    and the department with the service team departments grouped into 'Service Team'.
+
+    Args:
+        job_titles: Distinct job titles, without missing value.
+
+    Returns:
+        A pandas DataFrame of the JOB_ATTRIBUTES columns indexed by job title.
+    """
+    titles = pd.Series(list(job_titles), dtype=object)
+    # Always 4 parts, even when no title has all of them
+    parts_df = titles.str.split('-', n=3, expand=True).reindex(columns=range(4)).astype(object)
+    parts_df.columns = JOB_TITLE_PARTS
+    for part in JOB_TITLE_PARTS:
+        parts_df[part] = parts_df[part].str.strip()
+    parts_df['country'] = parts_df['Location'].map(LOCATION_MAPPING)
+    parts_df['Department_ST'] = parts_df['Department'].replace(dict.fromkeys(SERVICE_TEAM_DEPARTMENTS, 'Service Team'))
+    parts_df.index = pd.Index(titles, name='new_Job')
+
+    return parts_df
+
+
+def job_dimension_fingerprint() -> str:
+    """
+    Hash of the mappings the attributes are derived from, a change of any of them invalidates the dimension.
+    """
+    settings = {'location_mapping': LOCATION_MAPPING, 'service_team_departments': SERVICE_TEAM_DEPARTMENTS,
+                'version': JOB_DIMENSION_VERSION}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def job_title_dimension(job_titles: list, cache_dir: str = JOB_DIMENSION_CACHE_DIR) -> pd.DataFrame:
+    """
+    Get the attributes of job titles, each distinct title being parsed once and for all.
+
+    The parsed titles are kept in memory and in a Parquet file of cache_dir named after the fingerprint of the
+    mappings, so later runs only parse the titles they have not seen yet.
+
+    Args:
+        job_titles: Distinct job titles, without missing value.
+        cache_dir: The directory of the persisted dimension, None to keep it in memory only.
+
+    Returns:
+        A pandas DataFrame of the JOB_ATTRIBUTES columns, indexed by job title, holding at least job_titles.
+    """
+    fingerprint = job_dimension_fingerprint()
+    persist = cache_dir and any(importlib.util.find_spec(engine) for engine in ('pyarrow', 'fastparquet'))
+    dimension_path = os.path.join(cache_dir, f"job_dimension_{fingerprint}.parquet") if persist else None
+
+    dimension_df = _job_dimensions.get(fingerprint)
+    if dimension_df is None and dimension_path and os.path.exists(dimension_path):
+        dimension_df = pd.read_parquet(dimension_path)
+    if dimension_df is None:
+        dimension_df = parse_job_titles([])
+
+    new_titles = pd.Index(job_titles).difference(dimension_df.index)
+    if len(new_titles):
+        dimension_df = pd.concat([dimension_df, parse_job_titles(new_titles)])
+        if dimension_path:
+            save_job_dimension(dimension_df, dimension_path)
+    _job_dimensions[fingerprint] = dimension_df
+
+    return dimension_df
+
+
+def save_job_dimension(dimension_df: pd.DataFrame, dimension_path: str) -> None:
+    """
+    Save the dimension, replacing the dimensions of former fingerprints. The file is written under a temporary
+    name then renamed, so processes saving at the same time (e.g. the shards) never read a partial file.
+    """
+    cache_dir = os.path.dirname(dimension_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary_path = f"{dimension_path}.{os.getpid()}.tmp"
+    dimension_df.to_parquet(temporary_path)
+    os.replace(temporary_path, dimension_path)
+
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith('job_dimension_') and name.endswith('.parquet') and path != dimension_path:
+            os.remove(path)
+
+
+def job_attributes(new_job: pd.Series, cache_dir: str = JOB_DIMENSION_CACHE_DIR) -> pd.DataFrame:
+    """
+    Get the attributes of the job title of every row, looked up from the job title dimension by the category code
+    of the row instead of parsing the title of every row.
+
+    Args:
+        new_job: The 'new_Job' column.
+        cache_dir: The directory of the persisted dimension, None to keep it in memory only.
+
+    Returns:
+        A pandas DataFrame of the JOB_ATTRIBUTES columns aligned on new_job, the CATEGORICAL_JOB_ATTRIBUTES as
+        category with the categories of the rows only.
+    """
+    if not is_categorical(new_job):
+        new_job = new_job.astype('category')
+    job_titles = new_job.cat.categories
+    dimension_df = job_title_dimension(job_titles, cache_dir=cache_dir).reindex(job_titles)
+
+    # Position of the attributes of every row in the dimension, the missing titles (code -1) point to a last empty row
+    codes = new_job.cat.codes.to_numpy()
+    positions = np.where(codes == -1, len(job_titles), codes)
+
+    attributes = {}
+    for attribute in JOB_ATTRIBUTES:
+        values = pd.Series(list(dimension_df[attribute]) + [np.nan], dtype=object)
+        if attribute in CATEGORICAL_JOB_ATTRIBUTES:
+            categories = pd.Index(values.dropna().unique()).sort_values()
+            row_values = pd.Categorical.from_codes(categories.get_indexer(values)[positions], categories=categories)
+            attributes[attribute] = row_values.remove_unused_categories()
+        else:
+            attributes[attribute] = values.to_numpy()[positions]
+
+    return pd.DataFrame(attributes, index=new_job.index)
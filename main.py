@@ -1,129 +1,125 @@
 # Import necessary modules
-from processing_toolkit import preliminary_processing,not_moved_to_job_data_processor,moved_to_job_data_processor
-from ranking_processor import ranking_proc_phase
 import warnings
-from Toolkit import final_processing ,process_step_stage
+import pandas as pd
 
 # Import constants
 from constants import *
 from datetime import datetime
-from helper_functions import read_file,validate_dataframe
-
-
+from stage_metrics import STAGE_METRICS, peak_memory_usage_mb
+from output_writer import OutputWriter, OUTPUT_FORMATS
+from checkpoint_store import CHECKPOINT_MODES
+from incremental import IncrementalState, candidate_fingerprints, changed_candidates, splice_candidates
+from pipeline import build_pipeline, load_activity_report
+from stage_graph import StageError
+import argparse
 
 # Disable warnings for cleaner output
 warnings.filterwarnings('ignore')
 
 if __name__ == "__main__":
-    ### --------------------------- LOAD FILES and Validate input ------------------------------------###
+    parser = argparse.ArgumentParser(description="Build the recruitment golden source from the activity report.")
+    parser.add_argument('--checkpoint-mode', choices=CHECKPOINT_MODES, default=CHECKPOINT_MODE,
+                        help="How the results of the stages are saved, to skip the unchanged stages in the next runs.")
+    parser.add_argument('--from-stage',
+                        help="Run this stage and the stages after it even if their inputs and code did not change, "
+                             "the stages before it are reused from a previous run when possible.")
+    parser.add_argument('--until-stage', help="Stop once this stage is done instead of running the whole pipeline.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only re-process the candidates whose activity changed since the previous incremental run.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of processes the candidates are split across after the preliminary processing.")
+    parser.add_argument('--stage-threads', type=int, default=STAGE_THREADS,
+                        help="Number of independent stages (e.g. the loads of the inputs) running at the same time.")
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default=OUTPUT_FORMAT,
+                        help="Format of the golden sources and IDs for HR review output files.")
+    args = parser.parse_args()
+    if args.incremental and (args.from_stage or args.until_stage):
+        parser.error("--incremental cannot be combined with --from-stage or --until-stage")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.stage_threads < 1:
+        parser.error("--stage-threads must be at least 1")
+
+    # Record the metrics of the stages run by this run
+    STAGE_METRICS.start_run(STAGE_METRICS_FILE_PATH)
+    # Each output file is written once, in the background while the next stages run
+    output_writer = OutputWriter(args.output_format)
+    # Timestamp of the output file names, using the current date
+    timestamp = datetime.now().strftime("%d-%m")
+
+    # The stages of the run : loads -> preliminary -> (not) moved to job -> concat -> final -> process step -> ranking
+    # -> outputs, the per-candidate ones replaced by the candidate shards with several workers
+    pipeline = build_pipeline(output_writer, timestamp, workers=args.workers, checkpoint_mode=args.checkpoint_mode,
+                              max_workers=args.stage_threads)
+    for stage in (args.from_stage, args.until_stage):
+        if stage is not None and stage not in pipeline.stages:
+            parser.error(f"{stage} is not a stage of the pipeline run with --workers {args.workers}, "
+                         f"the stages are : {', '.join(pipeline.stages)}")
 
-    # Import activity_report CSV file into a Pandas dataframe
     try:
-        activity_report_df = read_file(ACTIVITY_REPORT_PATH)
-        # Validate if the dataframe has all the required columns , and it's not empty
-        if not validate_dataframe(activity_report_df, ACTIVITY_REPORT_COLS):
-            exit(1)
+        if not args.incremental:
+            pipeline.run(from_stage=args.from_stage, until_stage=args.until_stage)
+        else:
+            activity_report_df = load_activity_report(ACTIVITY_REPORT_PATH)
+            total_rows_from_source = len(activity_report_df)
+            incremental_state = IncrementalState(INCREMENTAL_STATE_DIR)
+            report_fingerprints_df = candidate_fingerprints(activity_report_df)
+            previous_golden_source_df = None
+            previous_ids_ko_df = None
+            candidates_to_update = pd.Index([])
+            if incremental_state.exists():
+                # Keep only the candidates with new, changed or removed activity rows since the previous run
+                previous_golden_source_df, previous_ids_ko_df, previous_fingerprints_df = incremental_state.load()
+                candidates_to_update = changed_candidates(previous_fingerprints_df, report_fingerprints_df)
+                activity_report_df = activity_report_df.loc[activity_report_df['Candidate'].isin(candidates_to_update)]
+                print(f"Incremental run : {len(candidates_to_update)} candidates to update "
+                      f"({len(activity_report_df)} rows from source)")
+
+            # Process the changed candidates, up to the golden source (nothing to process when no candidate changed)
+            golden_source_df = None
+            ids_ko_df = None
+            if not activity_report_df.empty:
+                results = pipeline.run(until_stage=pipeline.producers['golden_source'].name,
+                                       provided={'activity_report': activity_report_df,
+                                                 'total_rows_from_source': total_rows_from_source})
+                golden_source_df, ids_ko_df = results['golden_source'], results['ids_ko']
+
+            if previous_golden_source_df is not None:
+                # Splice the re-processed candidates into the previous golden source and IDs for HR review
+                golden_source_df = splice_candidates(previous_golden_source_df, golden_source_df, candidates_to_update)
+                ids_ko_df = splice_candidates(previous_ids_ko_df, ids_ko_df, candidates_to_update)
+            incremental_state.save(golden_source_df, ids_ko_df, report_fingerprints_df)
+
+            # Rank the spliced golden source and write the outputs
+            ranking_pipeline = build_pipeline(output_writer, timestamp, max_workers=args.stage_threads)
+            ranking_pipeline.run(provided={'golden_source': golden_source_df, 'ids_ko': ids_ko_df})
 
     except FileNotFoundError:
         print(ERROR_ACTIVITY_REPORT_NOT_FOUND)
         exit(1)
-
-    # Import activity dictionary Excel sheet into a Pandas dataframe
-    try:
-        activity_dict_df = read_file(ACTIVITY_DICT_PATH)
-        if not validate_dataframe(activity_dict_df, ACTIVITY_DICTIONARY_COLS):
-            exit(1)
-    except FileNotFoundError:
-        print(ERROR_ACTIVITY_DICT_NOT_FOUND)
-        exit(1)
-
-    # Import HR name list Excel sheet into a Pandas dataframe
-    try:
-        hr_names_df = read_file(HR_NAMES_PATH)
-        if not validate_dataframe(hr_names_df, HR_NAMES_COLS):
-            exit(1)
-    except FileNotFoundError:
-        print(ERROR_HR_NAMES_NOT_FOUND)
-        exit(1)
-
-    # Import Process_Step Excel sheet into a Pandas dataframe
-    try:
-        process_step_df = read_file(PROCESS_STEP_PATH)
-        if not validate_dataframe(process_step_df, PROCESS_STEP_COLS):
-            exit(1)
-    except FileNotFoundError:
-        print(ERROR_PROCESS_STEP_NOT_FOUND)
-        exit(1)
-
-        # Import Targets Excel sheet into a Pandas dataframe
-    try:
-        targets_df = read_file(TARGETS_STEP_PATH)
-        if not validate_dataframe(targets_df, TARGETS_COLS):
-            exit(1)
-
-    except FileNotFoundError:
-        print(ERROR_TARGETS_FILE_NOT_FOUND)
-        exit(1)
-
-    # Load the ranking dictionary dataframe and convert the 'c_activity' column to lowercase
-    try:
-        ranking_dict_df = read_file(RANKING_DICT_PATH)
-        assert isinstance(ranking_dict_df, pd.DataFrame), "ranking_dict_df must be a pandas DataFrame"
-
-    except FileNotFoundError:
-        print(ERROR_RANKING_DICT_NOT_FOUND)
-        exit(1)
-
-    #### -------------------------- Separate candidates with 'moved to job position' from the rest ------------------------- ####
-    # Separate candidates with 'moved to job position' from the rest
-    try:
-        moved_to_job_df, not_moved_to_job_df = preliminary_processing(activity_report_df, activity_dict_df, hr_names_df)
-    except Exception as e:
-        print(f"{ERROR_PRELIMINARY_PROCESSING_FAILED.format(str(e))}")
+    except StageError as e:
+        print(e.message)
         exit(1)
 
-
-    #### ------------------- Process moved to job and not moved to job candidates seperately   ------------------------- ####
-
+    # Wait for the output files still being written
     try:
-        # Process the two sub dataframes for candidates who moved to job position and those who did not
-        not_moved_to_job_df = not_moved_to_job_data_processor(not_moved_to_job_df)
-        moved_to_job_first_only_df, moved_time_activity_report_df = moved_to_job_data_processor(moved_to_job_df)
-        # Concatenate the three dataframes
-        golden_source_df = pd.concat([not_moved_to_job_df, moved_to_job_first_only_df, moved_time_activity_report_df])
-        golden_source_df.drop('level_0', axis=1, inplace=True)
-        golden_source_df.reset_index(inplace=True)
-        # Further process the concatenated dataframe
-        unified_df = final_processing(golden_source_df)
-
+        output_writer.close()
     except Exception as e:
-        print(f"{ERROR_SUB_DATAFRAME_CREATION_FAILED.format(str(e))}")
+        print(f"{ERROR_OUTPUT_WRITE_FAILED.format(str(e))}")
         exit(1)
 
-    # Process Step Phase ----------------------------------------------------------------------------------------
-    try:
-        # Call the process_step_stage function with the necessary parameters
-        golden_source_df = process_step_stage(unified_df, process_step_df, targets_df)
-
-    except Exception as e:
-        # Handle any exceptions that occur during the execution
-        print("An error occurred:", str(e))
-
-
-
-    # Ranking processor phase -----------------------------------------------------------------------------------
-
-    try:
-        golden_source_df_with_ranking = ranking_proc_phase(golden_source_df,ranking_dict_df)
-
-        # Create a timestamp using the current date
-        now = datetime.now()
-        timestamp = now.strftime("%d-%m")
-        file_name = fr'.\output_data\Golden_source_with_ranking_processor-{timestamp}.xlsx'
-        golden_source_df_with_ranking.to_excel(file_name, index=False)
-
-    except Exception as e:
-        print(f"{ERROR_RANKING_PROCESSOR_FAILED.format(str(e))}")
-        exit(1)
+    # Report the peak memory of the run, the largest worker process included
+    peak_memory_mb = peak_memory_usage_mb()
+    if peak_memory_mb is not None:
+        print(f"Peak memory usage (RSS) : {peak_memory_mb:.0f} MB")
+    peak_worker_memory_mb = peak_memory_usage_mb(children=True) if args.workers > 1 else None
+    if peak_worker_memory_mb:
+        print(f"Peak memory usage of a worker (RSS) : {peak_worker_memory_mb:.0f} MB")
+
+    # Summary of the stage metrics, one JSON line per stage call is in STAGE_METRICS_FILE_PATH
+    stage_summary_df = STAGE_METRICS.summary()
+    if not stage_summary_df.empty:
+        print("Stage metrics :")
+        print(stage_summary_df.to_string())
 
 
@@ -0,0 +1,152 @@
+import os
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Output formats : Excel workbooks for the business users, or fast Parquet / (compressed) CSV files
+OUTPUT_FORMATS = ('xlsx', 'parquet', 'csv', 'csv.gz')
+
+# Rows of an Excel worksheet, header included : larger outputs are split over several sheets
+EXCEL_MAX_ROWS = 1_048_576
+# Rows converted to Python values at once by the streaming Excel writer
+EXCEL_CHUNK_ROWS = 10_000
+
+
+def output_path(file_path: str, output_format: str) -> str:
+    """
+    Replace the extension of an output file path by the one of the output format.
+    """
+    root, extension = os.path.splitext(file_path)
+    if extension == '.gz':
+        root = os.path.splitext(root)[0]
+    return f"{root}.{output_format}"
+
+
+def formula_like(values: pd.Series) -> pd.Series:
+    """
+    Flag the strings starting with '=' (e.g. '==> applied'), that openpyxl would otherwise write as formulas.
+    """
+    if values.dtype != object and not isinstance(values.dtype, pd.CategoricalDtype):
+        return pd.Series(False, index=values.index)
+    return values.astype(object).map(lambda value: isinstance(value, str) and value.startswith('='))
+
+
+def write_xlsx_streaming(df: pd.DataFrame, file_path: str, max_sheet_rows: int = EXCEL_MAX_ROWS) -> None:
+    """
+    Write a DataFrame to an Excel workbook row by row (openpyxl write-only mode), in constant memory.
+
+    Outputs with more rows than a worksheet can hold are split over 'Sheet1', 'Sheet2', ... each with the header.
+    Strings starting with '=' are written as text, not as (broken) formulas.
+
+    Args:
+        df: The pandas DataFrame to write, without its index.
+        file_path: The path of the workbook.
+        max_sheet_rows: The number of rows of a worksheet, header included.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    def text_cell(worksheet, value):
+        cell = WriteOnlyCell(worksheet, value=value)
+        cell.data_type = 's'
+        return cell
+
+    workbook = Workbook(write_only=True)
+    rows_per_sheet = max_sheet_rows - 1
+    nb_sheets = max(-(-len(df) // rows_per_sheet), 1)
+    for sheet in range(nb_sheets):
+        worksheet = workbook.create_sheet(f"Sheet{sheet + 1}")
+        header = []
+        for col in df.columns:
+            cell = WriteOnlyCell(worksheet, value=str(col))
+            cell.font = Font(bold=True)
+            header.append(cell)
+        worksheet.append(header)
+
+        sheet_end = min((sheet + 1) * rows_per_sheet, len(df))
+        for chunk_start in range(sheet * rows_per_sheet, sheet_end, EXCEL_CHUNK_ROWS):
+            chunk_df = df.iloc[chunk_start:min(chunk_start + EXCEL_CHUNK_ROWS, sheet_end)].astype(object)
+            # Missing values (NaN, NaT, None) are left as empty cells
+            chunk_df = chunk_df.where(chunk_df.notna(), None)
+            for col in range(chunk_df.shape[1]):
+                is_formula_like = formula_like(chunk_df.iloc[:, col]).to_numpy()
+                if is_formula_like.any():
+                    rows = np.flatnonzero(is_formula_like)
+                    chunk_df.iloc[rows, col] = [text_cell(worksheet, value) for value in chunk_df.iloc[rows, col]]
+            for row in chunk_df.itertuples(index=False, name=None):
+                worksheet.append(row)
+
+    workbook.save(file_path)
+
+
+def write_dataframe(df: pd.DataFrame, file_path: str, output_format: str) -> None:
+    """
+    Write a DataFrame, without its index, to a file of the given output format.
+    """
+    if output_format == 'parquet':
+        df.to_parquet(file_path, index=False)
+    elif output_format in ('csv', 'csv.gz'):
+        # The compression is inferred from the '.gz' extension
+        df.to_csv(file_path, index=False)
+    else:
+        write_xlsx_streaming(df, file_path)
+
+
+class OutputWriter:
+    """
+    Writes the output DataFrames of a run (golden sources, IDs for HR review) in the chosen format.
+
+    The writes run one after the other in a background thread, so they overlap with the stages still computing :
+    the DataFrames handed to write must not be modified afterwards, and close must be called to wait for them.
+    """
+
+    def __init__(self, output_format: str = 'xlsx', background: bool = True):
+        # Validate input
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}, got {output_format}")
+        # Parquet needs pyarrow or fastparquet, fall back to the Excel workbooks without them
+        if output_format == 'parquet' and not any(importlib.util.find_spec(engine)
+                                                  for engine in ('pyarrow', 'fastparquet')):
+            print("Warning: no parquet engine (pyarrow or fastparquet) installed, outputs are written to Excel.")
+            output_format = 'xlsx'
+        self.output_format = output_format
+        self._executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self._pending_writes = []
+
+    def path(self, file_path: str) -> str:
+        return output_path(file_path, self.output_format)
+
+    def write(self, df: pd.DataFrame, file_path: str) -> str:
+        """
+        Write a DataFrame to file_path, its extension replaced by the one of the output format.
+
+        Returns:
+            The path of the written file.
+        """
+        path = self.path(file_path)
+        if self._executor is None:
+            write_dataframe(df, path, self.output_format)
+        else:
+            self._pending_writes.append((path, self._executor.submit(write_dataframe, df, path, self.output_format)))
+        return path
+
+    def close(self) -> None:
+        """
+        Wait for the pending writes.
+
+        Raises:
+            The exception of the first write that failed, once all of them are done.
+        """
+        errors = []
+        for path, pending_write in self._pending_writes:
+            error = pending_write.exception()
+            if error is not None:
+                errors.append(error)
+                print(f"Error: {path} could not be written : {error}")
+        self._pending_writes = []
+        if self._executor is not None:
+            self._executor.shutdown()
+        if errors:
+            raise errors[0]
@@ -0,0 +1,219 @@
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from processing_toolkit import not_moved_to_job_data_processor, moved_to_job_data_processor
+from Toolkit import final_processing, process_step_stage, key_order_labels
+from ranking_processor import ranking_proc_phase, ranking_dict_entries
+from run_context import RunContext
+from stage_metrics import STAGE_METRICS
+from dtype_policy import concat_aligned
+from constants import OUTPUT_ORDER_COLS
+
+# Sections of the funnel statistics reported by a shard, in the order the stages run
+SHARD_SECTIONS = ['not_moved_to_job', 'moved_to_job', 'final', 'process_step']
+
+
+def candidate_shards(candidates: pd.Series, nb_shards: int) -> pd.Series:
+    """
+    Assign every row to a shard from the hash of its candidate, so all the rows of a candidate land in the same shard.
+
+    The hash does not depend on the process (unlike the built-in hash), the shards are the same from one run to the next.
+
+    Args:
+        candidates: The Candidate column.
+        nb_shards: The number of shards.
+
+    Returns:
+        A pandas Series of shard numbers aligned on candidates.
+    """
+    return pd.util.hash_pandas_object(candidates, index=False) % nb_shards
+
+
+def process_candidate_shard(moved_to_job_df: pd.DataFrame, not_moved_to_job_df: pd.DataFrame,
+                            process_step_df: pd.DataFrame, targets_df: pd.DataFrame, ranking_dict_df: pd.DataFrame,
+                            total_rows_from_source: int) -> dict:
+    """
+    Run the per-candidate stages, from the sub dataframes processing to the ranking phase, on the candidates of a shard.
+
+    The shard does not print nor write anything : its funnel statistics, stage metrics and outputs are returned
+    to be combined.
+
+    Returns:
+        A dict with the golden source, ranked golden source and IDs for HR review DataFrames, the key labels of the
+        rows of each sub dataframe, the funnel statistics reported by each section and the metrics of the stages.
+    """
+    run_context = RunContext(total_rows_from_source, verbose=False)
+    # A worker process may run several shards, only the metrics recorded from here on belong to this one
+    nb_stage_metrics = len(STAGE_METRICS.records)
+    funnel_stats = {}
+
+    def run_section(section, stage, *args):
+        nb_stats = len(run_context.funnel_stats)
+        result = stage(*args)
+        funnel_stats[section] = run_context.funnel_stats[nb_stats:]
+        return result
+
+    # Same steps as the serial path in main.py, a shard may have no candidate in one of the sub dataframes
+    processed_dfs = []
+    sub_dataframe_keys = []
+    if not not_moved_to_job_df.empty:
+        processed_dfs.append(run_section('not_moved_to_job', not_moved_to_job_data_processor,
+                                         not_moved_to_job_df, run_context))
+        sub_dataframe_keys.append('ID')
+    if not moved_to_job_df.empty:
+        processed_dfs.extend(run_section('moved_to_job', moved_to_job_data_processor, moved_to_job_df, run_context))
+        # Candidates who moved to job first only, and in the middle of their process
+        sub_dataframe_keys.extend(['ID', 'Candidate'])
+    row_labels_df = sub_dataframe_row_labels(processed_dfs, sub_dataframe_keys)
+    golden_source_df = concat_aligned(processed_dfs)
+    golden_source_df.drop('level_0', axis=1, inplace=True, errors='ignore')
+    golden_source_df.reset_index(inplace=True)
+
+    unified_df = run_section('final', final_processing, golden_source_df, run_context)
+    golden_source_df = run_section('process_step', process_step_stage, unified_df, process_step_df, targets_df,
+                                   run_context)
+    # The ranking phase updates the golden source in place, rank a copy to return both
+    ranked_df = ranking_proc_phase(golden_source_df.copy(), ranking_dict_df)
+
+    return {
+        'golden_source': golden_source_df,
+        'ranked': ranked_df,
+        'ids_ko': run_context.outputs.get('ids_ko'),
+        'row_labels': row_labels_df,
+        'funnel_stats': funnel_stats,
+        'stage_metrics': STAGE_METRICS.records[nb_stage_metrics:],
+    }
+
+
+def merge_funnel_stats(shard_funnel_stats: list) -> list:
+    """
+    Sum the funnel statistics of the shards, section by section.
+
+    Every shard running a section reports the same statistics in the same order, only their values differ.
+
+    Args:
+        shard_funnel_stats: The funnel statistics of each shard, as dicts of section to (kind, label, value) tuples.
+
+    Returns:
+        The list of (kind, label, value) tuples of the whole run.
+    """
+    merged_stats = []
+    for section in SHARD_SECTIONS:
+        sections_stats = [stats[section] for stats in shard_funnel_stats if section in stats]
+        if not sections_stats:
+            continue
+        for shard_stats in zip(*sections_stats):
+            kind, label, value = shard_stats[0]
+            if kind != 'text':
+                value = sum(stat[2] for stat in shard_stats)
+            merged_stats.append((kind, label, value))
+
+    return merged_stats
+
+
+def combine_shards(shard_dfs: list) -> pd.DataFrame:
+    """
+    Concatenate the DataFrames computed by the shards in the order of the serial path.
+
+    The serial path sorts the rows by unique_ID label and time, and all the rows of an application come from a
+    single shard : a stable sort on the same columns restores the serial order.
+    """
+    combined_df = concat_aligned(shard_dfs, ignore_index=True)
+    # A column without value in a shard (e.g. a hiring date) falls back to object in the concat, infer it back
+    combined_df = combined_df.sort_values(by=OUTPUT_ORDER_COLS, kind='stable').reset_index(drop=True).infer_objects()
+
+    return combined_df
+
+
+def sub_dataframe_row_labels(processed_dfs: list, keys: list) -> pd.DataFrame:
+    """
+    Get, for every row of the processed sub dataframes of a shard, the label of the key shared_cleaning numbered it by.
+
+    Args:
+        processed_dfs: The processed sub dataframes, in the order of the serial path.
+        keys: The key of each sub dataframe.
+
+    Returns:
+        A DataFrame with the number of the sub dataframe, the row number given by preliminary_processing ('index')
+        and the key label of each row.
+    """
+    return pd.concat([pd.DataFrame({'sub_dataframe': sub_dataframe, 'index': processed_df['index'].to_numpy(),
+                                    'label': key_order_labels(processed_df, key).to_numpy()})
+                      for sub_dataframe, (processed_df, key) in enumerate(zip(processed_dfs, keys))],
+                     ignore_index=True)
+
+
+def number_sub_dataframe_rows(ids_ko_df: pd.DataFrame, row_labels_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Give the IDs for HR review the level_0 of the serial path : the position of the row in its sub dataframe sorted
+    by key label, the rows of a key in the order of preliminary_processing, over the rows of all the shards.
+
+    Args:
+        ids_ko_df: The combined IDs for HR review DataFrame, updated in place.
+        row_labels_df: The key labels of the rows of the shards, from sub_dataframe_row_labels.
+
+    Returns:
+        The IDs for HR review DataFrame.
+    """
+    row_labels_df = row_labels_df.sort_values(by=['sub_dataframe', 'label', 'index'], kind='stable')
+    row_numbers = pd.Series(row_labels_df.groupby('sub_dataframe').cumcount().to_numpy(), index=row_labels_df['index'])
+    ids_ko_df['level_0'] = ids_ko_df['index'].map(row_numbers)
+
+    return ids_ko_df
+
+
+def run_candidate_shards(moved_to_job_df: pd.DataFrame, not_moved_to_job_df: pd.DataFrame,
+                         process_step_df: pd.DataFrame, targets_df: pd.DataFrame, ranking_dict_df: pd.DataFrame,
+                         run_context: RunContext, workers: int) -> tuple:
+    """
+    Run the per-candidate stages on a pool of processes, the candidates being hash-partitioned into one shard per worker.
+
+    The results are identical to the serial path : the shards are concatenated in the serial order, the funnel
+    statistics are summed over the shards before being reported, and the IDs for HR review of the shards are
+    combined into the run context outputs. The stage metrics of each shard are recorded with their shard number.
+
+    Args:
+        moved_to_job_df: The candidates with 'moved to job position', returned by preliminary_processing.
+        not_moved_to_job_df: The other candidates, returned by preliminary_processing.
+        process_step_df: The process step DataFrame.
+        targets_df: The targets DataFrame.
+        ranking_dict_df: The ranking dictionary DataFrame.
+        run_context: The context of the current run.
+        workers: The number of processes.
+
+    Returns:
+        A tuple of the golden source DataFrame and the golden source DataFrame with ranking.
+    """
+    # Resolve the duplicate entries of the ranking dictionary once, not in every shard
+    ranking_dict_df = ranking_dict_entries(ranking_dict_df)
+    moved_to_job_shards = candidate_shards(moved_to_job_df['Candidate'], workers)
+    not_moved_to_job_shards = candidate_shards(not_moved_to_job_df['Candidate'], workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for shard in range(workers):
+            shard_moved_to_job_df = moved_to_job_df.loc[(moved_to_job_shards == shard).to_numpy()]
+            shard_not_moved_to_job_df = not_moved_to_job_df.loc[(not_moved_to_job_shards == shard).to_numpy()]
+            if shard_moved_to_job_df.empty and shard_not_moved_to_job_df.empty:
+                continue
+            futures.append((shard, executor.submit(process_candidate_shard, shard_moved_to_job_df,
+                                                   shard_not_moved_to_job_df, process_step_df, targets_df,
+                                                   ranking_dict_df, run_context.total_rows_from_source)))
+        shard_results = []
+        for shard, future in futures:
+            shard_results.append(future.result())
+            for record in shard_results[-1]['stage_metrics']:
+                STAGE_METRICS.add({**{key: value for key, value in record.items() if key != 'run_id'}, 'shard': shard})
+
+    for stat in merge_funnel_stats([result['funnel_stats'] for result in shard_results]):
+        run_context.report_stat(stat)
+
+    golden_source_df = combine_shards([result['golden_source'] for result in shard_results])
+    golden_source_df_with_ranking = combine_shards([result['ranked'] for result in shard_results])
+
+    ids_ko_dfs = [result['ids_ko'] for result in shard_results if result['ids_ko'] is not None]
+    if ids_ko_dfs:
+        run_context.outputs['ids_ko'] = number_sub_dataframe_rows(
+            combine_shards(ids_ko_dfs), pd.concat([result['row_labels'] for result in shard_results], ignore_index=True))
+
+    return golden_source_df, golden_source_df_with_ranking
@@ -0,0 +1,207 @@
+import functools
+import pandas as pd
+from processing_toolkit import preliminary_processing, not_moved_to_job_data_processor, moved_to_job_data_processor
+from Toolkit import final_processing, process_step_stage
+from ranking_processor import ranking_proc_phase
+from run_context import RunContext
+from parallel_runner import run_candidate_shards
+from output_writer import OutputWriter
+from dtype_policy import apply_dtype_policy, concat_aligned
+from helper_functions import read_file, validate_dataframe, file_fingerprint, read_csv_header, read_activity_report
+from stage_graph import Stage, StageGraph
+from constants import ACTIVITY_REPORT_PATH, ACTIVITY_DICT_PATH, HR_NAMES_PATH, PROCESS_STEP_PATH, TARGETS_STEP_PATH, \
+    RANKING_DICT_PATH, ACTIVITY_REPORT_COLS, ACTIVITY_DICTIONARY_COLS, HR_NAMES_COLS, PROCESS_STEP_COLS, TARGETS_COLS, \
+    OUTPUT_FILE_PATH_TEMPLATE, RANKED_OUTPUT_FILE_PATH_TEMPLATE, IDS_KO_FILE_PATH, STAGE_CHECKPOINT_DIR, \
+    ERROR_ACTIVITY_REPORT_NOT_FOUND, ERROR_ACTIVITY_DICT_NOT_FOUND, ERROR_HR_NAMES_NOT_FOUND, \
+    ERROR_PROCESS_STEP_NOT_FOUND, ERROR_TARGETS_FILE_NOT_FOUND, ERROR_RANKING_DICT_NOT_FOUND, \
+    ERROR_PRELIMINARY_PROCESSING_FAILED, ERROR_SUB_DATAFRAME_CREATION_FAILED, ERROR_PROCESS_STEP_FAILED, \
+    ERROR_RANKING_PROCESSOR_FAILED, ERROR_OUTPUT_WRITE_FAILED
+
+# Modules all the stages depend on, a change of one of them runs the whole pipeline again
+COMMON_CODE_MODULES = ['constants', 'dtype_policy', 'pipeline']
+# Modules of the per-candidate stages
+PROCESSING_CODE_MODULES = ['processing_toolkit', 'Toolkit', 'dimension_lookup', 'group_index', 'job_dimension']
+
+
+@functools.lru_cache(maxsize=None)
+def input_fingerprint(file_path: str) -> str:
+    """
+    Fingerprint of the content of an input file, hashed once by the process.
+    """
+    return file_fingerprint(file_path)
+
+
+def load_activity_report(file_path: str) -> pd.DataFrame:
+    """
+    Load the activity report, its columns validated from the header before the whole file is parsed.
+    """
+    if not validate_dataframe(read_csv_header(file_path), ACTIVITY_REPORT_COLS, check_empty=False):
+        raise ValueError(f"{file_path} does not have the required columns")
+    activity_report_df = read_activity_report(file_path)
+    if not validate_dataframe(activity_report_df, ACTIVITY_REPORT_COLS):
+        raise ValueError(f"{file_path} has no activity")
+
+    return activity_report_df
+
+
+def load_reference_sheet(file_path: str, required_cols: list = None) -> pd.DataFrame:
+    """
+    Load a reference Excel sheet, its low cardinality columns stored as category.
+    """
+    reference_df = apply_dtype_policy(read_file(file_path))
+    if required_cols is not None and not validate_dataframe(reference_df, required_cols):
+        raise ValueError(f"{file_path} does not have the required columns or is empty")
+
+    return reference_df
+
+
+def process_not_moved_to_job(not_moved_to_job_df: pd.DataFrame, run_context: RunContext) -> pd.DataFrame:
+    # An incremental run may have no candidate in one of the sub dataframes
+    if not_moved_to_job_df.empty:
+        return None
+    return not_moved_to_job_data_processor(not_moved_to_job_df, run_context)
+
+
+def process_moved_to_job(moved_to_job_df: pd.DataFrame, run_context: RunContext) -> tuple:
+    if moved_to_job_df.empty:
+        return None, None
+    return moved_to_job_data_processor(moved_to_job_df, run_context)
+
+
+def concat_sub_dataframes(*processed_dfs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Concatenate the processed sub dataframes of the candidates who moved to job position and of the others.
+    """
+    golden_source_df = concat_aligned([processed_df for processed_df in processed_dfs if processed_df is not None])
+    golden_source_df.drop('level_0', axis=1, inplace=True, errors='ignore')
+    golden_source_df.reset_index(inplace=True)
+
+    return golden_source_df
+
+
+def process_step(unified_df: pd.DataFrame, process_step_df: pd.DataFrame, targets_df: pd.DataFrame,
+                 run_context: RunContext) -> tuple:
+    """
+    Returns:
+        A tuple of the golden source DataFrame and of the IDs for HR review DataFrame.
+    """
+    golden_source_df = process_step_stage(unified_df, process_step_df, targets_df, run_context)
+    return golden_source_df, run_context.outputs.get('ids_ko')
+
+
+def rank(golden_source_df: pd.DataFrame, ranking_dict_df: pd.DataFrame) -> pd.DataFrame:
+    # The ranking phase updates the golden source in place, rank a copy as it may still be being written
+    return ranking_proc_phase(golden_source_df.copy(), ranking_dict_df)
+
+
+def process_candidate_shards(moved_to_job_df: pd.DataFrame, not_moved_to_job_df: pd.DataFrame,
+                             process_step_df: pd.DataFrame, targets_df: pd.DataFrame, ranking_dict_df: pd.DataFrame,
+                             run_context: RunContext, workers: int) -> tuple:
+    """
+    Returns:
+        A tuple of the golden source, IDs for HR review and golden source with ranking DataFrames.
+    """
+    golden_source_df, golden_source_df_with_ranking = run_candidate_shards(
+        moved_to_job_df, not_moved_to_job_df, process_step_df, targets_df, ranking_dict_df, run_context, workers)
+    return golden_source_df, run_context.outputs.get('ids_ko'), golden_source_df_with_ranking
+
+
+def write_golden_source(output_writer: OutputWriter, timestamp: str, golden_source_df: pd.DataFrame,
+                        ids_ko_df: pd.DataFrame) -> None:
+    output_writer.write(golden_source_df, OUTPUT_FILE_PATH_TEMPLATE.format(timestamp))
+    if ids_ko_df is not None:
+        output_writer.write(ids_ko_df, IDS_KO_FILE_PATH)
+
+
+def write_ranked_golden_source(output_writer: OutputWriter, timestamp: str,
+                               golden_source_df_with_ranking: pd.DataFrame) -> None:
+    output_writer.write(golden_source_df_with_ranking, RANKED_OUTPUT_FILE_PATH_TEMPLATE.format(timestamp))
+
+
+def build_pipeline(output_writer: OutputWriter, timestamp: str, workers: int = 1, checkpoint_mode: str = 'off',
+                   max_workers: int = 1) -> StageGraph:
+    """
+    Build the stage graph of main.py : the loads of the inputs, the preliminary processing, the processing of the
+    candidates who moved to job position and of the others, their concatenation, the final processing, the process
+    step stage, the ranking phase and the writes of the outputs.
+
+    Args:
+        output_writer: The writer of the output files.
+        timestamp: The timestamp of the output file names.
+        workers: The number of processes of the per-candidate stages, replaced by a single 'candidate_shards'
+            stage when above 1.
+        checkpoint_mode: The CheckpointStore mode of the results of the stages, 'off' to run all of them every time.
+        max_workers: The number of stages running at the same time.
+
+    Returns:
+        The StageGraph of the pipeline.
+    """
+    def load_stage(name, function, file_path, not_found_message, **kwargs):
+        return Stage(name, function, code_modules=['helper_functions'],
+                     key=functools.partial(input_fingerprint, file_path),
+                     error_messages={FileNotFoundError: not_found_message}, **kwargs)
+
+    stages = [
+        # The activity report is not saved again, a copy of the whole report : it is only parsed when the preliminary
+        # processing runs, the number of rows the funnel of the skipped stages is reported against being saved
+        load_stage('activity_report', functools.partial(load_activity_report, ACTIVITY_REPORT_PATH),
+                   ACTIVITY_REPORT_PATH, ERROR_ACTIVITY_REPORT_NOT_FOUND, persist=False),
+        Stage('total_rows_from_source', len, inputs=['activity_report']),
+        # The reference sheets are served by the read cache, faster than saving them again
+        load_stage('activity_dict', functools.partial(load_reference_sheet, ACTIVITY_DICT_PATH, ACTIVITY_DICTIONARY_COLS),
+                   ACTIVITY_DICT_PATH, ERROR_ACTIVITY_DICT_NOT_FOUND, persist=False),
+        load_stage('hr_names', functools.partial(load_reference_sheet, HR_NAMES_PATH, HR_NAMES_COLS),
+                   HR_NAMES_PATH, ERROR_HR_NAMES_NOT_FOUND, persist=False),
+        load_stage('process_step_dict', functools.partial(load_reference_sheet, PROCESS_STEP_PATH, PROCESS_STEP_COLS),
+                   PROCESS_STEP_PATH, ERROR_PROCESS_STEP_NOT_FOUND, persist=False),
+        load_stage('targets', functools.partial(load_reference_sheet, TARGETS_STEP_PATH, TARGETS_COLS),
+                   TARGETS_STEP_PATH, ERROR_TARGETS_FILE_NOT_FOUND, persist=False),
+        load_stage('ranking_dict', functools.partial(load_reference_sheet, RANKING_DICT_PATH),
+                   RANKING_DICT_PATH, ERROR_RANKING_DICT_NOT_FOUND, persist=False),
+        Stage('run_context', RunContext, inputs=['total_rows_from_source'], code_modules=['run_context'],
+              persist=False),
+        Stage('preliminary', preliminary_processing,
+              inputs=['activity_report', 'activity_dict', 'hr_names', 'run_context'],
+              outputs=['moved_to_job', 'not_moved_to_job'], code_modules=PROCESSING_CODE_MODULES,
+              error_messages={Exception: ERROR_PRELIMINARY_PROCESSING_FAILED}),
+    ]
+    if workers > 1:
+        stages.append(
+            Stage('candidate_shards', functools.partial(process_candidate_shards, workers=workers),
+                  inputs=['moved_to_job', 'not_moved_to_job', 'process_step_dict', 'targets', 'ranking_dict',
+                          'run_context'],
+                  outputs=['golden_source', 'ids_ko', 'golden_source_with_ranking'],
+                  code_modules=PROCESSING_CODE_MODULES + ['parallel_runner', 'ranking_processor'],
+                  error_messages={Exception: ERROR_SUB_DATAFRAME_CREATION_FAILED}))
+    else:
+        stages += [
+            Stage('not_moved_to_job', process_not_moved_to_job, inputs=['not_moved_to_job', 'run_context'],
+                  outputs=['not_moved_to_job_processed'], code_modules=PROCESSING_CODE_MODULES,
+                  error_messages={Exception: ERROR_SUB_DATAFRAME_CREATION_FAILED}),
+            Stage('moved_to_job', process_moved_to_job, inputs=['moved_to_job', 'run_context'],
+                  outputs=['moved_to_job_first_only', 'moved_to_job_time'], code_modules=PROCESSING_CODE_MODULES,
+                  error_messages={Exception: ERROR_SUB_DATAFRAME_CREATION_FAILED}),
+            Stage('concat', concat_sub_dataframes,
+                  inputs=['not_moved_to_job_processed', 'moved_to_job_first_only', 'moved_to_job_time'],
+                  outputs=['concatenated'], error_messages={Exception: ERROR_SUB_DATAFRAME_CREATION_FAILED}),
+            Stage('final', final_processing, inputs=['concatenated', 'run_context'], outputs=['unified'],
+                  code_modules=PROCESSING_CODE_MODULES, error_messages={Exception: ERROR_SUB_DATAFRAME_CREATION_FAILED}),
+            Stage('process_step', process_step, inputs=['unified', 'process_step_dict', 'targets', 'run_context'],
+                  outputs=['golden_source', 'ids_ko'], code_modules=PROCESSING_CODE_MODULES,
+                  error_messages={Exception: ERROR_PROCESS_STEP_FAILED}),
+            Stage('ranking', rank, inputs=['golden_source', 'ranking_dict'], outputs=['golden_source_with_ranking'],
+                  code_modules=['ranking_processor', 'dimension_lookup', 'group_index'],
+                  error_messages={Exception: ERROR_RANKING_PROCESSOR_FAILED}),
+        ]
+    stages += [
+        Stage('golden_source_output', functools.partial(write_golden_source, output_writer, timestamp),
+              inputs=['golden_source', 'ids_ko'], outputs=[], persist=False,
+              error_messages={Exception: ERROR_OUTPUT_WRITE_FAILED}),
+        Stage('ranked_output', functools.partial(write_ranked_golden_source, output_writer, timestamp),
+              inputs=['golden_source_with_ranking'], outputs=[], persist=False,
+              error_messages={Exception: ERROR_OUTPUT_WRITE_FAILED}),
+    ]
+
+    return StageGraph(stages, checkpoint_dir=STAGE_CHECKPOINT_DIR, checkpoint_mode=checkpoint_mode,
+                      max_workers=max_workers, common_code_modules=COMMON_CODE_MODULES,
+                      run_context_result='run_context')
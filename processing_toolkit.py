@@ -3,12 +3,18 @@ import pandas as pd
 from datetime import timedelta, datetime
 import numpy as np
 from Toolkit import *
-from constants import total_rows_from_source
+from run_context import RunContext
+from dtype_policy import map_categories
+from dimension_lookup import DimensionIndex
+from stage_metrics import instrumented_stage
+from constants import ACTIVITY_REWRITE_RULES, ID_KEY_COLS, UNIQUE_ID_KEY_COLS
 
 
+@instrumented_stage('preliminary')
 def preliminary_processing(activity_report_df: pd.DataFrame,
                           activity_dict_df: pd.DataFrame,
-                          hr_names_df: pd.DataFrame) -> pd.DataFrame:
+                          hr_names_df: pd.DataFrame,
+                          run_context: RunContext) -> pd.DataFrame:
     """
     Merge , clean and create two dataframes from four DataFrames: `activity_report_df`, `activity_dict_df`,
     `hr_names_df`, and `process_step_df`. Keeping only activities that are a process step.
@@ -21,6 +27,8 @@ def preliminary_processing(activity_report_df: pd.DataFrame,
         A DataFrame containing activity dictionary data.
     hr_names_df : pd.DataFrame
         A DataFrame containing HR employee names data.
+    run_context : RunContext
+        The context of the current run, holding the number of rows from source and the checkpoint store.
 
 
     Returns:
@@ -29,19 +37,24 @@ def preliminary_processing(activity_report_df: pd.DataFrame,
         two DataFrames : one with moved to job position candidates , and one with all the rest
     """
 
-    # Merge the activity report data with the activity dictionary data and the HR employee names data
-    dict_activity_report_df = pd.merge(activity_report_df, activity_dict_df, on='Activity', how='left')
-    hr_dict_activity_report_df = pd.merge(dict_activity_report_df, hr_names_df, on='Name', how='left')
+    total_rows_from_source = run_context.total_rows_from_source
+
+    # Add the activity dictionary and the HR employee names columns to the activity report, looked up by key
+    # (the activity report is not copied, only its columns are shared with the new DataFrame)
+    hr_dict_activity_report_df = activity_report_df.copy(deep=False)
+    hr_dict_activity_report_df.reset_index(drop=True, inplace=True)
+    DimensionIndex(activity_dict_df, 'Activity', name='activity dictionary').add_columns(hr_dict_activity_report_df)
+    DimensionIndex(hr_names_df, 'Name', name='HR names list').add_columns(hr_dict_activity_report_df)
 
     # Convert 'New_activity' column to string data type, then convert all values to lowercase and remove any leading/trailing whitespace
-    hr_dict_activity_report_df['New_Activity'] = hr_dict_activity_report_df['New_Activity'].astype(str)
-    hr_dict_activity_report_df['New_Activity'] = hr_dict_activity_report_df['New_Activity'].str.lower().str.strip()
+    hr_dict_activity_report_df['New_Activity'] = map_categories(hr_dict_activity_report_df['New_Activity'],
+                                                                lambda activities: activities.astype(str).str.lower().str.strip())
 
     # Convert the 'Creation time' column to a timestamp
-    hr_dict_activity_report_df['Creation time'] = pd.to_datetime(activity_report_df['Creation time'])
+    hr_dict_activity_report_df['Creation time'] = pd.to_datetime(hr_dict_activity_report_df['Creation time'])
 
 
-    print(f"Total rows from source : {total_rows_from_source} ({total_rows_from_source / total_rows_from_source * 100:.2f}%)")
+    run_context.report_rows("Total rows from source :", total_rows_from_source)
     # Format the 'Creation time' column
     #hr_dict_activity_report_df['Creation time'] = hr_dict_activity_report_df['Creation time'].dt.strftime('%Y-%m-%d %H:%M:%S')
 
@@ -49,25 +62,25 @@ def preliminary_processing(activity_report_df: pd.DataFrame,
     activity_step_report_df = hr_dict_activity_report_df.loc[hr_dict_activity_report_df['Act_Is_Step'] == 1]
 
     total_rows_act_is_step = len(activity_step_report_df)
-    print(f"Total rows with Activity is Step  : {total_rows_act_is_step} ({total_rows_act_is_step / total_rows_from_source * 100:.2f}%)")
+    run_context.report_rows("Total rows with Activity is Step  :", total_rows_act_is_step)
 
-    print(f"Total rows dropped in this step: {total_rows_from_source - total_rows_act_is_step}")
+    run_context.report_count("Total rows dropped in this step:", total_rows_from_source - total_rows_act_is_step)
 
     #activity_step_report_df = pd.merge(activity_step_report_df, process_step_df, how="left", on=["New_Activity"])
     #activity_step_report_df = activity_step_report_df
 
     # Replace 'woken up' with 'unsnoozed' in the Activity column
-    activity_step_report_df['New_Activity'] = activity_step_report_df['New_Activity'].replace('woken up', 'unsnoozed')
+    activity_step_report_df['New_Activity'] = map_categories(activity_step_report_df['New_Activity'],
+                                                             lambda activities: activities.replace('woken up', 'unsnoozed'))
 
     # Use boolean indexing to drop rows where the Candidate column is empty or '-'
     activity_step_report_df = activity_step_report_df[
         (activity_step_report_df['Candidate'] != '') & (activity_step_report_df['Candidate'] != '-')]
 
     total_rows_candidate_not_empty = len(activity_step_report_df)
-    print(
-        f"Total rows with Candidate Name  : {total_rows_candidate_not_empty} ({total_rows_candidate_not_empty / total_rows_from_source * 100:.2f}%)")
-    print(f'')
-    print(f"Total rows dropped in this step: { total_rows_act_is_step- total_rows_candidate_not_empty}")
+    run_context.report_rows("Total rows with Candidate Name  :", total_rows_candidate_not_empty)
+    run_context.report_text('')
+    run_context.report_count("Total rows dropped in this step:", total_rows_act_is_step - total_rows_candidate_not_empty)
 
     # create a new column that equals 1 if the candidate has been referred at one point and drop the activity 'Referred a candidate'
     activity_step_report_df["act_is_referred"] = activity_step_report_df.apply(
@@ -79,32 +92,31 @@ def preliminary_processing(activity_report_df: pd.DataFrame,
     activity_step_report_df = activity_step_report_df[activity_step_report_df['New_Activity'] != "referred a candidate"]
 
     total_rows_without_reffered_a_candidate = len(activity_step_report_df)
-    print(
-        f"Total rows without reffered a candidate  : {total_rows_without_reffered_a_candidate} ({total_rows_without_reffered_a_candidate/ total_rows_from_source * 100:.2f}%)")
+    run_context.report_rows("Total rows without reffered a candidate  :", total_rows_without_reffered_a_candidate)
 
-    print(f"Total rows dropped in this step: {total_rows_candidate_not_empty - total_rows_without_reffered_a_candidate}")
+    run_context.report_count("Total rows dropped in this step:",
+                             total_rows_candidate_not_empty - total_rows_without_reffered_a_candidate)
     # Change activity disqualified or auto disqualified by out of process & come back to avoid counting a new application when it's not (application are counted from disqualify)
     # Sort the DataFrame by 'Candidate' and 'Creation time'
     activity_step_report_df = activity_step_report_df.sort_values(by=['Candidate', 'Creation time'])
     # Reset the index
     activity_step_report_df = activity_step_report_df.reset_index(drop=True)
 
-    def update_new_activity(row, df):
-        current_idx = row.name
-        if row['New_Activity'] == 'reverted' and current_idx > 0:
-            prev_activity = df.at[current_idx - 1, 'New_Activity']
-            if prev_activity in ['disqualified', 'auto-disqualified']:
-                df.at[current_idx - 1, 'New_Activity'] = 'out of process and back'
-
-    # Update the 'New_Activity' column based on the conditions
-    activity_step_report_df.apply(lambda row: update_new_activity(row, activity_step_report_df), axis=1)
+    # Update the 'New_Activity' column based on the previous/next activity of the same candidate
+    activity_step_report_df['New_Activity'] = apply_activity_rewrite_rules(activity_step_report_df,
+                                                                           ACTIVITY_REWRITE_RULES)
 
     # Create a new column called 'Candidate_Appl_movedtojobposition' that indicates whether a candidate has moved to a job position
-    activity_step_report_df['Candidate_movedtojobposition'] = activity_step_report_df.groupby('Candidate')['New_Activity'].transform(lambda
-                                                             x: int(any('moved to job position' in activity for activity in x)))
+    # (the activities are checked once per category, then the flag is broadcast by candidate)
+    is_moved_to_job = map_categories(activity_step_report_df['New_Activity'],
+                                     lambda activities: activities.str.contains('moved to job position', regex=False),
+                                     as_category=False).fillna(False).astype(int)
+    activity_step_report_df['Candidate_movedtojobposition'] = is_moved_to_job.groupby(
+        activity_step_report_df['Candidate']).transform('max')
 
-    # Create temp ID , Combine the 'Candidate' and 'Job' columns to create a new column 'ID'
-    activity_step_report_df['ID'] = activity_step_report_df.apply(lambda row: f"{row['Candidate']}_{row['Job']}", axis=1)
+    # Create temp ID , encode the 'Candidate' and 'Job' columns into a new int64 column 'ID' (internal to the run,
+    # the IDs for HR review get the readable '<Candidate>_<Job>' label when they are built)
+    activity_step_report_df['ID'] = encode_composite_key(activity_step_report_df, ID_KEY_COLS)
 
     # Add a new Column called : new_job , which will be later transformed for some records after the creation of the new ID
     activity_step_report_df['new_Job'] = activity_step_report_df['Job']
@@ -115,35 +127,31 @@ def preliminary_processing(activity_report_df: pd.DataFrame,
     not_moved_to_job_df = activity_step_report_df.loc[activity_step_report_df['Candidate_movedtojobposition'] == 0]
     not_moved_to_job_df.reset_index(inplace=True)
 
-    # upload the temp dataframes to the temp file
-    export_path=r'.\temp'
-    moved_to_job_df.to_excel(os.path.join(export_path, 'moved_to_job_df.xlsx'))
-    not_moved_to_job_df.to_excel(os.path.join(export_path, 'not_moved_to_job_df.xlsx'))
-
 
 
     # Stats on Candidates without Moved to Job
 
     num_rows_not_moved_to_job_df = len(not_moved_to_job_df)
-    percentage_not_moved_to_job_df = (num_rows_not_moved_to_job_df / total_rows_from_source) * 100
     unique_ids_df2 = not_moved_to_job_df['ID'].nunique()
 
-    print("Candidates without Moved to Job position :")
-    print(f"Number of rows: {num_rows_not_moved_to_job_df}")
-    print(f"Percentage relative to total rows: {percentage_not_moved_to_job_df:.2f}%")
-    print(f"Number of unique application IDs: {unique_ids_df2}")
+    run_context.report_text("Candidates without Moved to Job position :")
+    run_context.report_count("Number of rows:", num_rows_not_moved_to_job_df)
+    run_context.report_share("Percentage relative to total rows:", num_rows_not_moved_to_job_df)
+    run_context.report_count("Number of unique application IDs:", unique_ids_df2)
 
     return moved_to_job_df,not_moved_to_job_df
 
 
 
-def not_moved_to_job_data_processor(not_moved_to_job_df: pd.DataFrame) -> pd.DataFrame:
+@instrumented_stage('not_moved_to_job')
+def not_moved_to_job_data_processor(not_moved_to_job_df: pd.DataFrame, run_context: RunContext) -> pd.DataFrame:
     """
     Process the input DataFrame for candidates who have not moved forward in the job application process.
 
     Args:
         not_moved_to_job_df (pandas.DataFrame): The input DataFrame containing data on candidates who have not moved
         forward in the job application process.
+        run_context (RunContext): The context of the current run, holding the checkpoint store.
 
     Returns:
         pandas.DataFrame: The processed DataFrame containing data on candidates who have not moved forward in the job
@@ -164,17 +172,16 @@ def not_moved_to_job_data_processor(not_moved_to_job_df: pd.DataFrame) -> pd.Dat
     # Drop the temporary column 'ID'
     #not_moved_to_job_df = not_moved_to_job_df.drop('ID', axis=1)
 
-    # Create the new column 'unique_ID' by combining 'Candidate', 'Job', and 'Nb_of_appl_disq'
-    not_moved_to_job_df['unique_ID'] = not_moved_to_job_df[
-                                                    ['Candidate', 'new_Job', 'Nb_of_appl_disq']].apply(lambda x: '_'.join(x.astype(str)), axis=1)
+    # Create the new column 'unique_ID' by encoding 'Candidate', 'Job', and 'Nb_of_appl_disq'
+    not_moved_to_job_df['unique_ID'] = encode_composite_key(not_moved_to_job_df, UNIQUE_ID_KEY_COLS)
 
-    not_moved_to_job_df.to_excel(r'./temp/nomovedtojob_beforeID.xlsx')
     # Further process the dataframe , with the new key = unique_ID
     not_moved_to_job_df = shared_processing(input_df=not_moved_to_job_df, key='unique_ID')
 
     return not_moved_to_job_df
 
-def moved_to_job_data_processor(moved_to_job_df: pd.DataFrame) -> tuple:
+@instrumented_stage('moved_to_job')
+def moved_to_job_data_processor(moved_to_job_df: pd.DataFrame, run_context: RunContext) -> tuple:
     """
     This function takes a pandas DataFrame containing data on candidates' job moves and performs several processing steps to generate two modified DataFrames.
     The first modified DataFrame contains data for candidates whose first activity is a job move.
@@ -182,6 +189,7 @@ def moved_to_job_data_processor(moved_to_job_df: pd.DataFrame) -> tuple:
 
     Args:
         moved_to_job_df: A pandas DataFrame containing data on candidates' job moves.
+        run_context: The context of the current run, collecting the funnel statistics and holding the checkpoint store.
 
     Returns:
         A tuple of two pandas DataFrames containing the modified data.
@@ -200,7 +208,7 @@ def moved_to_job_data_processor(moved_to_job_df: pd.DataFrame) -> tuple:
         raise ValueError("Input dataframe is empty.")
 
     # Calculate the number of activities per candidate per activity type
-    moved_to_job_df['activity_count'] = moved_to_job_df.groupby(['Candidate', 'New_Activity'])[
+    moved_to_job_df['activity_count'] = moved_to_job_df.groupby(['Candidate', 'New_Activity'], observed=True)[
         'New_Activity'].transform('count')
 
     # Create a new column called 'candidate_first_activity' that indicates whether a row represents the first activity for a candidate
@@ -229,8 +237,8 @@ def moved_to_job_data_processor(moved_to_job_df: pd.DataFrame) -> tuple:
     moved_to_job_first_only_df = moved_to_job_df[moved_to_job_df['Candidate'].isin(moved_to_job_first_line_only_df['Candidate'])]
 
     # Replace 'moved to job position' with 'Applied with moved to job position'
-    moved_to_job_first_only_df['New_Activity'] = moved_to_job_first_only_df['New_Activity'].replace(
-        'moved to job position', 'applied with moved to job position')
+    moved_to_job_first_only_df['New_Activity'] = map_categories(moved_to_job_first_only_df['New_Activity'],
+        lambda activities: activities.replace('moved to job position', 'applied with moved to job position'))
 
     # Get the rest of the candidates in a separate DataFrame
     moved_time_activity_report_df = moved_to_job_df[
@@ -251,38 +259,34 @@ def moved_to_job_data_processor(moved_to_job_df: pd.DataFrame) -> tuple:
     moved_time_activity_report_df['new_Job'] = moved_time_activity_report_df.groupby(['Candidate', 'Nb_of_appl_disq'])['Job'].transform(lambda x: x.iloc[-1])
 
     # create the new col unique_ID = candidate + job + nb_appl
-    moved_time_activity_report_df['unique_ID'] = moved_time_activity_report_df[['Candidate', 'new_Job', 'Nb_of_appl_disq']].apply(lambda x: '_'.join(x.astype(str)), axis=1)
+    moved_time_activity_report_df['unique_ID'] = encode_composite_key(moved_time_activity_report_df, UNIQUE_ID_KEY_COLS)
 
     # Further process the dataframe , with the new key = unique_ID
-    moved_time_activity_report_df.to_excel(r'./temp/movedtojob_not_first__beforeID.xlsx')
     moved_time_activity_report_df = shared_processing(input_df=moved_time_activity_report_df, key='unique_ID')
 
     # create the new col unique_ID = candidate + job + nb_appl
-    moved_to_job_first_only_df ['unique_ID'] = moved_to_job_first_only_df [['Candidate', 'new_Job', 'Nb_of_appl_disq']] .apply(lambda x: '_'.join(x.astype(str)), axis=1)
+    moved_to_job_first_only_df['unique_ID'] = encode_composite_key(moved_to_job_first_only_df, UNIQUE_ID_KEY_COLS)
 
     # Further process the dataframe , with the new key = unique_ID
-    moved_to_job_first_only_df.to_excel(r'./temp/movedtojob_position_first_only__beforeID.xlsx')
     moved_to_job_first_only_df = shared_processing(input_df=moved_to_job_first_only_df, key='unique_ID')
 
     # Stats on Moved to Job position Candidates
-    print('Candidates with Moved to Job 1+ : ')
+    run_context.report_text('Candidates with Moved to Job 1+ : ')
     num_rows_moved_to_job_df = len(moved_time_activity_report_df)
-    percentage_moved_to_job_df = (num_rows_moved_to_job_df / total_rows_from_source) * 100
     unique_ids_df1 = moved_time_activity_report_df['unique_ID'].nunique()
-    print(f"Number of rows: {num_rows_moved_to_job_df}")
-    print(f"Percentage relative to total rows: {percentage_moved_to_job_df:.2f}%")
-    print(f"Number of unique application IDs: {unique_ids_df1}")
+    run_context.report_count("Number of rows:", num_rows_moved_to_job_df)
+    run_context.report_share("Percentage relative to total rows:", num_rows_moved_to_job_df)
+    run_context.report_count("Number of unique application IDs:", unique_ids_df1)
 
-    print('* Candidates with Moved to Job , First only : ')
+    run_context.report_text('* Candidates with Moved to Job , First only : ')
     num_rows_moved_to_job_first_df = len(moved_to_job_first_only_df)
-    percentage_moved_to_job_first_df = (num_rows_moved_to_job_first_df/ total_rows_from_source) * 100
 
     unique_ids_df2 = moved_to_job_first_only_df['unique_ID'].nunique()
 
-    print("* Candidates with Moved to Job position First Only  :")
-    print(f"Number of rows: {num_rows_moved_to_job_first_df}")
-    print(f"Percentage relative to total rows: {percentage_moved_to_job_first_df:.2f}%")
-    print(f"Number of unique application IDs: {unique_ids_df2}")
+    run_context.report_text("* Candidates with Moved to Job position First Only  :")
+    run_context.report_count("Number of rows:", num_rows_moved_to_job_first_df)
+    run_context.report_share("Percentage relative to total rows:", num_rows_moved_to_job_first_df)
+    run_context.report_count("Number of unique application IDs:", unique_ids_df2)
 
 
     return moved_to_job_first_only_df , moved_time_activity_report_df
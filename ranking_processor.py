@@ -1,7 +1,12 @@
 from typing import List, Union
 import pandas as pd
+import numpy as np
 from datetime import datetime
-from constants import OK_MESSAGE,total_rows_from_source,ACTIONS_NOT_IN_RIGHT_ORDER
+from constants import OK_MESSAGE,ACTIONS_NOT_IN_RIGHT_ORDER,RANKING_DICT_KEY_COLS
+from dtype_policy import map_categories
+from dimension_lookup import DimensionIndex
+from group_index import GroupIndex
+from stage_metrics import instrumented_stage
 
 class RankingProcessor:
     def __init__(self, ranking_dict_df):
@@ -12,6 +17,12 @@ class RankingProcessor:
         if "c_activity" not in self.ranking_dict_df.columns or "Rank" not in self.ranking_dict_df.columns:
             raise ValueError("ranking_dict_df must have 'c_activity' and 'Rank' columns")
 
+        # Build the c_activity -> rank lookup once (the last rank wins for a duplicated c_activity)
+        rank_table = self.ranking_dict_df.drop_duplicates(subset="c_activity", keep="last")
+        self.rank_dict = dict(zip(rank_table["c_activity"], rank_table["Rank"]))
+        self._activity_index = pd.Index(rank_table["c_activity"])
+        self._ranks = pd.to_numeric(rank_table["Rank"], errors="coerce").to_numpy(dtype=float)
+
     def is_ordered(self, rankings):
         """
         Takes a list of lists of rankings and returns 1 if all the lists are ordered, else 0.
@@ -46,23 +57,185 @@ class RankingProcessor:
 
     def lists_to_ranks(self, *input_lists ):
 
-
-        # Create a dictionary to map c_activity values to ranks
-        rank_dict = dict(zip(self.ranking_dict_df["c_activity"], self.ranking_dict_df["Rank"]))
-
         # Loop over each input list and map each value to its corresponding rank
         result = []
         for lst in input_lists:
-            ranks = [rank_dict.get(item) for item in lst]
+            ranks = [self.rank_dict.get(item) for item in lst]
             result.append(ranks)
 
         return result
+
+    # ---- Batch API : a column of sequences is passed as flattened values plus group offsets ----
+    # offsets has one more element than the number of sequences, sequence i is values[offsets[i]:offsets[i + 1]]
+
+    @staticmethod
+    def group_offsets(keys) -> np.ndarray:
+        """
+        Takes a column of keys where the rows of each sequence are contiguous and returns the sequence offsets.
+        """
+        keys = pd.Series(keys).to_numpy()
+        if len(keys) == 0:
+            return np.zeros(1, dtype=np.int64)
+        starts = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        return np.concatenate([[0], starts, [len(keys)]]).astype(np.int64)
+
+    def batch_to_ranks(self, values) -> np.ndarray:
+        """
+        Takes an array of c_activity values and returns the array of their ranks (NaN when not in the dictionary).
+        """
+        codes = self._activity_index.get_indexer(pd.Index(values))
+        ranks = np.full(len(codes), np.nan)
+        found = codes >= 0
+        ranks[found] = self._ranks[codes[found]]
+        return ranks
+
+    def batch_is_ordered(self, ranks, offsets) -> np.ndarray:
+        """
+        Takes flattened rankings and their offsets and returns, for each sequence, 1 if it is ordered, else 0.
+        A sequence containing a missing rank is not ordered.
+        """
+        ranks = np.asarray(ranks, dtype=float)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        nb_sequences = len(offsets) - 1
+        sequence_ids = np.repeat(np.arange(nb_sequences), np.diff(offsets))
+
+        # A step breaks the order when it is lower than the previous step of the same sequence
+        same_sequence = sequence_ids[1:] == sequence_ids[:-1]
+        unordered_steps = same_sequence & ~(np.diff(ranks) >= 0)
+        unordered = np.bincount(sequence_ids[1:][unordered_steps], minlength=nb_sequences) > 0
+        unordered |= np.bincount(sequence_ids[np.isnan(ranks)], minlength=nb_sequences) > 0
+
+        return (~unordered).astype(int)
+
+    def batch_split_on_value(self, values, offsets, delimiter: Union[int, float]) -> tuple:
+        """
+        Batch version of split_on_value : every delimiter starts a new segment of its sequence, the values
+        before the first delimiter of a sequence are dropped, and 0 values are removed from the segments.
+
+        Returns a tuple (segment_values, segment_offsets, segment_sequence) where segment_sequence holds
+        the index of the sequence each segment comes from.
+        """
+        assert isinstance(delimiter, (int, float)), "Delimiter value must be an integer or float."
+        values = np.asarray(values)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        nb_sequences = len(offsets) - 1
+        sequence_ids = np.repeat(np.arange(nb_sequences), np.diff(offsets))
+
+        is_delimiter = values == delimiter
+        delimiter_count = np.cumsum(is_delimiter)
+        # Number of delimiters seen since the start of the sequence of each value
+        count_before_sequence = np.concatenate([[0], delimiter_count])[offsets[:-1]]
+        in_segment = (delimiter_count - count_before_sequence[sequence_ids]) > 0
+
+        keep = in_segment & (values != 0)
+        segment_ids = delimiter_count[keep] - 1
+        segment_sizes = np.bincount(segment_ids, minlength=int(is_delimiter.sum()))
+
+        segment_offsets = np.concatenate([[0], np.cumsum(segment_sizes)]).astype(np.int64)
+        return values[keep], segment_offsets, sequence_ids[is_delimiter]
+
+
+def dictionary_version_cutoffs(ranking_dict: pd.DataFrame) -> pd.DataFrame:
+    """
+    Build the go-live date of each ranking dictionary version by department, from the ranking dictionary itself.
+
+    Every version above 0 ('updated' column) carries its go-live date in the 'last_update' column.
+    Adding a version or a department to the dictionary sheet requires no code change.
+
+    Args:
+        ranking_dict: The ranking dictionary DataFrame with 'Department_ST', 'updated' and 'last_update' columns.
+
+    Returns:
+        A DataFrame with one row per ('Department_ST', 'updated') version and its 'last_update' cutoff date.
+    """
+    versions_df = ranking_dict.loc[ranking_dict['updated'] > 0, ['Department_ST', 'updated', 'last_update']]
+    versions_df = versions_df.dropna(subset=['last_update'])
+
+    return versions_df.groupby(['Department_ST', 'updated'], as_index=False, observed=True)['last_update'].min()
+
+
+def dictionary_version(unified_df: pd.DataFrame, cutoffs_df: pd.DataFrame) -> pd.Series:
+    """
+    Get the ranking dictionary version ('updated') of each activity : the latest version of its department
+    whose cutoff date is before the activity creation time, 0 if none.
+    """
+    updated = pd.Series(0, index=unified_df.index)
+
+    # One vectorized comparison per version, later versions override the earlier ones
+    for version, version_cutoffs_df in cutoffs_df.groupby('updated'):
+        version_cutoff_dates = version_cutoffs_df.set_index('Department_ST')['last_update']
+        cutoff_dates = map_categories(unified_df['Department_ST'],
+                                      lambda departments: departments.map(version_cutoff_dates), as_category=False)
+        updated = updated.mask(unified_df['new_creation_time'] > cutoff_dates, version)
+
+    return updated
+
+
+def check_steps_order(golden_source_df: pd.DataFrame, groups: GroupIndex, rank_col: str = 'rank') -> pd.DataFrame:
+    """
+    Check the ranks of each application are in increasing order, from a single diff within the groups.
+
+    A step is out of order when its rank is lower than the previous one of the same application,
+    or when it has no rank.
+
+    Args:
+        golden_source_df: The golden source DataFrame, sorted by time within each application.
+        groups: The GroupIndex of the applications over the rows of golden_source_df.
+        rank_col: The column name holding the ranks.
+
+    Returns:
+        A DataFrame aligned on golden_source_df with the columns :
+        - 'red_flag' : 1 if the application has a step out of order, else 0.
+        - 'Comments' : OK_MESSAGE or ACTIONS_NOT_IN_RIGHT_ORDER.
+        - 'first_unordered_step' : position (starting at 1) of the first step out of order in the application.
+    """
+    ranks = golden_source_df[rank_col].to_numpy(dtype=float)
+
+    step_is_unordered = (groups.diff(ranks) < 0) | np.isnan(ranks)
+    step_position = groups.cumcount() + 1
+
+    first_unordered_step = pd.Series(groups.transform(np.where(step_is_unordered, step_position, np.nan), 'min'),
+                                     index=golden_source_df.index)
+    red_flag = first_unordered_step.notna().astype(int)
+
+    return pd.DataFrame({
+        'red_flag': red_flag,
+        'Comments': np.where(red_flag == 1, ACTIONS_NOT_IN_RIGHT_ORDER, OK_MESSAGE),
+        'first_unordered_step': first_unordered_step,
+    }, index=golden_source_df.index)
+
+
+def ranking_dict_entries(ranking_dict: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normalize the steps of the ranking dictionary like those of the golden source (lower case, stripped) and keep
+    one entry per department, step and version.
+
+    The dictionary is maintained by hand and may list a step twice for the same version : the first entry (in the
+    order of the sheet) is used, the others are printed in a warning to be fixed in the sheet.
+
+    Args:
+        ranking_dict: The ranking dictionary DataFrame.
+
+    Returns:
+        The normalized ranking dictionary DataFrame, a copy.
+    """
+    ranking_dict = ranking_dict.copy()
+    ranking_dict['Process_Step'] = map_categories(ranking_dict['Process_Step'], lambda steps: steps.str.lower().str.strip())
+
+    return DimensionIndex(ranking_dict, RANKING_DICT_KEY_COLS, name='ranking dictionary',
+                          duplicates='first').dimension_df
+
+
+@instrumented_stage('ranking')
 def ranking_proc_phase(unified_df, ranking_dict):
-    unified_df['Process_Step'] = unified_df['Process_Step'].str.lower().str.strip()
-    ranking_dict['Process_Step'] = ranking_dict['Process_Step'].str.lower().str.strip()
+    unified_df['Process_Step'] = map_categories(unified_df['Process_Step'], lambda steps: steps.str.lower().str.strip())
+    ranking_dict = ranking_dict_entries(ranking_dict)
+
+    # The applications of the golden source, indexed once (their rows keep their order, sorted by time)
+    groups = GroupIndex(unified_df['unique_ID'])
 
     # Check if the first value of 'Process_Step' column for each 'unique_ID' is not 'Applied'
-    first_process_not_applied = unified_df.groupby('unique_ID')['Process_Step'].transform('first') != 'applied'
+    first_process_not_applied = ~groups.transform(unified_df['Process_Step'].eq('applied'), 'first')
 
     # Update 'Comments' column with 'First Process not Applied' for the corresponding rows
     unified_df.loc[first_process_not_applied, 'Comments'] = 'First Process not Applied'
@@ -72,25 +245,10 @@ def ranking_proc_phase(unified_df, ranking_dict):
     unified_df.loc[
         ~first_process_not_applied, 'id_first_activity_applied'] = 1  # Set 1 for rows where first_process_not_applied is False
 
-    # Define the mapping dictionary
-    mapping_dict = {
-        'Business Research': {'date': pd.to_datetime('2022-05-01'), 'format': '%b-%y'},
-        'Data Analytics': {'date': pd.to_datetime('2022-10-01'), 'format': '%b-%y'},
-        'Business Translation': {'date': pd.to_datetime('2023-04-01'), 'format': '%b-%y'}
-    }
-
-    def get_last_update(row):
-        department = row['Department_ST']  # Get the department value for the row
-        update_date = row['new_creation_time']
-
-        if department in mapping_dict:
-            if update_date > mapping_dict[department]['date']:
-                return 1
-        return 0
-
-    unified_df['new_creation_time'] = pd.to_datetime(unified_df['new_creation_time'])
-    unified_df['updated'] = unified_df.apply(get_last_update, axis=1)
-    golden_source_df = pd.merge(unified_df, ranking_dict, on=['Department_ST', 'Process_Step', 'updated'], how='left')
+    # Flag the activities created after the go-live date of the ranking dictionary version of their department
+    unified_df['updated'] = dictionary_version(unified_df, dictionary_version_cutoffs(ranking_dict))
+    golden_source_df = unified_df.copy(deep=False)
+    DimensionIndex(ranking_dict, RANKING_DICT_KEY_COLS, name='ranking dictionary').add_columns(golden_source_df)
 
     # Fill any null values in the "Process Step" column with an empty string
     golden_source_df['updated'].fillna('', inplace=True)
@@ -101,25 +259,12 @@ def ranking_proc_phase(unified_df, ranking_dict):
     # Format 'update_date' to month-year
     golden_source_df['last_update'] = golden_source_df['last_update'].dt.strftime('%B-%Y')
 
-    # Create a helper function to check if a series is sorted
-    def check_sorted(s):
-        if s.is_monotonic_increasing:
-            return OK_MESSAGE
-        else:
-            return ACTIONS_NOT_IN_RIGHT_ORDER
-
-    # Apply the function to each group (unique_Id), and assign results to a new column 'Comments'
-    golden_source_df['Comments'] = golden_source_df.groupby('unique_ID')['rank'].transform(check_sorted)
-
-    # Create a helper function for the 'red_flag' column
-    def flag_sorted(s):
-        if s.is_monotonic_increasing:
-            return 0
-        else:
-            return 1
-
-    # Apply the function to each group (unique_Id), and assign results to a new column 'red_flag'
-    golden_source_df['red_flag'] = golden_source_df.groupby('unique_ID')['rank'].transform(flag_sorted)
+    # Check the ranks of each application are in the right order, and flag the applications that are not
+    steps_order_df = check_steps_order(golden_source_df, groups)
+    golden_source_df[['red_flag', 'first_unordered_step']] = steps_order_df[['red_flag', 'first_unordered_step']]
 
+    # Keep the 'First Process not Applied' comment, the other rows get the comment of the order check
+    golden_source_df['Comments'] = golden_source_df['Comments'].fillna(steps_order_df['Comments'])
 
-    return unified_df
+    # The ranked frame, with the dictionary columns and the flags of the order check
+    return golden_source_df
@@ -0,0 +1,76 @@
+import pandas as pd
+
+
+class RunContext:
+    """
+    Holds the state of one pipeline run that the processing stages need, created by main.py once the
+    activity report has been loaded (importing the processing modules does not read any file).
+    """
+
+    def __init__(self, total_rows_from_source: int, verbose: bool = True):
+        # Validate input
+        if not isinstance(total_rows_from_source, int) or total_rows_from_source <= 0:
+            raise ValueError("total_rows_from_source must be a positive integer")
+        self.total_rows_from_source = total_rows_from_source
+        # Print the funnel statistics as they are reported
+        self.verbose = verbose
+        # Funnel statistics reported by the stages, as (kind, label, value) tuples
+        self.funnel_stats = []
+        # Output DataFrames computed by the stages besides their result (e.g. 'ids_ko'), written by main.py
+        self.outputs = {}
+
+    @classmethod
+    def from_activity_report(cls, activity_report_df: pd.DataFrame) -> "RunContext":
+        """
+        Create the run context from the loaded activity report.
+        """
+        return cls(total_rows_from_source=len(activity_report_df))
+
+    def for_stage(self) -> "RunContext":
+        """
+        Create a context of the same run for a single stage : its funnel statistics and outputs are kept apart and
+        not printed, to be reported in order when stages run at the same time.
+        """
+        return RunContext(self.total_rows_from_source, verbose=False)
+
+    def report_rows(self, label: str, nb_rows: int) -> None:
+        """
+        Report a number of rows of the funnel, followed by its percentage of the rows from source.
+        """
+        self.report_stat(('rows', label, nb_rows))
+
+    def report_share(self, label: str, nb_rows: int) -> None:
+        """
+        Report the percentage of the rows from source a number of rows represents.
+        """
+        self.report_stat(('share', label, nb_rows))
+
+    def report_count(self, label: str, value: int) -> None:
+        """
+        Report a count (dropped rows, applications, ...) as is.
+        """
+        self.report_stat(('count', label, value))
+
+    def report_text(self, label: str) -> None:
+        """
+        Report a line of text introducing the next statistics.
+        """
+        self.report_stat(('text', label, None))
+
+    def report_stat(self, stat: tuple) -> None:
+        """
+        Record a (kind, label, value) funnel statistic, and print it when the run is verbose.
+        """
+        self.funnel_stats.append(stat)
+        if self.verbose:
+            print(self.format_stat(stat))
+
+    def format_stat(self, stat: tuple) -> str:
+        kind, label, value = stat
+        if kind == 'rows':
+            return f"{label} {value} ({value / self.total_rows_from_source * 100:.2f}%)"
+        if kind == 'share':
+            return f"{label} {value / self.total_rows_from_source * 100:.2f}%"
+        if kind == 'count':
+            return f"{label} {value}"
+        return label
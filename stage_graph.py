@@ -0,0 +1,363 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+from checkpoint_store import CheckpointStore
+from run_context import RunContext
+
+
+def code_fingerprint(modules: list) -> str:
+    """
+    Returns a short hash of the source of the given modules, a change of any of them changes the fingerprint.
+    """
+    digest = hashlib.sha256()
+    for module in sorted(modules):
+        with open(importlib.util.find_spec(module).origin, 'rb') as file:
+            digest.update(file.read())
+
+    return digest.hexdigest()[:16]
+
+
+def json_value(value):
+    """
+    Convert the numpy scalars (e.g. a funnel statistic) to the Python value saved in JSON.
+    """
+    return value.item() if hasattr(value, 'item') else value
+
+
+class Stage:
+    """
+    A node of the stage graph : a function computing named results from the results of other stages.
+    """
+
+    def __init__(self, name: str, function, inputs: list = (), outputs: list = None, code_modules: list = (),
+                 key=None, persist: bool = True, error_messages: dict = None):
+        """
+        Args:
+            name: The name of the stage, as given to --from-stage and --until-stage.
+            function: Called with the values of inputs in order, returns the value of its single output or the tuple
+                of the values of its outputs. A RunContext input is replaced by a context of its own
+                (see RunContext.for_stage), so the stages running at the same time report their funnel in order.
+            inputs: The names of the results the stage is computed from.
+            outputs: The names of the results of the stage, by default the name of the stage.
+            code_modules: The modules the results depend on, their source is part of the fingerprint of the stage.
+            key: A function returning what else the results depend on (e.g. the fingerprint of a loaded file).
+            persist: Save the results, so the stage is skipped by the next runs while its fingerprint is unchanged.
+                The stages with side effects (writing outputs) or cheaper to run than to load are not saved.
+            error_messages: The messages printed when the stage fails, by exception type, formatted with the error.
+        """
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.outputs = [name] if outputs is None else list(outputs)
+        self.code_modules = list(code_modules)
+        self.key = key
+        self.persist = persist
+        self.error_messages = error_messages or {}
+
+
+class StageError(Exception):
+    """
+    Raised by StageGraph.run when a stage fails, with the failed stage and its error.
+    """
+
+    def __init__(self, stage: Stage, error: Exception):
+        self.stage = stage
+        self.error = error
+        message = next((message for error_type, message in stage.error_messages.items()
+                        if isinstance(error, error_type)), "Error: stage {} failed with message: {}")
+        self.message = message.format(*([stage.name] if message.count('{}') == 2 else []), str(error))
+        super().__init__(self.message)
+
+
+class StageGraph:
+    """
+    Runs a graph of stages, each stage running once the stages computing its inputs are done, the independent
+    stages at the same time on a pool of threads.
+
+    The results of the stages are saved in a CheckpointStore named after the stage and its fingerprint : the hash
+    of its code, of its key and of the fingerprints of its inputs. A stage whose fingerprint did not change since
+    a previous run is skipped, its results are only loaded when a stage running needs them, and the funnel
+    statistics it reported are reported again in the order of the stages.
+    """
+
+    def __init__(self, stages: list, checkpoint_dir: str = '', checkpoint_mode: str = 'off', max_workers: int = 1,
+                 common_code_modules: list = (), run_context_result: str = None):
+        """
+        Args:
+            stages: The stages, each one after the stages computing its inputs.
+            checkpoint_dir: The directory of the saved results.
+            checkpoint_mode: The CheckpointStore mode of the saved results, 'off' to run all the stages every time.
+            max_workers: The number of stages running at the same time.
+            common_code_modules: The modules all the stages depend on.
+            run_context_result: The result holding the RunContext the funnel statistics are reported to.
+        """
+        self.stages = {}
+        self.producers = {}
+        for stage in stages:
+            # Validate input
+            if stage.name in self.stages:
+                raise ValueError(f"Two stages are named {stage.name}")
+            duplicated_outputs = [output for output in stage.outputs if output in self.producers]
+            if duplicated_outputs:
+                raise ValueError(f"The results {duplicated_outputs} of stage {stage.name} are computed by another stage")
+            self.stages[stage.name] = stage
+            self.producers.update(dict.fromkeys(stage.outputs, stage))
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_mode = checkpoint_mode
+        self.max_workers = max_workers
+        self.common_code_modules = list(common_code_modules)
+        self.run_context_result = run_context_result
+        self._results = {}
+        self._result_locks = {}
+        self._manifests = {}
+        self._stores = {}
+
+    def upstream(self, name: str) -> set:
+        """
+        Names of the stages the results of a stage depend on, directly or not.
+        """
+        names = set()
+        for result in self.stages[name].inputs:
+            if result in self.producers:
+                names |= {self.producers[result].name} | self.upstream(self.producers[result].name)
+        return names
+
+    def downstream(self, name: str) -> set:
+        """
+        Names of the stages depending on the results of a stage, directly or not.
+        """
+        return {other for other in self.stages if name in self.upstream(other)}
+
+    def fingerprints(self, provided: dict) -> dict:
+        """
+        Fingerprint of every stage, None for the stages depending on provided results (never saved).
+        """
+        fingerprints = {}
+        for name, stage in self.stages.items():
+            producers = [self.producers.get(result) for result in stage.inputs]
+            if any(result in provided or producer is None or fingerprints[producer.name] is None
+                   for result, producer in zip(stage.inputs, producers)):
+                fingerprints[name] = None
+                continue
+            input_fingerprints = [f"{fingerprints[producer.name]}-{result}"
+                                  for result, producer in zip(stage.inputs, producers)]
+            try:
+                key = stage.key() if stage.key is not None else None
+            except Exception as e:
+                raise StageError(stage, e)
+            settings = {'stage': name, 'outputs': stage.outputs, 'inputs': input_fingerprints,
+                        'code': code_fingerprint(self.common_code_modules + stage.code_modules), 'key': key}
+            fingerprints[name] = hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        return fingerprints
+
+    def store(self, name: str, fingerprint: str) -> CheckpointStore:
+        key = f"{name}-{fingerprint}"
+        if key not in self._stores:
+            self._stores[key] = CheckpointStore(self.checkpoint_dir, mode=self.checkpoint_mode, fingerprint=key)
+        return self._stores[key]
+
+    def saved_manifest(self, name: str, fingerprint: str) -> dict:
+        """
+        The manifest of the results saved by a previous run of the stage with this fingerprint, None if there is none.
+        """
+        if self.checkpoint_mode == 'off' or not self.stages[name].persist or fingerprint is None:
+            return None
+        try:
+            return self.store(name, fingerprint).load_metadata()
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def plan(self, from_stage: str = None, until_stage: str = None, provided: dict = None) -> tuple:
+        """
+        Choose the stages to run : the stages needed by until_stage (by default the final stages) whose results
+        were not saved with the same fingerprint, and from_stage with the stages depending on it whatever
+        their fingerprint.
+
+        Returns:
+            A tuple of the names of the stages to run and of the skipped stages with saved results, in the
+            order of the stages, and of the fingerprints of the stages.
+        """
+        provided = provided or {}
+        for name in (from_stage, until_stage):
+            if name is not None and name not in self.stages:
+                raise ValueError(f"{name} is not a stage of the pipeline, the stages are {list(self.stages)}")
+        if until_stage is not None:
+            requested = [until_stage]
+        else:
+            consumed = {result for stage in self.stages.values() for result in stage.inputs}
+            requested = [name for name, stage in self.stages.items() if not set(stage.outputs) & consumed]
+        covered = set(requested).union(*(self.upstream(name) for name in requested))
+        if from_stage is not None and from_stage not in covered:
+            raise ValueError(f"Stage {from_stage} does not run before stage {until_stage}")
+        forced = {from_stage} | self.downstream(from_stage) if from_stage is not None else set()
+        fingerprints = self.fingerprints(provided)
+        self._manifests = {name: self.saved_manifest(name, fingerprints[name]) for name in covered}
+
+        to_run = set()
+
+        def require(name):
+            stage = self.stages[name]
+            if name in to_run or (stage.outputs and all(output in provided for output in stage.outputs)):
+                return
+            if name in forced or self._manifests[name] is None:
+                to_run.add(name)
+                for result in stage.inputs:
+                    if result not in provided:
+                        if result not in self.producers:
+                            raise ValueError(f"The input {result} of stage {name} is not provided")
+                        require(self.producers[result].name)
+
+        for name in requested + sorted(forced & covered):
+            require(name)
+        skipped = {name for name in covered - to_run if self._manifests[name] is not None}
+        # The funnel statistics of the skipped stages are reported again, to the run context of this run
+        if self.run_context_result is not None and any(self._manifests[name]['funnel_stats'] for name in skipped):
+            require(self.producers[self.run_context_result].name)
+
+        return ([name for name in self.stages if name in to_run], [name for name in self.stages if name in skipped],
+                fingerprints)
+
+    def result(self, name: str):
+        """
+        The value of a result, loaded from the results saved by its skipped stage the first time it is needed.
+        """
+        with self._result_locks.setdefault(name, threading.Lock()):
+            if name not in self._results:
+                stage = self.producers[name]
+                manifest = self._manifests[stage.name]
+                if name in manifest['dataframes']:
+                    self._results[name] = self.store(stage.name, manifest['fingerprint']).load(name)
+                else:
+                    self._results[name] = manifest['values'][name]
+            return self._results[name]
+
+    def save(self, stage: Stage, fingerprint: str, values: dict, funnel_stats: list) -> None:
+        """
+        Save the results of a stage with their manifest, replacing those of its previous fingerprints.
+        """
+        if self.checkpoint_mode == 'off' or not stage.persist or fingerprint is None:
+            return
+        store = self.store(stage.name, fingerprint)
+        try:
+            dataframes = []
+            for name, value in values.items():
+                if isinstance(value, pd.DataFrame):
+                    store.save(name, value)
+                    dataframes.append(name)
+            store.save_metadata({
+                'stage': stage.name, 'fingerprint': fingerprint, 'dataframes': dataframes,
+                'values': {name: json_value(value) for name, value in values.items() if name not in dataframes},
+                'funnel_stats': [[kind, label, json_value(value)] for kind, label, value in funnel_stats],
+            })
+        except Exception as e:
+            # Some results cannot be saved (e.g. columns mixing numbers and text in Parquet), the stage will run again
+            print(f"Warning: the results of stage {stage.name} could not be saved : {e}")
+            shutil.rmtree(store.directory, ignore_errors=True)
+            return
+
+        for name in os.listdir(self.checkpoint_dir):
+            path = os.path.join(self.checkpoint_dir, name)
+            if name.startswith(f"{stage.name}-") and path != store.directory and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def execute(self, stage: Stage, fingerprint: str) -> list:
+        """
+        Run a stage on the values of its inputs and save its results.
+
+        Returns:
+            The funnel statistics reported by the stage.
+        """
+        arguments = [self.result(name) for name in stage.inputs]
+        arguments = [argument.for_stage() if isinstance(argument, RunContext) else argument for argument in arguments]
+        values = stage.function(*arguments)
+        if len(stage.outputs) == 1:
+            values = (values,)
+        values = dict(zip(stage.outputs, values)) if stage.outputs else {}
+        funnel_stats = [stat for argument in arguments if isinstance(argument, RunContext)
+                        for stat in argument.funnel_stats]
+        self._results.update(values)
+        self.save(stage, fingerprint, values, funnel_stats)
+
+        return funnel_stats
+
+    def run(self, from_stage: str = None, until_stage: str = None, provided: dict = None) -> dict:
+        """
+        Run the stages chosen by plan, each one as soon as the stages computing its inputs are done.
+
+        Args:
+            from_stage: The stage to run from, whatever the saved results, with all the stages depending on it.
+            until_stage: The last stage to run, by default all of them.
+            provided: Results given instead of being computed by their stage (never saved).
+
+        Returns:
+            The results of until_stage, the results of the other stages being released once used.
+
+        Raises:
+            StageError: If a stage fails, once the stages already running are done.
+        """
+        provided = provided or {}
+        to_run, skipped, fingerprints = self.plan(from_stage, until_stage, provided)
+        self._results = dict(provided)
+
+        # The funnel statistics are reported in the order of the stages, whichever stage ends first
+        reported = [name for name in self.stages if name in to_run or name in skipped]
+        funnel_stats = {name: self._manifests[name]['funnel_stats'] for name in skipped}
+
+        def report_funnel():
+            while reported and reported[0] in funnel_stats:
+                name = reported.pop(0)
+                if name in skipped:
+                    print(f"Stage {name} skipped, its inputs and code did not change since the previous run")
+                stats = funnel_stats.pop(name)
+                if stats:
+                    run_context = self.result(self.run_context_result)
+                    for kind, label, value in stats:
+                        run_context.report_stat((kind, label, value))
+
+        # The results are released once the stages using them are done, but those of until_stage
+        kept = set(self.stages[until_stage].outputs) if until_stage is not None else set()
+        kept.add(self.run_context_result)
+        nb_uses = {}
+        for name in to_run:
+            for result in self.stages[name].inputs:
+                nb_uses[result] = nb_uses.get(result, 0) + 1
+
+        def release(results):
+            for result in results:
+                nb_uses[result] = nb_uses.get(result, 1) - 1
+                if nb_uses[result] <= 0 and result not in kept:
+                    self._results.pop(result, None)
+
+        pending = list(to_run)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name in list(pending):
+                    stage = self.stages[name]
+                    if not any(self.producers[result].name in pending + list(running.values())
+                               for result in stage.inputs if result in self.producers and result not in provided):
+                        running[executor.submit(self.execute, stage, fingerprints[name])] = name
+                        pending.remove(name)
+                report_funnel()
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        for other in running:
+                            other.cancel()
+                        pending = []
+                        raise StageError(self.stages[name], future.exception())
+                    funnel_stats[name] = future.result()
+                    release(self.stages[name].inputs)
+                    release(result for result in self.stages[name].outputs if result not in nb_uses)
+            report_funnel()
+
+        if until_stage is not None:
+            for result in self.stages[until_stage].outputs:
+                self.result(result)
+        return self._results
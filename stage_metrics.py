@@ -0,0 +1,139 @@
+import functools
+import importlib.util
+import json
+import sys
+import time
+from datetime import datetime
+import pandas as pd
+from run_context import RunContext
+
+# Columns holding the application key of the frames, the first one present is used to count the unique IDs
+APPLICATION_KEY_COLS = ['unique_ID', 'ID']
+
+
+def peak_memory_usage_mb(children: bool = False) -> float:
+    """
+    Get the peak resident memory (RSS) of the current process, or of its largest child process, in MB.
+
+    Uses the resource module on Unix, and psutil on Windows when it is installed (current process only).
+
+    Args:
+        children: Measure the largest of the terminated child processes (e.g. the workers) instead.
+
+    Returns:
+        The peak RSS in MB, or None when it cannot be measured.
+    """
+    if importlib.util.find_spec('resource'):
+        import resource
+        peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KB elsewhere
+        return peak_rss / 1024 ** 2 if sys.platform == 'darwin' else peak_rss / 1024
+    if importlib.util.find_spec('psutil') and not children:
+        import psutil
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, 'peak_wset', memory_info.rss) / 1024 ** 2
+    return None
+
+
+class StageMetrics:
+    """
+    Collects the metrics of the instrumented stages run by the current process, and emits them as JSON lines.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.output_path = None
+        self.run_id = None
+
+    def start_run(self, output_path: str = None) -> None:
+        """
+        Start recording a new run, its records are appended to output_path as JSON lines when given.
+        """
+        self.records = []
+        self.output_path = output_path
+        self.run_id = datetime.now().isoformat(timespec='seconds')
+
+    def add(self, record: dict) -> None:
+        record = {'run_id': self.run_id, **record}
+        self.records.append(record)
+        if self.output_path:
+            with open(self.output_path, 'a', encoding='utf-8') as output_file:
+                output_file.write(json.dumps(record, default=str) + '\n')
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Summarize the records by stage, in the order the stages ran. The stages run by several shards add up
+        their CPU time, rows and unique IDs, their wall time and peak memory are the largest of the shards.
+        """
+        if not self.records:
+            return pd.DataFrame()
+        # Counts missing from a stage (e.g. the rows in of the load) stay missing instead of adding up to 0
+        def sum_counts(counts):
+            return counts.sum(min_count=1)
+
+        records_df = pd.DataFrame(self.records)
+        summary_df = records_df.groupby('stage', sort=False).agg(calls=('stage', 'size'),
+                                                                 wall_time_s=('wall_time_s', 'max'),
+                                                                 cpu_time_s=('cpu_time_s', 'sum'),
+                                                                 peak_rss_mb=('peak_rss_mb', 'max'),
+                                                                 rows_in=('rows_in', sum_counts),
+                                                                 rows_out=('rows_out', sum_counts),
+                                                                 unique_ids_out=('unique_ids_out', sum_counts))
+        count_cols = ['rows_in', 'rows_out', 'unique_ids_out']
+        return summary_df.round(2).astype(dict.fromkeys(count_cols, 'Int64'))
+
+
+# Metrics of the stages run by this process (each worker process has its own)
+STAGE_METRICS = StageMetrics()
+
+
+def count_unique_ids(df: pd.DataFrame):
+    key = next((col for col in APPLICATION_KEY_COLS if col in df.columns), None)
+    return int(df[key].nunique()) if key is not None else None
+
+
+def instrumented_stage(stage: str):
+    """
+    Decorator recording, for every call of a pipeline stage, its wall and CPU time, the peak memory of the process,
+    the rows of its first input DataFrame and of its output DataFrame(s), the unique application IDs of the output,
+    and the funnel statistics it reported through the RunContext argument.
+
+    Only counters are read around the call : the overhead is the count of the unique IDs of the output.
+
+    Args:
+        stage: The name of the stage in the records.
+    """
+    def decorator(stage_function):
+        @functools.wraps(stage_function)
+        def wrapper(*args, **kwargs):
+            arguments = list(args) + list(kwargs.values())
+            input_df = next((arg for arg in arguments if isinstance(arg, pd.DataFrame)), None)
+            run_context = next((arg for arg in arguments if isinstance(arg, RunContext)), None)
+            rows_in = len(input_df) if input_df is not None else None
+            nb_funnel_stats = len(run_context.funnel_stats) if run_context is not None else 0
+
+            start_wall_time, start_cpu_time = time.perf_counter(), time.process_time()
+            result = stage_function(*args, **kwargs)
+            wall_time, cpu_time = time.perf_counter() - start_wall_time, time.process_time() - start_cpu_time
+
+            output_dfs = [df for df in (result if isinstance(result, tuple) else (result,))
+                          if isinstance(df, pd.DataFrame)]
+            unique_ids = [count_unique_ids(df) for df in output_dfs]
+            peak_rss_mb = peak_memory_usage_mb()
+            STAGE_METRICS.add({
+                'stage': stage,
+                'wall_time_s': round(wall_time, 3),
+                'cpu_time_s': round(cpu_time, 3),
+                'peak_rss_mb': round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+                'rows_in': rows_in,
+                'rows_out': sum(len(df) for df in output_dfs),
+                'unique_ids_out': sum(unique_ids) if None not in unique_ids else None,
+                'funnel': [{'kind': kind, 'label': label.strip(), 'value': value}
+                           for kind, label, value in run_context.funnel_stats[nb_funnel_stats:] if kind != 'text']
+                          if run_context is not None else [],
+            })
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dimension_lookup import DimensionIndex
+
+
+@pytest.fixture
+def targets_df():
+    return pd.DataFrame({
+        'Department_ST': ['Research', 'Research', 'Design', None],
+        'Stage_advancement': ['phone screen', 'hired', 'hired', 'hired'],
+        'Target Value': [10.0, 2.0, 1.0, 5.0],
+    })
+
+
+@pytest.fixture
+def fact_df():
+    return pd.DataFrame({
+        'Department_ST': pd.Categorical(['Design', 'Research', 'Research', 'Finance', None, 'Research']),
+        'Stage_advancement': ['hired', 'hired', 'phone screen', 'hired', 'hired', None],
+    }, index=[5, 3, 8, 1, 0, 2])
+
+
+def test_lookup_matches_left_merge(targets_df, fact_df):
+    looked_up = DimensionIndex(targets_df, ['Department_ST', 'Stage_advancement']).lookup(fact_df)
+
+    # The entry with a missing key never matches, like a merge on a missing department would not
+    merged = fact_df.astype({'Department_ST': object}).merge(targets_df.dropna(subset=['Department_ST']),
+                                                             on=['Department_ST', 'Stage_advancement'], how='left')
+    np.testing.assert_array_equal(looked_up['Target Value'], merged['Target Value'])
+    assert looked_up.index.equals(fact_df.index)
+
+
+def test_add_columns_in_place(targets_df, fact_df):
+    index = DimensionIndex(targets_df, ['Department_ST', 'Stage_advancement'], name='targets')
+    result = index.add_columns(fact_df)
+
+    assert result is fact_df
+    np.testing.assert_array_equal(fact_df['Target Value'], [1.0, 2.0, 10.0, np.nan, np.nan, np.nan])
+    with pytest.raises(ValueError):
+        index.add_columns(fact_df)
+
+
+def test_categorical_columns_stay_categorical():
+    activity_dict_df = pd.DataFrame({'Activity': ['Applied', 'Hired'],
+                                     'New_Activity': pd.Categorical(['applied', 'hired'])})
+    report_df = pd.DataFrame({'Activity': pd.Categorical(['Hired', 'Unknown', 'Applied'])})
+
+    looked_up = DimensionIndex(activity_dict_df, 'Activity').lookup(report_df)
+
+    assert isinstance(looked_up['New_Activity'].dtype, pd.CategoricalDtype)
+    assert looked_up['New_Activity'].tolist() == ['hired', np.nan, 'applied']
+
+
+def test_duplicate_keys_are_refused(targets_df):
+    duplicated_df = pd.concat([targets_df, targets_df.iloc[[1]]], ignore_index=True)
+
+    with pytest.raises(ValueError, match="several entries"):
+        DimensionIndex(duplicated_df, ['Department_ST', 'Stage_advancement'], name='targets')
+
+
+def test_duplicate_keys_keep_the_first_entry(targets_df, fact_df, capsys):
+    duplicated_df = pd.concat([targets_df, targets_df.iloc[[1]].assign(**{'Target Value': 4.0})], ignore_index=True)
+
+    index = DimensionIndex(duplicated_df, ['Department_ST', 'Stage_advancement'], name='targets', duplicates='first')
+
+    assert "Warning: the targets has several entries" in capsys.readouterr().out
+    np.testing.assert_array_equal(index.lookup(fact_df)['Target Value'], [1.0, 2.0, 10.0, np.nan, np.nan, np.nan])
+
+
+def test_missing_key_column_is_refused(targets_df, fact_df):
+    with pytest.raises(ValueError):
+        DimensionIndex(targets_df, ['Department_ST', 'Target Name'])
+    with pytest.raises(ValueError):
+        DimensionIndex(targets_df, ['Department_ST', 'Stage_advancement']).lookup(fact_df[['Department_ST']])
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from dtype_policy import map_categories, concat_aligned
+
+
+def lower_strip(values: pd.Series) -> pd.Series:
+    return values.str.lower().str.strip()
+
+
+def test_map_categories_matches_the_plain_values():
+    steps = pd.Series(['Applied ', 'hired', None, 'Applied', 'HIRED', 'Phone screen'], index=[4, 2, 0, 1, 3, 5])
+
+    mapped = map_categories(steps.astype('category'), lower_strip)
+
+    pd.testing.assert_series_equal(mapped.astype(object), lower_strip(steps))
+    # The categories that became equal are merged and sorted
+    assert mapped.cat.categories.tolist() == ['applied', 'hired', 'phone screen']
+
+
+def test_map_categories_of_plain_values_applies_the_function():
+    steps = pd.Series(['Applied ', None])
+
+    pd.testing.assert_series_equal(map_categories(steps, lower_strip), lower_strip(steps))
+
+
+def test_map_categories_without_category_result():
+    dates = pd.Series(['2022-01-03', None, '2022-01-03'], dtype='category')
+
+    mapped = map_categories(dates, pd.to_datetime, as_category=False)
+
+    np.testing.assert_array_equal(mapped, pd.to_datetime(dates.astype(object)))
+
+
+def test_concat_aligned_keeps_categories():
+    first_df = pd.DataFrame({'step': pd.Categorical(['hired', 'applied'])})
+    second_df = pd.DataFrame({'step': pd.Categorical(['phone screen'])})
+
+    concatenated_df = concat_aligned([first_df, second_df], ignore_index=True)
+
+    assert isinstance(concatenated_df['step'].dtype, pd.CategoricalDtype)
+    assert concatenated_df['step'].tolist() == ['hired', 'applied', 'phone screen']
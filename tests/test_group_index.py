@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from group_index import GroupIndex
+
+
+@pytest.fixture
+def frame():
+    """
+    Rows of four groups, neither sorted by group nor by time, with missing values and a categorical column.
+    """
+    rng = np.random.default_rng(0)
+    nb_rows = 200
+    values = rng.normal(size=nb_rows) * 1e6
+    values[rng.random(nb_rows) < 0.1] = np.nan
+    return pd.DataFrame({
+        'key': rng.choice(['c', 'a', 'b', 'd'], size=nb_rows),
+        'time': rng.permutation(nb_rows),
+        'value': values,
+        'count': rng.integers(0, 5, size=nb_rows),
+        'step': pd.Categorical(rng.choice(['applied', 'hired', None], size=nb_rows)),
+    }, index=np.arange(nb_rows) * 3)
+
+
+def test_reductions_match_groupby(frame):
+    groups = GroupIndex(frame['key'])
+    grouped = frame.groupby('key')
+
+    np.testing.assert_array_equal(groups.max(frame['value']), grouped['value'].max())
+    np.testing.assert_array_equal(groups.min(frame['value']), grouped['value'].min())
+    np.testing.assert_array_equal(groups.sum(frame['count']), grouped['count'].sum())
+    np.testing.assert_array_equal(groups.count(), grouped.size())
+    np.testing.assert_array_equal(groups.count(frame['value']), grouped['value'].count())
+    np.testing.assert_array_equal(groups.nunique(frame['step']), grouped['step'].nunique())
+
+
+def test_float_sums_are_compensated_like_groupby(frame):
+    # Exactly equal, not only close : groupby sums in the same order with the same Kahan summation
+    np.testing.assert_array_equal(GroupIndex(frame['key']).sum(frame['value']), frame.groupby('key')['value'].sum())
+
+    groups = GroupIndex(frame['key'], sort_by=frame['time'])
+    by_time = frame.sort_values('time', kind='stable')
+    np.testing.assert_array_equal(groups.cumsum(frame['value']),
+                                  by_time.groupby('key')['value'].cumsum().reindex(frame.index))
+
+
+def test_compensated_sum_keeps_small_values():
+    values = pd.Series([1e16, 1.0, 1.0, 1.0, 1.0, -1e16])
+    groups = GroupIndex(pd.Series(['a'] * len(values)))
+
+    assert groups.sum(values)[0] == pd.Series(values).groupby([0] * len(values)).sum()[0] == 4.0
+
+
+def test_row_results_match_groupby(frame):
+    groups = GroupIndex(frame['key'], sort_by=frame['time'])
+    by_time = frame.sort_values('time', kind='stable').groupby('key')
+
+    np.testing.assert_array_equal(groups.cumcount(), by_time.cumcount().reindex(frame.index))
+    np.testing.assert_array_equal(groups.shift(frame['value']), by_time['value'].shift().reindex(frame.index))
+    np.testing.assert_array_equal(groups.shift(frame['value'], 2), by_time['value'].shift(2).reindex(frame.index))
+    np.testing.assert_array_equal(groups.diff(frame['value']), by_time['value'].diff().reindex(frame.index))
+    np.testing.assert_array_equal(groups.transform(frame['value'], 'max'),
+                                  frame.groupby('key')['value'].transform('max'))
+
+
+def test_shift_keeps_categories(frame):
+    groups = GroupIndex(frame['key'], sort_by=frame['time'])
+    shifted = groups.shift(frame['step'])
+    expected = frame.sort_values('time', kind='stable').groupby('key')['step'].shift().reindex(frame.index)
+
+    assert isinstance(shifted.dtype, pd.CategoricalDtype)
+    pd.testing.assert_series_equal(pd.Series(shifted, index=frame.index, name='step'), expected)
+
+
+def test_first_last_and_first_where(frame):
+    groups = GroupIndex(frame['key'], sort_by=frame['time'])
+    by_time = frame.sort_values('time', kind='stable')
+
+    np.testing.assert_array_equal(groups.first(frame['time']), by_time.groupby('key')['time'].nth(0))
+    np.testing.assert_array_equal(groups.last(frame['time']), by_time.groupby('key')['time'].nth(-1))
+
+    hired = frame['step'] == 'hired'
+    expected = by_time.loc[hired].groupby('key')['time'].first().reindex(['a', 'b', 'c', 'd'])
+    np.testing.assert_array_equal(groups.first_where(frame['time'], hired), expected)
+
+
+def test_first_where_is_missing_without_matching_row():
+    groups = GroupIndex(pd.Series(['a', 'a', 'b']))
+    found = groups.first_where(pd.Series([1.0, 2.0, 3.0]), pd.Series([False, True, False]))
+
+    np.testing.assert_array_equal(found, [2.0, np.nan])
+
+
+def test_sort_and_filter_match_sort_values(frame):
+    groups = GroupIndex([frame['key'], frame['count']], sort_by=frame['time'])
+    sorted_df, sorted_groups = groups.sort(frame)
+
+    pd.testing.assert_frame_equal(sorted_df, frame.sort_values(['key', 'count', 'time'], kind='stable'))
+    np.testing.assert_array_equal(sorted_groups.cumcount(), sorted_df.groupby(['key', 'count']).cumcount())
+
+    kept = frame['value'].notna()
+    filtered = groups.filter(kept)
+    np.testing.assert_array_equal(filtered.sum(frame.loc[kept, 'count']),
+                                  frame.loc[kept].groupby(['key', 'count'])['count'].sum())
+
+
+def test_missing_key_is_refused():
+    with pytest.raises(ValueError):
+        GroupIndex(pd.Series(['a', None], name='unique_ID'))
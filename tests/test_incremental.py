@@ -0,0 +1,65 @@
+import pandas as pd
+
+from constants import ACTIVITY_REPORT_COLS
+from incremental import IncrementalState, candidate_fingerprints, changed_candidates, splice_candidates
+
+
+def activity_report(rows: list) -> pd.DataFrame:
+    return pd.DataFrame([dict(zip(ACTIVITY_REPORT_COLS, row)) for row in rows], columns=ACTIVITY_REPORT_COLS)
+
+
+def report_row(candidate: str, activity: str) -> list:
+    return [candidate if col == 'Candidate' else activity if col == 'Activity' else f"{col} value"
+            for col in ACTIVITY_REPORT_COLS]
+
+
+def test_fingerprints_do_not_depend_on_the_row_order():
+    rows = [report_row('Amal', 'Applied'), report_row('Omar', 'Applied'), report_row('Amal', 'Hired')]
+
+    pd.testing.assert_frame_equal(candidate_fingerprints(activity_report(rows)),
+                                  candidate_fingerprints(activity_report(rows[::-1])))
+
+
+def test_changed_candidates_are_new_changed_or_removed():
+    previous_df = activity_report([report_row('Amal', 'Applied'), report_row('Omar', 'Applied'),
+                                   report_row('Sara', 'Applied')])
+    current_df = activity_report([report_row('Amal', 'Applied'), report_row('Omar', 'Hired'),
+                                  report_row('Nour', 'Applied')])
+
+    changed = changed_candidates(candidate_fingerprints(previous_df), candidate_fingerprints(current_df))
+
+    assert sorted(changed) == ['Nour', 'Omar', 'Sara']
+
+
+def test_splice_restores_the_full_run_order():
+    previous_df = pd.DataFrame({'Candidate': ['Amal', 'Omar', 'Omar', 'Sara'],
+                                'unique_ID': ['Amal_Job_1', 'Omar_Job_1', 'Omar_Job_1', 'Sara_Job_1'],
+                                'new_creation_time': [1, 2, 3, 1]})
+    delta_df = pd.DataFrame({'Candidate': ['Omar', 'Nour'], 'unique_ID': ['Omar_Job_10', 'Nour_Job_1'],
+                             'new_creation_time': [5, 4]})
+
+    spliced_df = splice_candidates(previous_df, delta_df, pd.Index(['Omar', 'Nour']))
+
+    assert spliced_df['unique_ID'].tolist() == ['Amal_Job_1', 'Nour_Job_1', 'Omar_Job_10', 'Sara_Job_1']
+
+
+def test_splice_without_delta_drops_the_changed_candidates():
+    previous_df = pd.DataFrame({'Candidate': ['Amal', 'Omar'], 'new_creation_time': [1, 2]})
+
+    spliced_df = splice_candidates(previous_df, None, pd.Index(['Omar']))
+
+    assert spliced_df['Candidate'].tolist() == ['Amal']
+
+
+def test_state_round_trip(tmp_path):
+    state = IncrementalState(str(tmp_path / 'state'))
+    golden_source_df = pd.DataFrame({'Candidate': ['Amal'], 'new_creation_time': [1]})
+    ids_ko_df = pd.DataFrame({'Candidate': ['Omar'], 'ID': ['Omar_Job']})
+    fingerprints_df = candidate_fingerprints(activity_report([report_row('Amal', 'Applied')]))
+
+    assert not state.exists()
+    state.save(golden_source_df, ids_ko_df, fingerprints_df)
+
+    assert state.exists()
+    for loaded_df, saved_df in zip(state.load(), (golden_source_df, ids_ko_df, fingerprints_df)):
+        pd.testing.assert_frame_equal(loaded_df, saved_df)
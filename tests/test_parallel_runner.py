@@ -0,0 +1,17 @@
+import pandas as pd
+
+from parallel_runner import number_sub_dataframe_rows
+
+
+def test_rows_of_the_shards_are_numbered_like_the_serial_sub_dataframes():
+    # Two shards, each with rows of the two sub dataframes, 'index' being the row number of preliminary_processing
+    row_labels_df = pd.concat([
+        pd.DataFrame({'sub_dataframe': [0, 0, 1], 'index': [0, 1, 5], 'label': ['Omar_Analyst', 'Omar_Analyst', 'Omar']}),
+        pd.DataFrame({'sub_dataframe': [0, 1, 1], 'index': [2, 3, 4], 'label': ['Amal B_Analyst', 'Amal', 'Amal']}),
+    ], ignore_index=True)
+    ids_ko_df = pd.DataFrame({'index': [5, 2, 0, 4], 'level_0': [0, 0, 0, 1]})
+
+    numbered_df = number_sub_dataframe_rows(ids_ko_df, row_labels_df)
+
+    # Sub dataframe 0 sorted by label : 2, 0, 1 ; sub dataframe 1 : 3, 4, 5
+    assert numbered_df['level_0'].tolist() == [2, 0, 1, 1]
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from constants import ACTIONS_NOT_IN_RIGHT_ORDER, OK_MESSAGE
+from group_index import GroupIndex
+from ranking_processor import RankingProcessor, check_steps_order, ranking_dict_entries, ranking_proc_phase
+
+
+@pytest.fixture
+def ranking_dict():
+    return pd.DataFrame({
+        'Department_ST': ['Research'] * 4,
+        'Process_Step': ['Applied', 'Automated test', 'HR Interview', 'Offer'],
+        'updated': [0] * 4,
+        'last_update': pd.to_datetime(['2022-05-01'] * 4),
+        'rank': [0, 1, 2, 3],
+    })
+
+
+def test_check_steps_order_matches_the_per_application_checks():
+    rng = np.random.default_rng(0)
+    nb_rows = 300
+    ranks = rng.integers(0, 6, size=nb_rows).astype(float)
+    ranks[rng.random(nb_rows) < 0.05] = np.nan
+    golden_source_df = pd.DataFrame({'unique_ID': np.sort(rng.integers(0, 40, size=nb_rows)), 'rank': ranks})
+
+    steps_order_df = check_steps_order(golden_source_df, GroupIndex(golden_source_df['unique_ID']))
+
+    # The checks of the ranks of each application, one group at a time
+    grouped_ranks = golden_source_df.groupby('unique_ID')['rank']
+    is_sorted = grouped_ranks.transform(lambda s: s.is_monotonic_increasing).astype(bool)
+    np.testing.assert_array_equal(steps_order_df['red_flag'], (~is_sorted).astype(int))
+    np.testing.assert_array_equal(steps_order_df['Comments'], np.where(is_sorted, OK_MESSAGE, ACTIONS_NOT_IN_RIGHT_ORDER))
+
+    def first_unordered_step(s):
+        for position in range(len(s)):
+            if np.isnan(s.iloc[position]) or (position > 0 and s.iloc[position] < s.iloc[position - 1]):
+                return position + 1
+        return np.nan
+
+    np.testing.assert_array_equal(steps_order_df['first_unordered_step'], grouped_ranks.transform(first_unordered_step))
+
+
+def test_first_process_not_applied_comment_is_kept(ranking_dict):
+    unified_df = pd.DataFrame({
+        'unique_ID': [1, 1, 1, 2, 2, 3, 3],
+        'Process_Step': ['Applied', 'HR Interview', 'Automated test', 'HR Interview', 'Offer', 'Applied ', 'Offer'],
+        'Department_ST': ['Research'] * 7,
+        'new_creation_time': pd.to_datetime(['2022-01-0{}'.format(day) for day in range(1, 8)]),
+    })
+
+    ranked_df = ranking_proc_phase(unified_df, ranking_dict)
+
+    assert ranked_df['Comments'].tolist() == ([ACTIONS_NOT_IN_RIGHT_ORDER] * 3 + ['First Process not Applied'] * 2 +
+                                              [OK_MESSAGE] * 2)
+    assert ranked_df['red_flag'].tolist() == [1, 1, 1, 0, 0, 0, 0]
+    np.testing.assert_array_equal(ranked_df['first_unordered_step'], [3, 3, 3, np.nan, np.nan, np.nan, np.nan])
+
+
+def test_duplicate_step_of_the_ranking_dictionary_keeps_the_first_entry(capsys):
+    # The dictionary sheet lists the version 0 'Technical test ' step of Business Translation twice
+    ranking_dict = pd.DataFrame({
+        'Department_ST': ['Business Translation'] * 3,
+        'Process_Step': ['HR Interview', 'Technical test ', 'Technical test '],
+        'updated': [0, 0, 0],
+        'last_update': pd.to_datetime([None] * 3),
+        'rank': [2, 3, 4],
+    })
+
+    entries_df = ranking_dict_entries(ranking_dict)
+
+    assert "Warning: the ranking dictionary has several entries" in capsys.readouterr().out
+    assert entries_df['Process_Step'].tolist() == ['hr interview', 'technical test']
+    assert entries_df['rank'].tolist() == [2, 3]
+    # The sheet itself is left unchanged
+    assert len(ranking_dict) == 3
+
+
+@pytest.fixture
+def ranking_processor():
+    return RankingProcessor(pd.DataFrame({'c_activity': ['applied', 'screen', 'test', 'offer', 'screen'],
+                                          'Rank': [1, 2, 3, 4, 5]}))
+
+
+def test_batch_api_matches_the_per_sequence_methods(ranking_processor):
+    sequences = [['applied', 'screen', 'offer'], ['applied', 'test', 'screen'], ['offer'], ['test', 'test', 'applied']]
+    values = [activity for sequence in sequences for activity in sequence]
+    offsets = ranking_processor.group_offsets(np.repeat(np.arange(len(sequences)), [len(s) for s in sequences]))
+
+    ranks = ranking_processor.batch_to_ranks(values)
+
+    assert offsets.tolist() == [0, 3, 6, 7, 10]
+    np.testing.assert_array_equal(ranks, [rank for sequence in ranking_processor.lists_to_ranks(*sequences)
+                                          for rank in sequence])
+    np.testing.assert_array_equal(ranking_processor.batch_is_ordered(ranks, offsets),
+                                  [ranking_processor.is_ordered([sequence])
+                                   for sequence in ranking_processor.lists_to_ranks(*sequences)])
+
+
+def test_batch_is_ordered_with_a_missing_rank(ranking_processor):
+    ranks = ranking_processor.batch_to_ranks(['applied', 'unknown', 'offer', 'applied', 'offer'])
+
+    np.testing.assert_array_equal(ranks, [1, np.nan, 4, 1, 4])
+    np.testing.assert_array_equal(ranking_processor.batch_is_ordered(ranks, [0, 3, 5]), [0, 1])
+
+
+def test_batch_split_on_value_matches_split_on_value(ranking_processor):
+    sequences = [[1, 3, 0, 1, 2, 1, 4], [2, 3], [1, 1, 0, 2], [1]]
+    offsets = np.cumsum([0] + [len(sequence) for sequence in sequences])
+
+    segment_values, segment_offsets, segment_sequence = ranking_processor.batch_split_on_value(
+        np.concatenate(sequences), offsets, 1)
+
+    segments = [segment_values[start:end].tolist() for start, end in zip(segment_offsets[:-1], segment_offsets[1:])]
+    expected = [(position, segment) for position, sequence in enumerate(sequences)
+                for segment in ranking_processor.split_on_value(sequence, 1)]
+    assert segments == [segment for _, segment in expected]
+    assert segment_sequence.tolist() == [position for position, _ in expected]
@@ -0,0 +1,125 @@
+import pandas as pd
+import pytest
+
+from run_context import RunContext
+from stage_graph import Stage, StageGraph, StageError
+
+
+def build_graph(checkpoint_dir, calls: list, keys: dict = None, outputs: list = None) -> StageGraph:
+    """
+    A small pipeline : source -> total_rows -> run_context, source + run_context -> doubled -> total -> output.
+    Each stage records its name in calls when it runs.
+    """
+    keys = keys if keys is not None else {}
+    outputs = outputs if outputs is not None else []
+
+    def recorded(name, function):
+        def run(*args):
+            calls.append(name)
+            return function(*args)
+        return run
+
+    def double(source_df, run_context):
+        run_context.report_count("Doubled rows:", len(source_df))
+        return source_df * 2
+
+    stages = [
+        Stage('source', recorded('source', lambda: pd.DataFrame({'value': [1.5, 2.0, 3.0]})),
+              key=lambda: keys.get('source', 'v1')),
+        Stage('total_rows', recorded('total_rows', len), inputs=['source']),
+        Stage('run_context', recorded('run_context', RunContext), inputs=['total_rows'], persist=False),
+        Stage('doubled', recorded('doubled', double), inputs=['source', 'run_context'],
+              key=lambda: keys.get('doubled', 'v1')),
+        Stage('total', recorded('total', lambda doubled_df: float(doubled_df['value'].sum())), inputs=['doubled']),
+        Stage('output', recorded('output', outputs.append), inputs=['total'], outputs=[], persist=False),
+    ]
+    return StageGraph(stages, checkpoint_dir=str(checkpoint_dir), checkpoint_mode='columnar',
+                      run_context_result='run_context')
+
+
+def test_stages_run_after_their_inputs(tmp_path):
+    calls, outputs = [], []
+    build_graph(tmp_path, calls, outputs=outputs).run()
+
+    assert calls == ['source', 'total_rows', 'run_context', 'doubled', 'total', 'output']
+    assert outputs == [13.0]
+
+
+def test_unchanged_stages_are_skipped_and_their_results_loaded(tmp_path, capsys):
+    build_graph(tmp_path, []).run()
+    calls, outputs = [], []
+    build_graph(tmp_path, calls, outputs=outputs).run()
+
+    # Only the stages not saved run again, the total is loaded from the previous run
+    assert calls == ['run_context', 'output']
+    assert outputs == [13.0]
+    assert "Stage doubled skipped" in capsys.readouterr().out
+
+
+def test_saved_dataframe_is_loaded_unchanged(tmp_path):
+    build_graph(tmp_path, []).run()
+    results = build_graph(tmp_path, []).run(until_stage='doubled')
+
+    pd.testing.assert_frame_equal(results['doubled'], pd.DataFrame({'value': [3.0, 4.0, 6.0]}))
+
+
+def test_changed_key_runs_the_stage_and_the_stages_after_it(tmp_path):
+    build_graph(tmp_path, []).run()
+    calls = []
+    build_graph(tmp_path, calls, keys={'doubled': 'v2'}).run()
+
+    # The source is loaded from the previous run, the stages after doubled run again and save their new results
+    assert calls == ['run_context', 'doubled', 'total', 'output']
+    calls = []
+    build_graph(tmp_path, calls, keys={'doubled': 'v2'}).run()
+    assert calls == ['run_context', 'output']
+
+
+def test_from_stage_runs_it_and_the_stages_after_it(tmp_path):
+    build_graph(tmp_path, []).run()
+    calls = []
+    build_graph(tmp_path, calls).run(from_stage='total')
+
+    assert calls == ['run_context', 'total', 'output']
+
+
+def test_until_stage_only_runs_the_stages_it_depends_on(tmp_path):
+    calls = []
+    results = build_graph(tmp_path, calls).run(until_stage='total_rows')
+
+    assert calls == ['source', 'total_rows']
+    assert results['total_rows'] == 3
+
+
+def test_from_stage_after_until_stage_is_refused(tmp_path):
+    with pytest.raises(ValueError):
+        build_graph(tmp_path, []).plan(from_stage='total', until_stage='doubled')
+
+
+def test_funnel_of_skipped_stages_is_reported_again(tmp_path):
+    first_run = build_graph(tmp_path, []).run()
+    second_run = build_graph(tmp_path, []).run()
+
+    assert first_run['run_context'].funnel_stats == [('count', "Doubled rows:", 3)]
+    assert second_run['run_context'].funnel_stats == [('count', "Doubled rows:", 3)]
+
+
+def test_checkpoints_off_runs_every_stage(tmp_path):
+    build_graph(tmp_path, []).run()
+    calls = []
+    graph = build_graph(tmp_path, calls)
+    graph.checkpoint_mode = 'off'
+    graph.run()
+
+    assert calls == ['source', 'total_rows', 'run_context', 'doubled', 'total', 'output']
+
+
+def test_failed_stage_raises_its_error_message(tmp_path):
+    def fail():
+        raise KeyError('value')
+
+    graph = StageGraph([Stage('source', fail, error_messages={KeyError: "Error: source failed with message: {}"})],
+                       checkpoint_dir=str(tmp_path), checkpoint_mode='columnar')
+
+    with pytest.raises(StageError, match="Error: source failed with message: 'value'"):
+        graph.run()
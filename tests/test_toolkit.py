@@ -0,0 +1,223 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from constants import ACTIVITY_REWRITE_RULES
+from group_index import GroupIndex
+from Toolkit import application_segmentation, apply_activity_rewrite_rules, composite_key_labels, encode_composite_key, \
+    keep_last_of_runs, shared_cleaning, shared_processing, terminal_state_features, time_since_anchor_step
+
+
+@pytest.fixture
+def activity_df():
+    """
+    Activities of three candidates sorted by candidate and time, with activities done at the same time
+    for the same job and for two different jobs of the same candidate.
+    """
+    return pd.DataFrame({
+        'Candidate': ['Amal'] * 5 + ['Omar'] * 4 + ['Sara'] * 3,
+        'Job': ['Analyst', 'Analyst', 'Analyst', 'Designer', 'Designer',
+                'Analyst', 'Analyst', 'Analyst', 'Analyst', 'Analyst', 'Designer', 'Designer'],
+        'New_Activity': ['applied', 'disqualified', 'reverted', 'applied', 'hired',
+                         'sourced', 'auto-disqualified', 'uploaded to job', 'disqualified',
+                         'applied', 'applied', 'disqualified'],
+        'Creation time': pd.to_datetime(['2022-01-01', '2022-01-02', '2022-01-02', '2022-01-02', '2022-01-05',
+                                         '2022-02-01', '2022-02-01', '2022-02-03', '2022-02-04',
+                                         '2022-03-01', '2022-03-01', '2022-03-02']),
+    }, index=np.arange(12) * 2 + 1).assign(ID=lambda df: df['Candidate'] + '_' + df['Job'])
+
+
+@pytest.fixture
+def steps_df():
+    """
+    Process steps of four applications sorted by application and time : an anchor step repeated, an anchor step
+    after some steps, no anchor step, and an application whose anchor step is not eligible.
+    """
+    return pd.DataFrame({
+        'unique_ID': [1, 1, 1, 1, 2, 2, 2, 3, 3, 4, 4],
+        'Process_Step': ['Applied', 'Automated test', 'Automated test', 'Offer', 'HR Interview', 'Applied',
+                         'Automated test', 'Applied', 'Offer', 'Applied', 'Automated test'],
+        'cummulative_time_diff_in_days': [0.0, 1.5, 2.0, 7.25, 0.0, 3.0, 4.5, 0.0, 2.0, 0.0, 1.0],
+        'id_is_vanilla': [1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0],
+    })
+
+
+@pytest.mark.parametrize('key', ['ID', 'Candidate'])
+def test_same_time_activities_match_the_per_key_check(activity_df, key):
+    cleaned_df = shared_cleaning(activity_df, key)
+
+    # The check of each key, one group at a time
+    expected = activity_df.groupby(key, group_keys=False).apply(
+        lambda x: x.duplicated(subset=['Creation time'], keep=False))
+    pd.testing.assert_series_equal(cleaned_df.set_index('level_1')['Activity_done_same_time_ID'],
+                                   expected.reindex(activity_df.index), check_names=False, check_index_type=False)
+
+
+def test_time_since_anchor_step_matches_the_row_by_row_subtraction(steps_df):
+    cum_time_diff = time_since_anchor_step(steps_df, 'Automated test', GroupIndex(steps_df['unique_ID']),
+                                           eligible=steps_df['id_is_vanilla'] == 1)
+
+    # The subtraction of the first eligible anchor step of the application, one row at a time
+    def subtract_auto_test(row):
+        auto_test_rows = steps_df[(steps_df['unique_ID'] == row['unique_ID']) &
+                                  (steps_df['Process_Step'] == 'Automated test') & (steps_df['id_is_vanilla'] == 1)]
+        if len(auto_test_rows) > 0:
+            return max(row['cummulative_time_diff_in_days'] - auto_test_rows['cummulative_time_diff_in_days'].iloc[0], 0)
+        return 0
+
+    np.testing.assert_array_equal(cum_time_diff, steps_df.apply(subtract_auto_test, axis=1))
+    assert cum_time_diff.index.equals(steps_df.index)
+
+
+def test_rewrite_rules_match_the_row_by_row_rewrite_within_a_candidate():
+    activities_df = pd.DataFrame({
+        'Candidate': ['Amal'] * 4 + ['Omar'] * 3 + ['Sara'] * 2,
+        'New_Activity': ['applied', 'disqualified', 'reverted', 'hired', 'auto-disqualified', 'reverted', 'reverted',
+                         'applied', 'disqualified'],
+    })
+
+    rewritten = apply_activity_rewrite_rules(activities_df, ACTIVITY_REWRITE_RULES)
+
+    # The rewrite of the previous row of each 'reverted', one row at a time
+    expected_df = activities_df.copy()
+    for idx in range(1, len(expected_df)):
+        if activities_df.at[idx, 'New_Activity'] == 'reverted' and \
+                expected_df.at[idx - 1, 'New_Activity'] in ['disqualified', 'auto-disqualified']:
+            expected_df.at[idx - 1, 'New_Activity'] = 'out of process and back'
+
+    pd.testing.assert_series_equal(rewritten, expected_df['New_Activity'])
+
+
+def test_rewrite_rules_do_not_cross_a_candidate_boundary():
+    # The last activity of Amal is followed by the first activity of Omar
+    activities_df = pd.DataFrame({'Candidate': ['Amal', 'Amal', 'Omar', 'Omar'],
+                                  'New_Activity': ['applied', 'disqualified', 'reverted', 'applied']})
+
+    rewritten = apply_activity_rewrite_rules(activities_df, ACTIVITY_REWRITE_RULES)
+
+    assert rewritten.tolist() == ['applied', 'disqualified', 'reverted', 'applied']
+
+
+@pytest.mark.parametrize('as_category', [False, True])
+def test_composite_key_codes_and_labels_match_the_joined_labels(as_category):
+    applications_df = pd.DataFrame({
+        'Candidate': ['Omar', 'Amal', 'Omar', 'Amal', 'Sara', 'Amal', None],
+        'new_Job': ['Analyst', 'Designer', 'Analyst', 'Analyst', np.nan, 'Designer', 'Analyst'],
+        'Nb_of_appl_disq': [1.0, 1.0, 2.0, 1.0, 1.0, 1.0, 1.0],
+    }, index=[7, 3, 5, 0, 9, 1, 4])
+    if as_category:
+        applications_df = applications_df.astype({'Candidate': 'category', 'new_Job': 'category'})
+    cols = ['Candidate', 'new_Job', 'Nb_of_appl_disq']
+
+    applications_df['unique_ID'] = encode_composite_key(applications_df, cols)
+    labels = composite_key_labels(applications_df, 'unique_ID', cols)
+
+    # The labels built row by row, the codes are sorted like the key tuples and missing values are kept as a key
+    expected_labels = applications_df[cols].astype(object).apply(lambda x: '_'.join(x.astype(str)), axis=1)
+    pd.testing.assert_series_equal(labels, expected_labels, check_names=False)
+    assert applications_df['unique_ID'].tolist() == [2, 1, 3, 0, 4, 1, 5]
+    assert applications_df['unique_ID'].dtype == np.int64
+
+
+@pytest.mark.parametrize('key', ['ID', 'Candidate'])
+def test_shared_cleaning_numbers_the_rows_by_key_label(activity_df, key):
+    # 'Amal B' sorts after 'Amal' as a candidate, but 'Amal B_Analyst' sorts before 'Amal_Analyst' as a label
+    activity_df = activity_df.assign(Candidate=activity_df['Candidate'].replace('Sara', 'Amal B'))
+    activity_df['ID'] = encode_composite_key(activity_df, ['Candidate', 'Job'])
+    labels = activity_df['Candidate'] + '_' + activity_df['Job'] if key == 'ID' else activity_df['Candidate']
+
+    cleaned_df = shared_cleaning(activity_df, key)
+
+    # The index of the rows once sorted by label, like the merge of the per key results gave
+    expected_df = activity_df.assign(label=labels).sort_values('label', kind='stable').reset_index()
+    assert cleaned_df.sort_index()['level_1'].tolist() == expected_df['index'].tolist()
+
+
+def test_keep_last_of_runs_matches_the_per_run_max_time():
+    # The last 'applied' run of application 1 is followed by an 'applied' run of application 2 : two runs, not one
+    activities_df = pd.DataFrame({
+        'unique_ID': [2, 1, 1, 2, 1, 2, 1, 3],
+        'New_Activity': ['applied', 'applied', 'applied', 'applied', 'hired', 'hired', 'applied', 'hired'],
+        'new_creation_time': pd.to_datetime(['2022-01-04', '2022-01-01', '2022-01-02', '2022-01-03', '2022-01-05',
+                                             '2022-01-06', '2022-01-07', '2022-01-01']),
+    }, index=[10, 11, 12, 13, 14, 15, 16, 17])
+
+    compacted_df, total_rows_dropped, groups = keep_last_of_runs(activities_df, 'unique_ID', 'New_Activity')
+
+    # The latest row of each run of the same activity, one run at a time
+    sorted_df = activities_df.sort_values(by=['unique_ID', 'new_creation_time'])
+    runs = (sorted_df['New_Activity'] != sorted_df['New_Activity'].shift()).cumsum()
+    is_run_last = sorted_df.groupby(['unique_ID', runs])['new_creation_time'].transform(lambda x: x == x.max())
+    pd.testing.assert_frame_equal(compacted_df, sorted_df.loc[is_run_last])
+    assert total_rows_dropped == 2
+    np.testing.assert_array_equal(groups.count(), [3, 2, 1])
+
+
+@pytest.mark.parametrize('key', ['ID', 'Candidate'])
+def test_application_segmentation_matches_the_per_key_counts(activity_df, key):
+    segments_df = application_segmentation(activity_df, key)
+
+    # The flags row by row and the counts of each key, one group at a time
+    disqualified = activity_df['New_Activity'].apply(lambda x: 1 if x in ['disqualified', 'auto-disqualified'] else 0)
+    entrance = activity_df['New_Activity'].apply(lambda x: 1 if x in ['applied', 'sourced', 'uploaded to job'] else 0)
+    disqualified_before = disqualified.groupby(activity_df[key]).cumsum().groupby(activity_df[key]).shift(1).fillna(0)
+
+    np.testing.assert_array_equal(segments_df['Disqualified'], disqualified)
+    np.testing.assert_array_equal(segments_df['entrance'], entrance)
+    np.testing.assert_array_equal(segments_df['Nb_of_appl_entrance'], entrance.groupby(activity_df[key]).cumsum())
+    np.testing.assert_array_equal(segments_df['Nb_of_appl_disq'], 1 + disqualified_before)
+    assert segments_df.index.equals(activity_df.index)
+
+
+def test_shared_processing_matches_the_per_key_statistics():
+    applications_df = pd.DataFrame({
+        'unique_ID': [4, 1, 1, 2, 2, 3, 3, 3, 4, 5],
+        'nb_of_app_difference': [0.0, 0.0, 0.0, 1.0, 1.0, 1.0, 1.0, 1.0, -3.0, -1.0],
+        'Nb_of_appl_disq': [3.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 2.0, 2.0, 2.0],
+        'New_Activity': ['applied', 'applied', 'hired', 'applied', 'applied', 'sourced', None, 'disqualified',
+                         'applied', 'applied'],
+        'new_creation_time': pd.to_datetime(['2022-01-02', '2022-01-01', '2022-01-03', '2022-01-01', '2022-01-01',
+                                             '2022-01-01', '2022-01-02', '2022-01-02', '2022-01-01', '2022-01-01']),
+    }, index=[9, 8, 7, 6, 5, 4, 3, 2, 1, 0])
+
+    processed_df = shared_processing(applications_df.copy(), 'unique_ID')
+
+    # The statistics of each key, one group at a time
+    def check_disqualification(x):
+        if sum(x['nb_of_app_difference']) != 0:
+            return 'OK' if sum(x['Nb_of_appl_disq']) % sum(x['nb_of_app_difference']) == 0 else 'KO'
+        return 'OK'
+
+    grouped = applications_df.groupby('unique_ID')
+    expected_ok = applications_df['unique_ID'].map(grouped.apply(check_disqualification))
+    assert processed_df['ID_disqualified_OK'].tolist() == expected_ok.tolist() == \
+           ['KO', 'OK', 'OK', 'OK', 'OK', 'KO', 'KO', 'KO', 'KO', 'OK']
+    np.testing.assert_array_equal(processed_df['ID_Nb_Act'], grouped['New_Activity'].transform('count'))
+    np.testing.assert_array_equal(processed_df['ID_Nb_Act_Distinct'], grouped['New_Activity'].transform('nunique'))
+    np.testing.assert_array_equal(processed_df['ID_Nb_Replicate_Act'],
+                                  applications_df.groupby(['unique_ID', 'New_Activity'])['New_Activity'].transform('count'))
+    for col, func in [('ID_last_activity', 'max'), ('ID_first_activity', 'min')]:
+        np.testing.assert_array_equal(processed_df[col],
+                                      grouped['new_creation_time'].transform(func).eq(applications_df['new_creation_time']))
+
+
+def test_terminal_state_features_match_the_per_application_last_step(steps_df):
+    # Application 1 ends hired, 2 is hired then goes on, 3 ends out of process, 4 is still in pipeline
+    steps_df = steps_df.assign(
+        Process_Step=['Applied', 'Hired', 'Hired', 'Hired', 'Hired', 'Applied', 'Offer', 'Applied', 'Out of Process',
+                      'Applied', 'Offer'],
+        new_creation_time=pd.date_range('2022-01-01', periods=len(steps_df)))
+
+    features_df = terminal_state_features(steps_df, GroupIndex(steps_df['unique_ID']))
+
+    # The last step of each application, one group at a time
+    grouped_steps = steps_df.groupby('unique_ID')['Process_Step']
+    np.testing.assert_array_equal(features_df['ID_in_pipeline'],
+                                  grouped_steps.transform(lambda x: int(x.iloc[-1] not in ['Out of Process', 'Hired'])))
+    np.testing.assert_array_equal(features_df['ID_is_hired'], grouped_steps.transform(lambda x: int(x.iloc[-1] == 'Hired')))
+    np.testing.assert_array_equal(features_df['ID_is_out_of_process'],
+                                  grouped_steps.transform(lambda x: int(x.iloc[-1] == 'Out of Process')))
+    hiring_dates_mapping = steps_df.loc[steps_df['Process_Step'] == 'Hired'].groupby('unique_ID')[
+        'new_creation_time'].first().to_dict()
+    np.testing.assert_array_equal(features_df['id_hiring_date'], steps_df['unique_ID'].map(hiring_dates_mapping))
+    assert features_df.index.equals(steps_df.index)